@@ -7,32 +7,49 @@ import polars as pl
 
 from utils.additional_data import actual_wcs_djs, queer_artists, poc_artists
 from utils.common.temp_files import TempFileTracker, with_temp_files
+from utils.embeddings import compute_track_embeddings
+from utils.lyrics_index import compute_lyrics_postings
+from utils.minhash import compute_dj_signatures
 from utils.playlist_classifiers import extract_date_strings_from_name, extract_tags_from_name
+from utils.row_groups import ROW_GROUP_SIZE, RowGroupIndex, get_index_file_name
 from utils.search import (
+    ARTISTS_DATA_FILE,
     COUNTRY_DATA_FILE,
     DATA_DIR,
+    DJ_SIGNATURES_DATA_FILE,
+    OWNERS_DATA_FILE,
     PLAYLIST_DATA_FILE,
     PLAYLIST_ORIGINAL_DATA_FILE,
     PLAYLIST_TAGS_DATA_FILE,
     PLAYLIST_TRACKS_DATA_FILE,
     PLAYLIST_TRACKS_ORIGINAL_DATA_FILE,
     REGION_DATA_FILE,
+    ROW_GROUP_INDEXED_FILES,
     TAG_STATS_DATA_FILE,
     TAGS_DATA_FILE,
     TEMP_DATA_DIR,
     TRACK_ADJACENT_DATA_FILE,
+    TRACK_ARTISTS_DATA_FILE,
     TRACK_CANONICAL_DATA_FILE,
     TRACK_DATA_FILE,
     TRACK_DUPLICATES_DATA_FILE,
+    TRACK_EMBEDDINGS_DATA_FILE,
     TRACK_LYRICS_DATA_FILE,
+    TRACK_LYRICS_POSTINGS_DATA_FILE,
     TRACK_ORIGINAL_DATA_FILE,
     TRACK_PLAYLISTS_DATA_FILE,
+    TRACK_SUMMARIES_DATA_FILE,
+    TRACK_SUMMARY_PLAYLIST_LIMIT,
     TRACK_TAGS_DATA_FILE,
     UNPROCESSED_PLAYLISTS_DATA_FILE,
     UNPROCESSED_TRACK_BPM_DATA_FILE,
     UNPROCESSED_TRACK_LYRICS_DATA_FILE,
+    PlaylistFilter,
+    PlaylistSet,
+    PlaylistTrackSet,
+    TrackSet,
 )
-from utils.tables import Playlist, PlaylistOwner, PlaylistTags, PlaylistTrack, Stats, Tag, Track, TrackAdjacent, TrackLyrics, TrackTag, TrackTags
+from utils.tables import Artist, Playlist, PlaylistOwner, PlaylistTags, PlaylistTrack, Stats, Tag, Track, TrackAdjacent, TrackLyrics, TrackTag, TrackTags
 
 # Temporary files are also stored in processed_data/
 TEMP_DATA_DIR: Final = DATA_DIR
@@ -105,10 +122,13 @@ def write_to_file(data: pl.LazyFrame | pl.DataFrame, file_name: str, format: Lit
 
     print(f'- SCHEMA: {data.collect_schema()}')
 
+    # Files with a RowGroupIndex need row groups of a known size
+    options = {'row_group_size': ROW_GROUP_SIZE} if format == 'parquet' and file_name in ROW_GROUP_INDEXED_FILES else {}
+
     if isinstance(data, pl.DataFrame):
-        getattr(data, 'write_' + format)(file_name)
+        getattr(data, 'write_' + format)(file_name, **options)
     else:
-        getattr(data, 'sink_' + format)(file_name)
+        getattr(data, 'sink_' + format)(file_name, **options)
 
     file_size = os.path.getsize(file_name)
     print(f'- SIZE: {file_size:,} bytes')
@@ -686,6 +706,14 @@ def process_song_lyrics():
     write_to_parquet_file(lyrics, TRACK_LYRICS_DATA_FILE)
 
 
+def process_lyrics_postings():
+    """Split the song lyrics into words for ranked lyrics search, see `utils.lyrics_index`."""
+    postings = compute_lyrics_postings(scan_parquet_file(TRACK_LYRICS_DATA_FILE))
+
+    # Write pre-processed data to parquet file
+    write_to_parquet_file(postings, TRACK_LYRICS_POSTINGS_DATA_FILE)
+
+
 def process_song_pairings():
     social_playlists = scan_parquet_file(PLAYLIST_DATA_FILE)\
         .filter(pl.col(Playlist.is_social_set))\
@@ -711,6 +739,111 @@ def process_song_pairings():
     write_to_parquet_file(songs_df, TRACK_ADJACENT_DATA_FILE)
 
 
+def process_owners():
+    """Pre-compute the statistics of all playlist owners, so unfiltered DJ queries don't have to aggregate them."""
+    playlist_tracks = PlaylistTrackSet(scan_parquet_file(PLAYLIST_TRACKS_DATA_FILE), is_filtered=False)
+    playlists = scan_parquet_file(PLAYLIST_DATA_FILE)
+    tracks = TrackSet(scan_parquet_file(TRACK_DATA_FILE), is_filtered=False)
+
+    owners = playlist_tracks\
+        .aggregate_by_owner(PlaylistSet(playlists, None, playlists, is_filtered=False), tracks, None,
+                            playlist_limit=None)\
+        .included_owners\
+        .sort(PlaylistOwner.id, PlaylistOwner.name)
+
+    # Write pre-processed data to parquet file
+    write_to_parquet_file(owners, OWNERS_DATA_FILE)
+
+
+def process_track_summaries():
+    """Pre-compute the playlist info of all songs, so unfiltered song queries don't have to aggregate all playlist entries."""
+    playlists = scan_parquet_file(PLAYLIST_DATA_FILE)
+    playlist_tracks = PlaylistTrackSet(scan_parquet_file(PLAYLIST_TRACKS_DATA_FILE), is_filtered=False)
+    tracks = TrackSet(scan_parquet_file(TRACK_DATA_FILE).select(Track.id), is_filtered=False)
+
+    # Use the exact same aggregation as a query without any playlist filters
+    track_summaries = PlaylistFilter()\
+        .filter_playlists(PlaylistSet(playlists, None, playlists, is_filtered=False), include_matched_terms=True)\
+        .filter_tracks(playlist_tracks, tracks,
+                       include_playlist_info=True,
+                       include_playlist_track_info=True,
+                       playlist_limit=TRACK_SUMMARY_PLAYLIST_LIMIT)\
+        .included_tracks\
+        .sort(Track.id)
+
+    # Write pre-processed data to parquet file
+    write_to_parquet_file(track_summaries, TRACK_SUMMARIES_DATA_FILE)
+
+
+def process_artists():
+    """Split the artists of the songs into a separate artist table, with per-artist statistics."""
+    tracks = scan_parquet_file(TRACK_DATA_FILE)
+    playlist_tracks = scan_parquet_file(PLAYLIST_TRACKS_DATA_FILE)
+    playlists = scan_parquet_file(PLAYLIST_DATA_FILE)
+
+    ARTIST_KEY: Final = 'artist.key'
+
+    track_artists = tracks\
+        .select(Track.id, pl.col(Track.artists).alias(Artist.name))\
+        .explode(Artist.name)\
+        .with_columns(pl.col(Artist.name).str.strip_chars())\
+        .with_columns(pl.col(Artist.name).str.to_lowercase().alias(ARTIST_KEY))\
+        .filter(pl.col(ARTIST_KEY).ne(''))\
+        .unique([Track.id, ARTIST_KEY])
+
+    artist_ids = track_artists\
+        .group_by(ARTIST_KEY)\
+        .agg(pl.col(Artist.name).mode().sort().first())\
+        .sort(ARTIST_KEY)\
+        .with_row_index(Artist.id)\
+        .with_columns(pl.col(Artist.id).cast(pl.UInt32))
+
+    track_artists = track_artists\
+        .join(artist_ids.select(ARTIST_KEY, Artist.id), how='inner', on=ARTIST_KEY)\
+        .select(Track.id, Artist.id)\
+        .sort(Track.id, Artist.id)
+
+    artist_stats = track_artists\
+        .join(playlist_tracks.select(Track.id, Playlist.id), how='inner', on=Track.id)\
+        .join(playlists.select(Playlist.id, PlaylistOwner.name), how='inner', on=Playlist.id)\
+        .group_by(Artist.id)\
+        .agg(pl.col(Playlist.id).n_unique().alias(Stats.playlist_count),
+             pl.col(PlaylistOwner.name).n_unique().alias(Stats.dj_count))
+
+    artists = artist_ids\
+        .join(track_artists.group_by(Artist.id).agg(pl.len().alias(Stats.song_count)),
+              how='left', on=Artist.id)\
+        .join(artist_stats, how='left', on=Artist.id)\
+        .select(Artist.id,
+                Artist.name,
+                pl.col(Stats.song_count).cast(pl.UInt32),
+                pl.col(Stats.playlist_count).fill_null(0).cast(pl.UInt32),
+                pl.col(Stats.dj_count).fill_null(0).cast(pl.UInt32))\
+        .sort(Artist.id)
+
+    # Write pre-processed data to parquet files
+    write_to_parquet_file(artists, ARTISTS_DATA_FILE)
+    write_to_parquet_file(track_artists, TRACK_ARTISTS_DATA_FILE)
+
+
+def process_song_embeddings():
+    """Compute the co-occurrence embeddings of the songs, for finding similar songs."""
+    embeddings = compute_track_embeddings(scan_parquet_file(PLAYLIST_TRACKS_DATA_FILE))
+
+    # Write pre-processed data to parquet files
+    write_to_parquet_file(embeddings, TRACK_EMBEDDINGS_DATA_FILE)
+
+
+def process_dj_signatures():
+    """Compute the MinHash signatures of the songs of every DJ, for finding similar DJs."""
+    signatures = compute_dj_signatures(
+        scan_parquet_file(PLAYLIST_DATA_FILE),
+        scan_parquet_file(PLAYLIST_TRACKS_DATA_FILE))
+
+    # Write pre-processed data to parquet files
+    write_to_parquet_file(signatures, DJ_SIGNATURES_DATA_FILE)
+
+
 def process_playlist_and_song_tags():
     """Process the playlist names into tag tables for songs and playlists."""
     playlists = scan_parquet_file(PLAYLIST_DATA_FILE)
@@ -830,7 +963,8 @@ def merge_playlist_tags_into_metadata():
 
     playlists = scan_parquet_file(UNTAGGED_PLAYLISTS_DATA_FILE)
     playlist_tags = scan_parquet_file(PLAYLIST_TAGS_DATA_FILE)
-    playlists_with_tags = playlists.drop(PlaylistTags.tags)\
+    # The tags columns only exist when re-running the tags merge (not in a fresh pre-processing run)
+    playlists_with_tags = playlists.drop(PlaylistTags.tags, strict=False)\
         .join(playlist_tags.select(Playlist.id, PlaylistTags.tags), how='left', on=Playlist.id)\
         .sort(Playlist.id)
 
@@ -845,7 +979,8 @@ def merge_song_tags_into_metadata():
     track_tags = scan_parquet_file(TRACK_TAGS_DATA_FILE)
     tracks_with_tags = tracks.drop(TrackTags.tags,
                                    TrackTags.playlist_counts_per_tag,
-                                   TrackTags.tag_relations_count)\
+                                   TrackTags.tag_relations_count,
+                                   strict=False)\
         .join(track_tags.select(Track.id,
                                 TrackTags.tags,
                                 TrackTags.playlist_counts_per_tag,
@@ -856,6 +991,14 @@ def merge_song_tags_into_metadata():
     write_to_parquet_file(tracks_with_tags, TRACK_DATA_FILE)
 
 
+def process_row_group_indexes():
+    """Write the sidecar indexes for point lookups by ID in the sorted files."""
+    for file_name, id_column in ROW_GROUP_INDEXED_FILES.items():
+        print(f'Writing {get_index_file_name(file_name)}...')
+        check_pre_read(file_name, track_file=True)
+        RowGroupIndex.build(file_name, id_column=id_column).write()
+
+
 def process_everything(merge_duplicates: bool = True):
     """Runs all pre-processing in sequence."""
     # Reset the internal file tracker (only used for debugging)
@@ -879,16 +1022,31 @@ def process_everything(merge_duplicates: bool = True):
 
     # Song lyrics reuses the track data generated above
     process_song_lyrics()
+    process_lyrics_postings()
 
     # Song pairings reuses the playlist entries data generated above
     process_song_pairings()
 
+    # Owners & artists reuse the track and playlist entries data generated above
+    process_owners()
+    process_artists()
+
+    # Song embeddings & DJ signatures reuse the playlist entries data generated above
+    process_song_embeddings()
+    process_dj_signatures()
+
     # Extract tags from playlist titles and assign to songs
     process_playlist_and_song_tags()
     process_tag_stats()
     merge_playlist_tags_into_metadata()
     merge_song_tags_into_metadata()
 
+    # Song summaries include the playlist data with the merged tags
+    process_track_summaries()
+
+    # Must run last, as the indexes depend on the exact row order of the final files
+    process_row_group_indexes()
+
     print("Done.")
 
 
@@ -898,3 +1056,4 @@ if __name__ == '__main__':
     process_tag_stats()
     merge_playlist_tags_into_metadata()
     merge_song_tags_into_metadata()
+    process_row_group_indexes()
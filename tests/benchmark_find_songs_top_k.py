@@ -0,0 +1,51 @@
+##################################################
+from os.path import dirname, abspath, join  # noqa
+import sys  # noqa
+
+# Make sure we can import code from utils/
+THIS_DIR = dirname(__file__)  # noqa
+PROJ_DIR = abspath(join(THIS_DIR, '..'))  # noqa
+sys.path.append(PROJ_DIR)  # noqa
+##################################################
+
+import time
+
+from utils.search import SearchEngine
+
+search_engine = SearchEngine()
+search_engine.load_data()
+
+queries = [
+    dict(playlist_include='late night'),
+    dict(playlist_include='late night', playlist_exclude='blues'),
+    dict(country='usa'),
+    dict(),
+]
+
+for query in queries:
+    for limit in [100, 1000]:
+        timings = {}
+        results = {}
+
+        for use_top_k in [False, True]:
+            search_engine.use_top_k = use_top_k
+            start = time.perf_counter()
+            results[use_top_k] = search_engine.find_songs(
+                **query,
+                sort_by=[
+                    'hit_count',
+                    'matching_playlist_count',
+                    'playlist_count',
+                    'dj_count'
+                ],
+                descending=True,
+                limit=limit,
+            ).collect(engine='streaming')
+            timings[use_top_k] = time.perf_counter() - start
+
+        sort_columns = ['hit_count', 'matching_playlist_count', 'playlist_count', 'dj_count']
+        assert results[True].select(sort_columns).equals(results[False].select(sort_columns))
+
+        print(f"{query} limit={limit}: "
+              f"full sort {timings[False]:.3f}s, "
+              f"top-k {timings[True]:.3f}s")
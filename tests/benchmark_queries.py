@@ -0,0 +1,60 @@
+##################################################
+from os.path import dirname, abspath, join  # noqa
+import sys  # noqa
+
+# Make sure we can import code from utils/
+THIS_DIR = dirname(__file__)  # noqa
+PROJ_DIR = abspath(join(THIS_DIR, '..'))  # noqa
+sys.path.append(PROJ_DIR)  # noqa
+##################################################
+
+# Usage: python tests/benchmark_queries.py [--query-log FILE] [--baseline FILE] [--save-baseline]
+import argparse
+import os
+
+import polars as pl
+
+from utils.benchmark import (
+    DEFAULT_REPETITIONS,
+    DEFAULT_TOLERANCE,
+    FIXED_QUERIES,
+    find_regressions,
+    format_report,
+    load_baseline,
+    load_replayed_queries,
+    run_benchmark,
+    save_baseline,
+)
+from utils.search import SearchEngine
+
+parser = argparse.ArgumentParser(description='Measure the latency of the app queries.')
+parser.add_argument('--query-log', help='replay the queries from this JSONL or SQLite query log')
+parser.add_argument('--max-replayed-queries', type=int, default=100)
+parser.add_argument('--repetitions', type=int, default=DEFAULT_REPETITIONS)
+parser.add_argument('--baseline', default=join(THIS_DIR, 'benchmark_baseline.json'))
+parser.add_argument('--save-baseline', action='store_true', help='overwrite the baseline with the results')
+parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+args = parser.parse_args()
+
+search_engine = SearchEngine()
+search_engine.load_data()
+
+queries = list(FIXED_QUERIES)
+if args.query_log:
+    queries += load_replayed_queries(args.query_log, limit=args.max_replayed_queries)
+
+results = run_benchmark(search_engine, queries, repetitions=args.repetitions)
+
+with pl.Config(tbl_rows=-1):
+    print(format_report(results))
+
+if args.save_baseline:
+    save_baseline(results, args.baseline)
+    print(f"Saved baseline to {args.baseline}")
+elif os.path.exists(args.baseline):
+    regressions = find_regressions(results, load_baseline(args.baseline), tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regressions compared to {args.baseline}")
@@ -0,0 +1,73 @@
+##################################################
+from os.path import dirname, abspath, join  # noqa
+import sys  # noqa
+
+# Make sure we can import code from utils/
+THIS_DIR = dirname(__file__)  # noqa
+PROJ_DIR = abspath(join(THIS_DIR, '..'))  # noqa
+sys.path.append(PROJ_DIR)  # noqa
+##################################################
+
+# Usage: python tests/benchmark_scaling.py [--scales 1 5 20] [--work-dir DIR]
+#
+# Generates synthetic source data at each scale factor (see utils/synthetic_data.py),
+# runs the full pre-processing and then the query workload of utils/benchmark.py on it.
+# Runs entirely offline, in a separate working directory per scale factor.
+import argparse
+import os
+import tempfile
+import time
+
+import polars as pl
+
+import preprocess
+from utils.benchmark import FIXED_QUERIES, PeakRssSampler, format_report, run_benchmark
+from utils.synthetic_data import generate_synthetic_data
+from utils.search import DATA_DIR, PLAYLIST_TRACKS_DATA_FILE, TEMP_DATA_DIR, SearchEngine
+
+pl.enable_string_cache()  # for Categoricals
+
+parser = argparse.ArgumentParser(description='Measure how pre-processing and queries scale with the corpus size.')
+parser.add_argument('--scales', type=float, nargs='+', default=[1, 5, 20])
+parser.add_argument('--repetitions', type=int, default=3)
+parser.add_argument('--work-dir', help='keep the generated data in this directory (default: a temporary directory)')
+args = parser.parse_args()
+
+work_dir = args.work_dir or tempfile.mkdtemp(prefix='wcs_scaling_')
+summary = []
+
+for scale in args.scales:
+    scale_dir = join(work_dir, f'scale_{scale:g}')
+    for data_dir in [DATA_DIR, TEMP_DATA_DIR]:
+        os.makedirs(join(scale_dir, data_dir), exist_ok=True)
+    # All data paths are relative to the working directory
+    os.chdir(scale_dir)
+
+    print(f'### Scale {scale:g} (in {scale_dir})')
+    generate_synthetic_data(scale)
+
+    with PeakRssSampler(interval=0.05) as sampler:
+        started_at = time.perf_counter()
+        preprocess.process_everything()
+        preprocessing_seconds = time.perf_counter() - started_at
+
+    search_engine = SearchEngine()
+    started_at = time.perf_counter()
+    search_engine.load_data()
+    loading_seconds = time.perf_counter() - started_at
+
+    results = run_benchmark(search_engine, FIXED_QUERIES, repetitions=args.repetitions)
+    with pl.Config(tbl_rows=-1):
+        print(format_report(results))
+
+    summary.append({
+        'scale': scale,
+        'playlist_entries': pl.scan_parquet(PLAYLIST_TRACKS_DATA_FILE).select(pl.len()).collect().item(),
+        'preprocessing_s': round(preprocessing_seconds, 1),
+        'preprocessing_peak_rss_mib': round(sampler.peak_rss_bytes / 2 ** 20),
+        'loading_s': round(loading_seconds, 2),
+        **{f'{query_type}_p50_ms': round(stats.p50_seconds * 1000, 1) for query_type, stats in results.items()},
+    })
+
+with pl.Config(tbl_cols=-1, tbl_width_chars=200):
+    print(pl.DataFrame(summary))
@@ -0,0 +1,221 @@
+"""
+Async facade over `SearchEngine`, with per-query deadlines and cooperative cancellation.
+
+Queries are built in a worker thread (some `find_*` methods do eager work up front,
+e.g. top-K evaluation or pagination), and the resulting LazyFrame is collected in
+the background via `LazyFrame.collect(background=True)`. While waiting, the facade
+periodically checks the deadline and the cancellation token of the query, and
+reports the progress to an optional callback.
+
+If a `QueryScheduler` is given, the LazyFrame additionally has to be admitted by it
+before it is collected (see `utils.scheduler`). The time spent waiting in its queue
+does not count towards the deadline of the query.
+
+The eager stages of the build (see `utils.query_context`) are subject to the same
+deadline, cancellation token and scheduler, so a stopped query also stops building,
+and the expensive builds (e.g. of the first page of a search) are admitted, too.
+
+NOTE: Cancelling a query that polars has already started executing is best-effort:
+      the caller is released immediately, but the query itself may keep running
+      in the background until polars reaches its next cancellation point.
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable
+import asyncio
+import time
+
+import polars as pl
+from polars.lazyframe.in_process import InProcessQuery
+
+from utils.query_context import CancellationToken, QueryCancelledError, QueryContext, QueryTooBroadError
+from utils.scheduler import QueryRejectedError, QueryScheduler, QueryTicket, estimate_memory_usage
+from utils.search import QuerySpec, SearchEngine
+
+DEFAULT_TIMEOUT_SECONDS: float = 60.0
+DEFAULT_POLL_INTERVAL_SECONDS: float = 0.05
+DEFAULT_PROGRESS_INTERVAL_SECONDS: float = 1.0
+DEFAULT_MAX_WORKERS: int = 4
+
+
+class AsyncSearchEngine:
+    """Runs `SearchEngine` queries without blocking, enforcing deadlines & honoring cancellation requests."""
+
+    def __init__(
+        self,
+        engine: SearchEngine,
+        *,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL_SECONDS,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        scheduler: QueryScheduler | None = None,
+    ):
+        self.engine = engine
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search')
+
+        # Cancelled queries that may still be running, see the note on cancellation above.
+        # Polars expects their results to still be received, so we keep them around until they finish.
+        # They also keep their admission ticket until then, as they still use memory in the meantime.
+        self._abandoned_queries: list[tuple[InProcessQuery, QueryTicket | None]] = []
+        self._abandoned_lock = Lock()
+
+    async def find(self, query: QuerySpec, **options) -> pl.DataFrame:
+        """Evaluate a single query (see `SearchEngine.build_query`)."""
+        return await self.run(lambda: self.engine.build_query(query), **options)
+
+    async def batch(self, queries: list[QuerySpec], **options) -> list[pl.DataFrame]:
+        """Evaluate several queries at once (see `SearchEngine.batch`)."""
+        return await self.run(lambda: self.engine.batch(queries), **options)
+
+    async def run[T](
+        self,
+        build: Callable[[], pl.LazyFrame | T],
+        *,
+        timeout: float | None = None,
+        token: CancellationToken | None = None,
+        on_progress: Callable[[float], None] | None = None,
+        on_queued: Callable[[int, float], None] | None = None,
+    ) -> pl.DataFrame | T:
+        """
+        Build a query via `build()` in a worker thread, and collect it if it returns a LazyFrame.
+
+        Raises `QueryTooBroadError` if the query does not finish within `timeout`
+        seconds, `QueryCancelledError` if `token` is cancelled before that, and
+        `QueryRejectedError` if the scheduler does not admit the query in time.
+        `on_progress` is called periodically with the number of elapsed seconds,
+        `on_queued` with the queue position and the estimated waiting time in seconds.
+        """
+        started_at = time.monotonic()
+        timeout = timeout if timeout is not None else self.timeout
+        # Shared with the worker thread, which checks it between (and during) the eager stages of the build
+        context = QueryContext(timeout=timeout, deadline=started_at + timeout, poll_interval=self.poll_interval,
+                               token=token, scheduler=self.scheduler, on_abandon=self._abandon,
+                               release_abandoned=self._release_abandoned_queries)
+        last_progress_at = started_at
+
+        async def wait_until(
+            is_done: Callable[[], bool],
+            *,
+            cancel: Callable[[], object],
+            until: Callable[[], float],
+            on_timeout: Callable[[], Exception],
+            on_wait: Callable[[], object],
+        ):
+            nonlocal last_progress_at
+            try:
+                while not is_done():
+                    now = time.monotonic()
+                    if token is not None and token.is_cancelled:
+                        raise QueryCancelledError('Query was cancelled')
+                    if now >= until():
+                        raise on_timeout()
+                    if now - last_progress_at >= self.progress_interval:
+                        last_progress_at = now
+                        on_wait()
+                    await asyncio.sleep(self.poll_interval)
+            except BaseException:
+                # Also covers exceptions raised by the callbacks, e.g. when Streamlit stops the current run
+                cancel()
+                raise
+
+        def report_progress():
+            # An eager stage of the build might be waiting for admission
+            queued_ticket = context.queued_ticket
+            if queued_ticket is not None and self.scheduler is not None:
+                if on_queued is not None:
+                    on_queued(self.scheduler.position(queued_ticket),
+                              self.scheduler.estimated_wait_seconds(queued_ticket))
+            elif on_progress is not None:
+                on_progress(time.monotonic() - started_at)
+
+        def wait_for_deadline(is_done: Callable[[], bool], *, cancel: Callable[[], object]):
+            return wait_until(is_done, cancel=cancel, until=lambda: context.deadline,
+                              on_timeout=lambda: QueryTooBroadError(timeout),
+                              on_wait=report_progress)
+
+        def build_in_context():
+            with context.activate():
+                return build()
+
+        def stop_building():
+            # A build that is already running stops at its next eager stage (or during it)
+            build_future.cancel()
+            context.stop()
+
+        build_future = asyncio.get_running_loop().run_in_executor(self._executor, build_in_context)
+        await wait_for_deadline(build_future.done, cancel=stop_building)
+        result = build_future.result()
+
+        if not isinstance(result, pl.LazyFrame):
+            return result
+
+        ticket: QueryTicket | None = None
+        if self.scheduler is not None:
+            scheduler = self.scheduler
+            ticket = scheduler.submit(estimate_memory_usage(result))
+            queued_at = time.monotonic()
+
+            def is_admitted() -> bool:
+                self._release_abandoned_queries()
+                return scheduler.try_admit(ticket)
+
+            def report_queue_position():
+                if on_queued is not None:
+                    on_queued(scheduler.position(ticket), scheduler.estimated_wait_seconds(ticket))
+
+            await wait_until(is_admitted, cancel=lambda: scheduler.release(ticket),
+                             until=lambda: queued_at + scheduler.max_wait_seconds,
+                             on_timeout=lambda: QueryRejectedError('Query was not admitted in time'),
+                             on_wait=report_queue_position)
+            context.deadline += time.monotonic() - queued_at
+
+        self._release_abandoned_queries()
+        try:
+            background_query = result.collect(background=True, engine='streaming')
+        except BaseException:
+            self._release(ticket)
+            raise
+        collected: list[pl.DataFrame] = []
+
+        def abandon():
+            background_query.cancel()
+            self._abandon(background_query, ticket)
+
+        def is_collected() -> bool:
+            if not collected and (df := background_query.fetch()) is not None:
+                collected.append(df)
+            return bool(collected)
+
+        await wait_for_deadline(is_collected, cancel=abandon)
+        self._release(ticket)
+        return collected[0]
+
+    def _release(self, ticket: QueryTicket | None):
+        if self.scheduler is not None and ticket is not None:
+            self.scheduler.release(ticket)
+
+    def _abandon(self, query: InProcessQuery, ticket: QueryTicket | None):
+        # Also called from the worker threads, for the eager stages of a build
+        with self._abandoned_lock:
+            self._abandoned_queries.append((query, ticket))
+
+    def _release_abandoned_queries(self):
+        with self._abandoned_lock:
+            still_running = []
+            for query, ticket in self._abandoned_queries:
+                try:
+                    is_running = query.fetch() is None
+                except Exception:
+                    # Queries that polars interrupted (or that failed) are finished, too
+                    is_running = False
+                if is_running:
+                    still_running.append((query, ticket))
+                else:
+                    self._release(ticket)
+            self._abandoned_queries = still_running
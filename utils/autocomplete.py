@@ -0,0 +1,91 @@
+"""
+Prefix autocompletion of song, artist, DJ, playlist and tag names.
+
+Every name is normalized (see `utils.fuzzy.normalize_name`) and stored under all
+of its word-aligned suffixes (e.g. "groove love" is stored as "groove love" and as
+"love"), so that typing the beginning of any word of a name finds it. The keys are
+kept sorted, so the keys that start with a prefix form a contiguous range that is
+found with two binary searches. The names within that range are then ranked by
+their `playlist_count`.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+from utils.fuzzy import name_words, normalize_name
+from utils.tables import Stats
+
+DEFAULT_COMPLETION_LIMIT: int = 10
+
+MAX_SUFFIXES_PER_NAME: int = 8
+"""Only the suffixes starting at the first words of each name are stored, which keeps long playlist names cheap."""
+
+_MAX_CHAR: str = '\U0010ffff'
+"""Sorts after every other character, so `prefix + _MAX_CHAR` is larger than every string starting with `prefix`."""
+
+
+@dataclass(slots=True)
+class PrefixIndex:
+    """Sorted name keys for autocompletion, see the module docstring."""
+
+    names: pl.Series
+    """The distinct names, as they should be displayed."""
+
+    popularity: np.ndarray
+    """The `playlist_count` of every name."""
+
+    keys: pl.Series
+    """The normalized word-aligned suffixes of all names, sorted."""
+
+    key_names: np.ndarray
+    """The name (index into `names`) every key in `keys` belongs to."""
+
+    def complete(self, prefix: str, *, limit: int | None = DEFAULT_COMPLETION_LIMIT) -> pl.DataFrame:
+        """Return the most popular names that have a word starting with the given prefix, with their `playlist_count`."""
+        prefix = normalize_name(prefix)
+        if not prefix:
+            matches = np.arange(len(self.names))
+        else:
+            start, stop = self.keys.search_sorted(pl.Series([prefix, prefix + _MAX_CHAR]), side='left').to_list()
+            matches = np.unique(self.key_names[start:stop])
+
+        if limit is not None and len(matches) > limit:
+            matches = matches[np.argpartition(-self.popularity[matches], limit - 1)[:limit]]
+        matches = matches[np.lexsort((matches, -self.popularity[matches]))]
+
+        return pl.DataFrame({
+            'name': self.names.gather(matches),
+            Stats.playlist_count: pl.Series(self.popularity[matches], dtype=pl.UInt32),
+        })
+
+    @staticmethod
+    def build(names: pl.LazyFrame | pl.DataFrame, *, name_column: str, popularity_column: str) -> PrefixIndex:
+        """
+        Create the index for the given names and their popularity,
+        summing the popularity of names that occur multiple times.
+        """
+        names = names.lazy()\
+            .select(pl.col(name_column).alias('name'), pl.col(popularity_column).fill_null(0).alias('popularity'))\
+            .filter(pl.col('name').str.strip_chars().ne(''))\
+            .group_by('name')\
+            .agg(pl.col('popularity').sum())\
+            .sort('popularity', 'name', descending=[True, False])\
+            .collect()
+
+        words = pl.col('words')
+        keys = names\
+            .select(pl.int_range(pl.len(), dtype=pl.Int64).alias('name'), name_words(pl.col('name')).alias('words'))\
+            .with_columns(pl.int_ranges(words.list.len().clip(upper_bound=MAX_SUFFIXES_PER_NAME)).alias('start'))\
+            .explode('start')\
+            .drop_nulls('start')\
+            .select('name', words.list.slice(pl.col('start')).list.join(' ').alias('key'))\
+            .unique()\
+            .sort('key', 'name')
+
+        return PrefixIndex(
+            names=names['name'],
+            popularity=names['popularity'].cast(pl.Int64).to_numpy(),
+            keys=keys['key'],
+            key_names=keys['name'].to_numpy())
@@ -0,0 +1,277 @@
+"""
+Latency benchmarks for the `SearchEngine` queries.
+
+A workload consists of the fixed queries the app runs on every start (top songs,
+tag insights, DJ, region & country stats), optionally extended by the user queries
+replayed from a query log (see `utils.common.logging`). Every query is run several
+times, and the latencies are aggregated per query type into percentiles, together
+with the peak RSS of the process while the queries of that type were running.
+
+The results can be saved as a baseline JSON file, and later results are compared
+against it to detect latency regressions.
+"""
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from typing import Any
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import polars as pl
+import psutil
+
+from utils.search import QuerySpec, SearchEngine
+from utils.tables import Playlist, Stats
+
+DEFAULT_REPETITIONS: int = 5
+
+DEFAULT_TOLERANCE: float = 0.25
+"""How much slower (relative to the baseline) a query type may get before it is reported as a regression."""
+
+MIN_REGRESSION_SECONDS: float = 0.01
+"""Differences below this are ignored, as they are mostly noise for the very fast queries."""
+
+RSS_SAMPLE_INTERVAL_SECONDS: float = 0.005
+
+
+@dataclass(slots=True)
+class BenchmarkQuery:
+    """A single query of the benchmark workload."""
+
+    query_type: str
+    """Groups the queries in the report (e.g. "Search songs")."""
+
+    spec: QuerySpec
+    """The `SearchEngine` method to call (not limited to the `find_*` methods), and its parameters."""
+
+
+@dataclass(slots=True)
+class QueryTypeStats:
+    """The aggregated measurements of all queries of the same type."""
+
+    run_count: int
+    p50_seconds: float
+    p95_seconds: float
+    p99_seconds: float
+    peak_rss_bytes: int
+
+
+FIXED_QUERIES: list[BenchmarkQuery] = [
+    BenchmarkQuery('Top songs', QuerySpec('find_songs', dict(sort_by=Stats.playlist_count, descending=True, limit=101))),
+    BenchmarkQuery('Top queer songs', QuerySpec('find_songs', dict(artist_is_queer=True, sort_by=Stats.playlist_count,
+                                                                   descending=True, limit=101))),
+    BenchmarkQuery('Tag insights', QuerySpec('find_tags', dict(limit=1000, playlist_limit=20))),
+    BenchmarkQuery('DJ stats', QuerySpec('get_dj_stats', dict(playlist_limit=30, dj_limit=2000))),
+    BenchmarkQuery('Region stats', QuerySpec('get_region_stats')),
+    BenchmarkQuery('Country stats', QuerySpec('get_country_stats')),
+]
+"""The queries the app runs (and caches) independently of the user input."""
+
+
+def replay_query(query_type: str, params: dict[str, Any]) -> QuerySpec | None:
+    """
+    Translate a logged query (with the parameters as entered in the UI) into the `SearchEngine` call
+    made by `westie_music_database.py`. Returns `None` for query types that cannot be replayed.
+
+    The paginated searches are replayed as the (uncached) query for their first page.
+    """
+    match query_type:
+        case 'Search songs':
+            bpm_range = params.get('bpm_slider')
+            return QuerySpec('find_songs', dict(
+                song_name=params.get('song_input', ''),
+                song_bpm_range=tuple(bpm_range) if bpm_range else None,
+                artist_name=params.get('artist_name', ''),
+                artist_is_queer=params.get('queer_toggle', False),
+                artist_is_poc=params.get('poc_toggle', False),
+                playlist_include=params.get('playlist_input', ''),
+                playlist_exclude=params.get('anti_playlist_input', ''),
+                added_to_playlist_date=params.get('added_2_playlist_date', ''),
+                fuzzy=params.get('fuzzy_toggle', False),
+                sort_by=[Playlist.matched_terms_count, Playlist.matching_playlist_count,
+                         Stats.playlist_count, Stats.dj_count],
+                descending=True,
+                limit=1000))
+        case 'Search playlists':
+            return QuerySpec('find_playlists', dict(
+                song_name=params.get('song_input', ''),
+                dj_name=params.get('dj_input', ''),
+                playlist_include=params.get('playlist_input', ''),
+                playlist_exclude=params.get('anti_playlist_input', ''),
+                tracks_in_result=True,
+                tracks_limit=30,
+                sort_by=[Playlist.matched_terms_count, Playlist.matching_song_count,
+                         Stats.song_count, Stats.artist_count],
+                descending=True,
+                limit=500))
+        case 'Search djs' if 'dj_compare_1' in params:
+            return QuerySpec('find_songs', dict(
+                dj_name=f"{params['dj_compare_1']},{params.get('dj_compare_2', '')}",
+                playlist_limit=None))
+        case 'Search djs':
+            return QuerySpec('find_djs', dict(
+                dj_name=params.get('dj_input', ''),
+                playlist_name=params.get('dj_playlist_input', ''),
+                dj_limit=100,
+                playlist_limit=30))
+        case 'Search similar djs':
+            return QuerySpec('find_similar_djs', dict(dj_name=params.get('dj_compare_1', '')), output=1)
+        case "Comparing Countries' music":
+            return QuerySpec('find_songs', dict(country=params.get('countries_selectbox') or ''))
+        case 'Search ranked lyrics':
+            return QuerySpec('find_songs_by_lyrics', dict(lyrics_query=params.get('lyrics_input', ''), limit=100))
+        case 'Trending songs':
+            return QuerySpec('find_trending_songs', dict(
+                window=params.get('trend_window_input', 3),
+                baseline=params.get('trend_baseline_input', 12),
+                declining=params.get('declining_input', False),
+                limit=100))
+        case _:
+            return None
+
+
+def read_query_log(path: str) -> list[tuple[str, dict[str, Any]]]:
+    """Read the `(query_type, params)` of all successful queries from a JSONL or SQLite query log."""
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as file:
+            events = [json.loads(line) for line in file if line.strip()]
+    else:
+        with sqlite3.connect(path) as connection:
+            events = [dict(query_type=query_type, params=json.loads(params), error=error)
+                      for query_type, params, error
+                      in connection.execute("SELECT query_type, params, error FROM query_log ORDER BY logged_at")]
+
+    return [(event['query_type'], event['params']) for event in events if not event.get('error')]
+
+
+def load_replayed_queries(path: str, *, limit: int | None = None) -> list[BenchmarkQuery]:
+    """Translate the (distinct) queries of a query log into a benchmark workload."""
+    queries: dict[str, BenchmarkQuery] = {}
+    skipped_count = 0
+
+    for query_type, params in read_query_log(path):
+        spec = replay_query(query_type, params)
+        if spec is None:
+            skipped_count += 1
+            continue
+        queries.setdefault(json.dumps([query_type, params], sort_keys=True, default=str),
+                           BenchmarkQuery(query_type, spec))
+
+    if skipped_count > 0:
+        print(f"Warning: Skipped {skipped_count} logged queries that cannot be replayed")
+    return list(queries.values())[:limit]
+
+
+class PeakRssSampler:
+    """Samples the RSS of the current process in a background thread, and keeps the maximum."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self._process = psutil.Process()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> PeakRssSampler:
+        self.peak_rss_bytes = self._process.memory_info().rss
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        self.peak_rss_bytes = max(self.peak_rss_bytes, self._process.memory_info().rss)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+
+def run_query(engine: SearchEngine, spec: QuerySpec) -> int:
+    """Run a query to completion, and return the number of result rows."""
+    result = getattr(engine, spec.method)(**spec.params)
+    if isinstance(result, tuple):
+        result = result[spec.output if spec.output is not None else 0]
+    if isinstance(result, pl.LazyFrame):
+        result = result.collect(engine='streaming')
+    return len(result)
+
+
+def run_benchmark(
+    engine: SearchEngine,
+    queries: list[BenchmarkQuery],
+    *,
+    repetitions: int = DEFAULT_REPETITIONS,
+) -> dict[str, QueryTypeStats]:
+    """Run every query `repetitions` times (after a warm-up run), and aggregate the measurements per query type."""
+    latencies: dict[str, list[float]] = {}
+    peak_rss: dict[str, int] = {}
+
+    for query in queries:
+        # The first run also pays for loading the files & building the lazily initialized indexes
+        run_query(engine, query.spec)
+
+        for _ in range(repetitions):
+            with PeakRssSampler() as sampler:
+                started_at = time.perf_counter()
+                run_query(engine, query.spec)
+                latencies.setdefault(query.query_type, []).append(time.perf_counter() - started_at)
+            peak_rss[query.query_type] = max(peak_rss.get(query.query_type, 0), sampler.peak_rss_bytes)
+
+    return {
+        query_type: QueryTypeStats(
+            run_count=len(seconds),
+            p50_seconds=float(np.percentile(seconds, 50)),
+            p95_seconds=float(np.percentile(seconds, 95)),
+            p99_seconds=float(np.percentile(seconds, 99)),
+            peak_rss_bytes=peak_rss[query_type])
+        for query_type, seconds in latencies.items()
+    }
+
+
+def format_report(results: dict[str, QueryTypeStats]) -> pl.DataFrame:
+    """The results as a table (latencies in milliseconds, RSS in MiB)."""
+    return pl.DataFrame([{
+        'query_type': query_type,
+        'runs': stats.run_count,
+        'p50_ms': round(stats.p50_seconds * 1000, 1),
+        'p95_ms': round(stats.p95_seconds * 1000, 1),
+        'p99_ms': round(stats.p99_seconds * 1000, 1),
+        'peak_rss_mib': round(stats.peak_rss_bytes / 2 ** 20),
+    } for query_type, stats in results.items()])
+
+
+def save_baseline(results: dict[str, QueryTypeStats], path: str):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({query_type: asdict(stats) for query_type, stats in results.items()}, file, indent=2)
+
+
+def load_baseline(path: str) -> dict[str, QueryTypeStats]:
+    with open(path, encoding='utf-8') as file:
+        return {query_type: QueryTypeStats(**stats) for query_type, stats in json.load(file).items()}
+
+
+def find_regressions(
+    results: dict[str, QueryTypeStats],
+    baseline: dict[str, QueryTypeStats],
+    *,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> list[str]:
+    """Describe the query types whose p50 or p95 latency got worse than the baseline (by more than the tolerance)."""
+    regressions = []
+    for query_type, stats in results.items():
+        if query_type not in baseline:
+            continue
+        for percentile in ['p50_seconds', 'p95_seconds']:
+            current, previous = getattr(stats, percentile), getattr(baseline[query_type], percentile)
+            if current > previous * (1 + tolerance) and current - previous > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{query_type}: {percentile.removesuffix('_seconds')} "
+                                   f"{previous * 1000:.1f}ms => {current * 1000:.1f}ms")
+    return regressions
@@ -0,0 +1,171 @@
+"""Compressed bitmaps over dense row numbers (in the style of Roaring bitmaps)."""
+from __future__ import annotations
+from typing import Iterable
+
+import numpy as np
+
+# Each container covers 2^16 consecutive row numbers. Sparse containers are stored
+# as sorted arrays of the lower 16 bits, dense ones as fixed-size bitsets.
+_CONTAINER_BITS = 16
+_CONTAINER_SIZE = 1 << _CONTAINER_BITS
+_BITSET_WORDS = _CONTAINER_SIZE // 64
+_ARRAY_MAX_CARDINALITY = 4096
+
+
+def _is_bitset(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+
+def _bitset_from_array(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(_CONTAINER_SIZE, dtype=np.bool_)
+    bits[values] = True
+    return np.packbits(bits, bitorder='little').view(np.uint64)
+
+
+def _array_from_bitset(words: np.ndarray) -> np.ndarray:
+    bits = np.unpackbits(words.view(np.uint8), bitorder='little')
+    return np.flatnonzero(bits).astype(np.uint16)
+
+
+def _bitset_contains(words: np.ndarray, values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    return (words[values >> np.uint64(6)] >> (values & np.uint64(63))) & np.uint64(1) == 1
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if _is_bitset(container):
+        return int(np.unpackbits(container.view(np.uint8)).sum())
+    return len(container)
+
+
+def _optimize(container: np.ndarray) -> np.ndarray | None:
+    """Pick the cheaper container representation, or return `None` if the container is empty."""
+    if _is_bitset(container):
+        cardinality = _cardinality(container)
+        if cardinality == 0:
+            return None
+        if cardinality <= _ARRAY_MAX_CARDINALITY:
+            return _array_from_bitset(container)
+        return container
+    if len(container) == 0:
+        return None
+    if len(container) > _ARRAY_MAX_CARDINALITY:
+        return _bitset_from_array(container)
+    return container
+
+
+def _and(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    match _is_bitset(a), _is_bitset(b):
+        case True, True:
+            return _optimize(a & b)
+        case True, False:
+            return _optimize(b[_bitset_contains(a, b)])
+        case False, True:
+            return _optimize(a[_bitset_contains(b, a)])
+        case _:
+            return _optimize(np.intersect1d(a, b, assume_unique=True))
+
+
+def _or(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    match _is_bitset(a), _is_bitset(b):
+        case True, True:
+            return a | b
+        case True, False:
+            return a | _bitset_from_array(b)
+        case False, True:
+            return _bitset_from_array(a) | b
+        case _:
+            return _optimize(np.union1d(a, b))
+
+
+def _and_not(a: np.ndarray, b: np.ndarray) -> np.ndarray | None:
+    match _is_bitset(a), _is_bitset(b):
+        case True, True:
+            return _optimize(a & ~b)
+        case True, False:
+            return _optimize(a & ~_bitset_from_array(b))
+        case False, True:
+            return _optimize(a[~_bitset_contains(b, a)])
+        case _:
+            return _optimize(np.setdiff1d(a, b, assume_unique=True))
+
+
+class RoaringBitmap:
+    """An immutable, compressed set of row numbers supporting fast AND/OR/ANDNOT operations."""
+
+    __slots__ = ('_containers',)
+
+    def __init__(self, containers: dict[int, np.ndarray] | None = None):
+        self._containers: dict[int, np.ndarray] = containers or {}
+
+    @staticmethod
+    def from_rows(rows: Iterable[int] | np.ndarray) -> RoaringBitmap:
+        """Create a bitmap containing the given row numbers."""
+        rows = np.unique(np.asarray(rows, dtype=np.uint32))
+        keys = rows >> _CONTAINER_BITS
+        split_at = np.flatnonzero(np.diff(keys)) + 1
+        containers: dict[int, np.ndarray] = {}
+        for chunk in np.split(rows, split_at):
+            if len(chunk) > 0:
+                container = _optimize((chunk & (_CONTAINER_SIZE - 1)).astype(np.uint16))
+                if container is not None:
+                    containers[int(chunk[0] >> _CONTAINER_BITS)] = container
+        return RoaringBitmap(containers)
+
+    @staticmethod
+    def full(row_count: int) -> RoaringBitmap:
+        """Create a bitmap containing all rows in `range(0, row_count)`."""
+        return RoaringBitmap.from_rows(np.arange(row_count, dtype=np.uint32))
+
+    def to_rows(self) -> np.ndarray:
+        """Return the sorted row numbers contained in this bitmap."""
+        if not self._containers:
+            return np.empty(0, dtype=np.uint32)
+        return np.concatenate([
+            (np.uint32(key) << np.uint32(_CONTAINER_BITS))
+            | (_array_from_bitset(container) if _is_bitset(container) else container).astype(np.uint32)
+            for key, container in sorted(self._containers.items())
+        ])
+
+    def __len__(self) -> int:
+        return sum(_cardinality(container) for container in self._containers.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def __and__(self, other: RoaringBitmap) -> RoaringBitmap:
+        containers: dict[int, np.ndarray] = {}
+        for key in self._containers.keys() & other._containers.keys():
+            container = _and(self._containers[key], other._containers[key])
+            if container is not None:
+                containers[key] = container
+        return RoaringBitmap(containers)
+
+    def __or__(self, other: RoaringBitmap) -> RoaringBitmap:
+        containers = dict(self._containers)
+        for key, container in other._containers.items():
+            if key in containers:
+                container = _or(containers[key], container)
+            containers[key] = container
+        return RoaringBitmap(containers)
+
+    def __sub__(self, other: RoaringBitmap) -> RoaringBitmap:
+        """ANDNOT: Rows contained in `self` but not in `other`."""
+        containers: dict[int, np.ndarray] = {}
+        for key, container in self._containers.items():
+            if key in other._containers:
+                container = _and_not(container, other._containers[key])
+            if container is not None:
+                containers[key] = container
+        return RoaringBitmap(containers)
+
+    def __repr__(self) -> str:
+        return f'RoaringBitmap(cardinality={len(self)}, containers={len(self._containers)})'
+
+
+def union_all(bitmaps: Iterable[RoaringBitmap]) -> RoaringBitmap:
+    """OR all of the given bitmaps together."""
+    result = RoaringBitmap()
+    for bitmap in bitmaps:
+        result = result | bitmap
+    return result
@@ -1,5 +1,8 @@
 """Utility functions for parsing query parameters into polars filters."""
+from dataclasses import dataclass, field
+from datetime import date
 from typing import Literal
+import re
 
 import polars as pl
 
@@ -22,30 +25,38 @@ def or_filter(*filters: pl.Expr | None) -> pl.Expr | None:
     return expr
 
 
-def create_text_filter(
+def parse_filter_values(
     filter_expression: str | list[str] | None,
-    column: IntoExpr,
     *,
-    no_value: str = '',
-    is_list_column: bool = False,
     ascii_case_insensitive: bool = True,
-    match_mode: Literal['exact', 'contains'] = 'contains',
-) -> pl.Expr | None:
-    """Parse a filter expression for a text column."""
+) -> list[str]:
+    """Split a filter expression into the individual (non-empty) values to match against."""
     if filter_expression is None:
-        return None
+        return []
 
     if isinstance(filter_expression, list):
         if ascii_case_insensitive:
-            values = [item.lower() for item in filter_expression if item]
+            return [item.lower() for item in filter_expression if item]
         else:
-            values = list(filter(bool, filter_expression))
+            return list(filter(bool, filter_expression))
     else:
         if ascii_case_insensitive:
-            values = list(
-                filter(bool, filter_expression.strip().lower().split(',')))
+            return list(filter(bool, filter_expression.strip().lower().split(',')))
         else:
-            values = list(filter(bool, filter_expression.strip().split(',')))
+            return list(filter(bool, filter_expression.strip().split(',')))
+
+
+def create_text_filter(
+    filter_expression: str | list[str] | None,
+    column: IntoExpr,
+    *,
+    no_value: str = '',
+    is_list_column: bool = False,
+    ascii_case_insensitive: bool = True,
+    match_mode: Literal['exact', 'contains'] = 'contains',
+) -> pl.Expr | None:
+    """Parse a filter expression for a text column."""
+    values = parse_filter_values(filter_expression, ascii_case_insensitive=ascii_case_insensitive)
 
     if not values:
         return None
@@ -72,10 +83,160 @@ def create_text_filter(
         return is_match(into_expr(column))
 
 
+_DATE_PREFIX_PATTERN = re.compile(r'(\d{4})(?:-(?:(\d{1,2})(?:-(\d{1,2})?)?)?)?')
+"""The filter values that are prefixes of `yyyy-mm-dd` dates, e.g. `2024`, `2024-05` or `2024-05-17`."""
+
+
+def _add_months(year: int, month: int, months: int) -> date:
+    """The first day of the month `months` months after the given month."""
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+
+def parse_date_ranges(value: str) -> list[tuple[date, date]] | None:
+    """
+    Translate a filter value into the `[start, end)` ranges of the dates whose `yyyy-mm-dd`
+    representation contains it. Returns `None` if the value is not a supported date prefix.
+    """
+    if re.fullmatch(r'\d{3}', value):
+        # A decade (e.g. '198' => the 1980s), which is also contained in some other years (e.g. '2198')
+        decade = int(value) * 10
+        if not 1 <= decade <= 9980:
+            return None
+        return [(date(decade, 1, 1), date(decade + 10, 1, 1))]\
+            + [(date(year, 1, 1), date(year + 1, 1, 1))
+               for year in range(1000 + int(value), 9999, 1000)]
+
+    match = _DATE_PREFIX_PATTERN.fullmatch(value)
+    if match is None or not 1 <= int(match.group(1)) <= 9998:
+        return None
+
+    year, month, day = int(match.group(1)), match.group(2), match.group(3)
+    if month is None:
+        return [(date(year, 1, 1), date(year + 1, 1, 1))]
+
+    if len(month) == 1:
+        # Only the first digit of the month (e.g. '2024-1' => October to December)
+        if value.endswith('-'):
+            return []
+        return [(date(year, 1, 1), date(year, 10, 1))] if month == '0' else\
+            [(date(year, 10, 1), date(year + 1, 1, 1))] if month == '1' else []
+
+    if not 1 <= int(month) <= 12:
+        return []
+
+    month_start, month_end = date(year, int(month), 1), _add_months(year, int(month), 1)
+    if day is None:
+        return [(month_start, month_end)]
+
+    if len(day) == 1:
+        # Only the first digit of the day (e.g. '2024-05-1' => the 10th to the 19th)
+        first_day, last_day = max(int(day) * 10, 1), int(day) * 10 + 9
+    else:
+        first_day, last_day = int(day), int(day)
+
+    days_in_month = (month_end - month_start).days
+    if not 1 <= first_day <= days_in_month:
+        return []
+    return [(date(year, int(month), first_day),
+             date(year, int(month), last_day + 1) if last_day < days_in_month else month_end)]
+
+
 def create_date_filter(filter_expression: str, column: IntoExpr, *, is_list_column: bool = False) -> pl.Expr | None:
-    """Parse a filter expression for a date column"""
-    return create_text_filter(
-        filter_expression,
-        into_expr(column).dt.to_string(),
-        ascii_case_insensitive=False,
-        is_list_column=is_list_column)
+    """
+    Parse a filter expression for a date column.
+
+    Date prefixes (see `parse_date_ranges`) are matched as date ranges, so they can be pushed down
+    to the Parquet statistics. Any other values are matched against the `yyyy-mm-dd` strings instead.
+    """
+    values = parse_filter_values(filter_expression, ascii_case_insensitive=False)
+    if not values:
+        return None
+
+    def is_match(expr: pl.Expr) -> pl.Expr:
+        matches: list[pl.Expr] = []
+        text_values: list[str] = []
+        for value in values:
+            date_ranges = parse_date_ranges(value)
+            if date_ranges is None:
+                text_values.append(value)
+            else:
+                matches.extend(expr.is_between(pl.lit(start), pl.lit(end), closed='left')
+                               for start, end in date_ranges)
+
+        if text_values:
+            matches.append(expr.dt.to_string().str.contains_any(text_values, ascii_case_insensitive=False))
+
+        return or_filter(*matches) if matches else pl.lit(False)
+
+    if is_list_column:
+        return into_expr(column).list.eval(is_match(pl.element())).list.any()
+    else:
+        return is_match(into_expr(column))
+
+
+@dataclass(slots=True)
+class FilterCompiler:
+    """
+    Creates text filters that take the data types of the columns into account.
+
+    For dictionary-encoded columns (`Enum` columns, and string columns with a known
+    set of values like the tags), the filter terms are resolved against the dictionary
+    once, so the resulting filter only checks the (physical) values of each row for
+    membership instead of casting and lowercasing every row. All other columns fall
+    back to `create_text_filter`.
+    """
+
+    dtypes: dict[str, pl.DataType]
+    """The data types of the columns that may be filtered on."""
+
+    dictionaries: dict[str, list[str]] = field(default_factory=dict)
+    """The possible values of (list) string columns that are not stored as an `Enum`."""
+
+    def create_text_filter(
+        self,
+        filter_expression: str | list[str] | None,
+        column: str,
+        *,
+        no_value: str = '',
+        is_list_column: bool = False,
+        match_mode: Literal['exact', 'contains'] = 'contains',
+    ) -> pl.Expr | None:
+        """Same as `create_text_filter(...)`, but resolves the values via the dictionary of the column (if any)."""
+        values = parse_filter_values(filter_expression)
+
+        dtype = self.dtypes.get(column)
+        value_dtype = dtype.inner if isinstance(dtype, pl.List) else dtype
+        if isinstance(value_dtype, pl.Enum):
+            dictionary = value_dtype.categories.to_list()
+        elif column in self.dictionaries:
+            dictionary = self.dictionaries[column]
+        else:
+            dictionary = None
+
+        if not values or dictionary is None or (no_value and no_value.lower() in values):
+            return create_text_filter(filter_expression, column, no_value=no_value,
+                                      is_list_column=is_list_column, match_mode=match_mode)
+
+        if no_value and not is_list_column:
+            raise ValueError("no_value may only be specified when is_list_column is True")
+
+        if match_mode == 'contains':
+            matched_codes = [code for code, value in enumerate(dictionary)
+                             if any(term in value.lower() for term in values)]
+        elif match_mode == 'exact':
+            matched_codes = [code for code, value in enumerate(dictionary) if value.lower() in values]
+        else:
+            raise ValueError(f'Invalid match mode: {match_mode}')
+
+        def is_match(expr: pl.Expr) -> pl.Expr:
+            if isinstance(value_dtype, pl.Enum):
+                physical_dtype = pl.Series([], dtype=value_dtype).to_physical().dtype
+                return expr.to_physical().is_in(pl.Series(matched_codes, dtype=physical_dtype).implode())
+            else:
+                return expr.is_in(pl.Series([dictionary[code] for code in matched_codes], dtype=pl.String).implode())
+
+        if is_list_column:
+            return pl.col(column).list.eval(is_match(pl.element())).list.any()
+        else:
+            return is_match(pl.col(column))
@@ -1,22 +1,227 @@
-"""Utility functions for logging queries to Supabase."""
-from supabase import create_client, Client
+"""
+Utility functions for logging queries to Supabase, a local SQLite database or a JSONL file.
+
+Logging must never slow down (or break) the queries themselves, so `log_query` only
+appends the event to a bounded in-memory queue. A background thread drains the queue
+and writes the events to the configured sinks in batches. If the queue is full
+(e.g. because a sink is unreachable), new events are dropped instead of blocking.
+
+The sinks are configured via environment variables:
+
+- `SUPABASE_URL` and `SUPABASE_KEY` enable logging to Supabase.
+- `QUERY_LOG_FILE` enables logging to a local file, either a JSONL file (`*.jsonl`)
+  or otherwise a SQLite database.
+"""
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Protocol
+import atexit
+import json
 import os
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_QUEUE_SIZE: int = 1000
+DEFAULT_BATCH_SIZE: int = 50
+DEFAULT_FLUSH_INTERVAL_SECONDS: float = 2.0
+
+SUPABASE_TABLE: str = "WestieMusicDatabase"
+
+
+@dataclass(slots=True)
+class QueryEvent:
+    """A single logged query."""
+
+    query_type: str
+    """What kind of query has been run (e.g. "Search songs")."""
+
+    params: dict[str, Any]
+    """The query parameters as entered by the user."""
+
+    logged_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    """When the query has been logged (ISO 8601, UTC)."""
+
+    latency_seconds: float | None = None
+    """How long the query took."""
+
+    result_size: int | None = None
+    """The number of rows of the result."""
+
+    plan: str | None = None
+    """The (optimized) plan chosen for the query."""
+
+    error: str | None = None
+    """The name of the exception the query failed with, if any."""
+
+
+class QueryLogSink(Protocol):
+    """Receives batches of logged queries from the background writer."""
+
+    def write(self, events: list[QueryEvent]): ...
+
+
+class SupabaseSink:
+    """Inserts the events into a Supabase table."""
+
+    def __init__(self, client, table: str = SUPABASE_TABLE):
+        self.client = client
+        self.table = table
+
+    def write(self, events: list[QueryEvent]):
+        # The table only has the query_type and params columns, so we store the metrics
+        # as part of the params (except for the plan, which is too large)
+        self.client.table(self.table).insert([{
+            "query_type": event.query_type,
+            "params": event.params | {"metrics": {
+                "latency_seconds": event.latency_seconds,
+                "result_size": event.result_size,
+                "error": event.error,
+            }},
+        } for event in events]).execute()
+
+
+class SqliteSink:
+    """Appends the events to the `query_log` table of a local SQLite database."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection: sqlite3.Connection | None = None
+
+    def write(self, events: list[QueryEvent]):
+        # Connect lazily, so the connection is created on (and only used by) the writer thread
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS query_log ("
+                "logged_at TEXT, query_type TEXT, params TEXT, latency_seconds REAL,"
+                " result_size INTEGER, plan TEXT, error TEXT)")
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO query_log VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(event.logged_at, event.query_type, json.dumps(event.params, default=str),
+                  event.latency_seconds, event.result_size, event.plan, event.error)
+                 for event in events])
+
+
+class JsonlSink:
+    """Appends the events to a JSONL file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, events: list[QueryEvent]):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for event in events:
+                file.write(json.dumps(asdict(event), default=str) + '\n')
+
+
+class QueryLogger:
+    """Buffers logged queries in a bounded queue, and writes them to the sinks from a background thread."""
+
+    def __init__(
+        self,
+        sinks: list[QueryLogSink],
+        *,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL_SECONDS,
+    ):
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped_count = 0
+
+        self._queue: queue.Queue[QueryEvent] = queue.Queue(maxsize=max_queue_size)
+        self._writer: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def log(self, event: QueryEvent):
+        """Enqueue an event without blocking. Drops the event if the queue is full."""
+        if not self.sinks:
+            return
+        self._start_writer()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped_count += 1
+
+    def flush(self, timeout: float | None = None):
+        """Wait until all events enqueued so far have been written (or the timeout expires)."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name='query-logger', daemon=True)
+                self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            batch = [self._queue.get()]
+            batch_deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(batch_deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as e:
+                    print(f"Warning: Could not write {len(batch)} query log events"
+                          f" to {type(sink).__name__}: {e}")
+
+            for _ in batch:
+                self._queue.task_done()
+
+
+def create_sinks_from_environment() -> list[QueryLogSink]:
+    """Create the sinks configured via the environment variables (see above)."""
+    sinks: list[QueryLogSink] = []
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if url and key:
+        from supabase import create_client
+        sinks.append(SupabaseSink(create_client(url, key)))
+
+    log_file = os.getenv("QUERY_LOG_FILE")
+    if log_file:
+        sinks.append(JsonlSink(log_file) if log_file.endswith('.jsonl') else SqliteSink(log_file))
+
+    return sinks
 
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
 
-supabase: Client | None
+query_logger = QueryLogger(create_sinks_from_environment())
 
-if url and key:
-    supabase = create_client(url, key)
-else:
-    supabase = None
+# Give the writer a chance to write the remaining events when the process exits
+atexit.register(query_logger.flush, timeout=5.0)
 
 
-def log_query(query_type, params):
-    """Send query logs to Supabase."""
-    if supabase:
-        supabase.table("WestieMusicDatabase").insert({
-            "query_type": query_type,
-            "params": params,
-        }).execute()
+def log_query(
+    query_type: str,
+    params: dict[str, Any],
+    *,
+    latency_seconds: float | None = None,
+    result_size: int | None = None,
+    plan: str | None = None,
+    error: str | None = None,
+):
+    """Log a query to the configured sinks (without blocking)."""
+    query_logger.log(QueryEvent(
+        query_type=query_type,
+        params=params,
+        latency_seconds=latency_seconds,
+        result_size=result_size,
+        plan=plan,
+        error=error,
+    ))
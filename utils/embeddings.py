@@ -0,0 +1,184 @@
+"""
+Song embeddings based on which songs occur together in playlists, for "songs like this" lookups.
+
+At build time, `compute_track_embeddings` weights the playlist x track matrix via
+positive pointwise mutual information (PPMI), and reduces it via truncated SVD, so that
+songs occurring in similar playlists end up with similar (unit length) vectors. The
+vectors are stored as float16 (bit patterns in a `UInt16` array column), together
+with the cluster of every song, sorted by cluster.
+
+At runtime, `SimilarityIndex` implements an inverted file (IVF) index over these
+clusters: a lookup only compares the query with the songs of the `probes` clusters
+whose centroids are closest to it, instead of with all songs.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import math
+
+import numpy as np
+import polars as pl
+
+from utils.tables import PlaylistTrack, Track, TrackEmbedding
+
+EMBEDDING_DIMENSIONS: int = 64
+
+MIN_PLAYLIST_COUNT: int = 3
+"""Songs in fewer playlists than this do not get an embedding, as there is not enough data for them."""
+
+CONTEXT_SMOOTHING: float = 0.75
+"""Exponent applied to the playlist sizes, which reduces the PMI bias towards rare playlists."""
+
+KMEANS_ITERATIONS: int = 10
+DEFAULT_PROBES: int = 32
+"""The number of clusters (closest to the query) whose songs are compared with the query."""
+
+SIMILARITY: str = 'similarity'
+
+
+def compute_track_embeddings(playlist_tracks: pl.LazyFrame, *, dimensions: int = EMBEDDING_DIMENSIONS) -> pl.DataFrame:
+    """Compute the embeddings of all songs in at least `MIN_PLAYLIST_COUNT` playlists (see the module docstring)."""
+    # Only needed at build time, so we do not require SciPy for running the app
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.linalg import svds
+
+    entries = playlist_tracks\
+        .select(PlaylistTrack.Track.id, PlaylistTrack.Playlist.id)\
+        .unique()\
+        .filter(pl.len().over(PlaylistTrack.Track.id) >= MIN_PLAYLIST_COUNT)\
+        .with_columns(pl.col(PlaylistTrack.Track.id).rank('dense').cast(pl.Int64).sub(1).alias('row'),
+                      pl.col(PlaylistTrack.Playlist.id).rank('dense').cast(pl.Int64).sub(1).alias('column'))\
+        .collect()
+
+    track_ids = entries.select(PlaylistTrack.Track.id, 'row').unique('row').sort('row')[PlaylistTrack.Track.id]
+    rows, columns = entries['row'].to_numpy(), entries['column'].to_numpy()
+    row_count, column_count = len(track_ids), int(columns.max()) + 1 if len(columns) > 0 else 0
+    if row_count <= dimensions or column_count <= dimensions:
+        print(f"Warning: Not enough data to compute {dimensions}-dimensional embeddings")
+        return pl.DataFrame(schema={TrackEmbedding.Track.id: pl.String,
+                                    TrackEmbedding.cluster: pl.UInt32,
+                                    TrackEmbedding.vector: pl.Array(pl.UInt16, dimensions)})
+
+    # PPMI(track, playlist) = max(0, log(P(track, playlist) / (P(track) * P_smoothed(playlist))))
+    track_sizes = np.bincount(rows, minlength=row_count).astype(np.float64)
+    playlist_sizes = np.bincount(columns, minlength=column_count).astype(np.float64) ** CONTEXT_SMOOTHING
+    pmi = np.log(playlist_sizes.sum() / (track_sizes[rows] * playlist_sizes[columns]))
+    is_positive = pmi > 0
+    ppmi = csr_matrix((pmi[is_positive], (rows[is_positive], columns[is_positive])),
+                      shape=(row_count, column_count))
+
+    left, singular_values, _ = svds(ppmi, k=dimensions, random_state=0)
+    vectors = left * np.sqrt(singular_values)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    # Renumber the clusters, so there are no empty ones
+    _, clusters = np.unique(_kmeans(vectors.astype(np.float32), cluster_count=max(1, math.isqrt(row_count))),
+                            return_inverse=True)
+    return pl.DataFrame({
+        TrackEmbedding.Track.id: track_ids,
+        TrackEmbedding.cluster: pl.Series(clusters, dtype=pl.UInt32),
+        TrackEmbedding.vector: pl.Series(vectors.astype(np.float16).view(np.uint16))
+        .cast(pl.Array(pl.UInt16, dimensions)),
+    }).sort(TrackEmbedding.cluster, TrackEmbedding.Track.id)
+
+
+def _kmeans(vectors: np.ndarray, *, cluster_count: int) -> np.ndarray:
+    """Cluster unit length vectors by cosine similarity (spherical k-means), returning the cluster of every vector."""
+    rng = np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), size=min(cluster_count, len(vectors)), replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        clusters = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, clusters, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Keep the previous centroid for empty clusters
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return np.argmax(vectors @ centroids.T, axis=1)
+
+
+@dataclass(slots=True)
+class SimilarityIndex:
+    """Approximate nearest neighbour lookups over the song embeddings, see the module docstring."""
+
+    track_ids: pl.Series
+    """The `track.id` of every embedding, sorted by cluster."""
+
+    vectors: np.ndarray
+    """The (unit length) float16 embeddings, in the same order as `track_ids`."""
+
+    cluster_offsets: np.ndarray
+    """The embeddings of cluster `i` are stored at `cluster_offsets[i]:cluster_offsets[i + 1]`."""
+
+    centroids: np.ndarray
+    """The (unit length) mean embedding of every cluster."""
+
+    sorted_track_ids: pl.Series
+    """All track IDs in sorted order, for looking up the position of a track via binary search."""
+
+    sorted_positions: np.ndarray
+    """The position in `track_ids` of every track in `sorted_track_ids`."""
+
+    def positions_of(self, track_ids: pl.Series) -> np.ndarray:
+        """Map track IDs to their positions, skipping tracks without an embedding."""
+        track_ids = track_ids.cast(pl.String).drop_nulls().unique()
+        found = self.sorted_track_ids.search_sorted(track_ids).to_numpy().astype(np.int64)
+        is_found = found < len(self.sorted_track_ids)
+        is_found[is_found] = (self.sorted_track_ids.gather(found[is_found]) ==
+                              track_ids.filter(pl.Series(is_found))).to_numpy()
+        return self.sorted_positions[found[is_found]]
+
+    def find_similar(self, track_ids: pl.Series, *, limit: int = 20, probes: int = DEFAULT_PROBES) -> pl.DataFrame:
+        """
+        Find the songs most similar to the given ones (i.e. to the mean of their embeddings),
+        excluding the given songs themselves. Returns the `track.id` and the (cosine) `similarity`.
+        """
+        positions = self.positions_of(track_ids)
+        if len(positions) == 0 or len(self.centroids) == 0:
+            return pl.DataFrame({Track.id: pl.Series([], dtype=pl.String),
+                                 SIMILARITY: pl.Series([], dtype=pl.Float32)})
+
+        query = self.vectors[positions].astype(np.float32).mean(axis=0)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        probes = min(probes, len(self.centroids))
+        clusters = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        candidates = np.concatenate([np.arange(self.cluster_offsets[cluster], self.cluster_offsets[cluster + 1])
+                                     for cluster in clusters])
+        candidates = candidates[~np.isin(candidates, positions)]
+
+        similarities = self.vectors[candidates].astype(np.float32) @ query
+        if len(candidates) > limit:
+            best = np.argpartition(-similarities, limit - 1)[:limit]
+            candidates, similarities = candidates[best], similarities[best]
+
+        return pl.DataFrame({
+            Track.id: self.track_ids.gather(candidates),
+            SIMILARITY: pl.Series(similarities, dtype=pl.Float32),
+        }).sort(SIMILARITY, descending=True)
+
+    @staticmethod
+    def from_frame(embeddings: pl.DataFrame) -> SimilarityIndex:
+        """Create the index from the output of `compute_track_embeddings` (which must be sorted by cluster)."""
+        track_ids = embeddings[TrackEmbedding.Track.id]
+        clusters = embeddings[TrackEmbedding.cluster].to_numpy().astype(np.int64)
+        vectors = embeddings[TrackEmbedding.vector].to_numpy().astype(np.uint16).view(np.float16)\
+            if len(embeddings) > 0 else np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float16)
+
+        cluster_count = int(clusters.max()) + 1 if len(clusters) > 0 else 0
+        cluster_offsets = np.concatenate([[0], np.cumsum(np.bincount(clusters, minlength=cluster_count))])
+
+        centroids = np.add.reduceat(vectors.astype(np.float32), cluster_offsets[:-1], axis=0)\
+            if len(vectors) > 0 else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        order = track_ids.arg_sort().to_numpy()
+        return SimilarityIndex(
+            track_ids=track_ids,
+            vectors=vectors,
+            cluster_offsets=cluster_offsets,
+            centroids=centroids,
+            sorted_track_ids=track_ids.gather(order),
+            sorted_positions=order)
+
+    @staticmethod
+    def load(file_name: str) -> SimilarityIndex:
+        return SimilarityIndex.from_frame(pl.read_parquet(file_name))
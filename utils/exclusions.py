@@ -0,0 +1,88 @@
+"""
+Cached track sets for the `playlist_exclude` filter.
+
+Excluding e.g. 'blues' removes every song that appears in *any* playlist whose
+name contains "blues". Finding those songs means scanning the names of all playlists
+and joining the matches with all playlist entries, which used to be repeated for
+every query. `ExclusionCache` instead keeps the resulting track IDs as a sorted
+array per exclude term (so that combined excludes like 'blues,zouk' reuse them),
+keyed by the normalized term and the dataset version. The most common excludes
+are computed once when the data is loaded.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from threading import Lock
+
+import polars as pl
+
+from utils.common.filters import create_text_filter, parse_filter_values
+from utils.tables import Playlist, Track
+
+COMMON_EXCLUDES: list[str] = ['blues', 'zouk', 'lindy']
+"""The `playlist_exclude` terms to precompute when the data is loaded."""
+
+DEFAULT_EXCLUSION_CACHE_SIZE: int = 64
+
+
+def normalize_exclude_terms(playlist_exclude: str | list[str]) -> list[str]:
+    """The distinct (lowercased) terms of a `playlist_exclude` filter, in a canonical order."""
+    return sorted(set(parse_filter_values(playlist_exclude)))
+
+
+class ExclusionCache:
+    """A thread-safe LRU cache of the tracks to exclude for recent `playlist_exclude` filters."""
+
+    def __init__(
+        self,
+        playlists: pl.LazyFrame,
+        playlist_tracks: pl.LazyFrame,
+        *,
+        version: str,
+        max_entries: int = DEFAULT_EXCLUSION_CACHE_SIZE,
+    ):
+        self.playlists = playlists
+        self.playlist_tracks = playlist_tracks
+        self.version = version
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], pl.Series] = OrderedDict()
+        self._lock = Lock()
+
+    def excluded_track_ids(self, playlist_exclude: str | list[str]) -> pl.Series:
+        """Return the sorted IDs of all tracks that appear in any playlist matching the exclude filter."""
+        terms = normalize_exclude_terms(playlist_exclude)
+        if len(terms) == 1:
+            return self.excluded_track_ids_for_term(terms[0])
+
+        # Cache each term separately, so that e.g. 'blues,zouk' can reuse the sets for 'blues' and 'zouk'
+        return pl.concat([self.excluded_track_ids_for_term(term) for term in terms]
+                         or [pl.Series(Track.id, [], dtype=pl.String)])\
+            .unique()\
+            .sort()
+
+    def excluded_track_ids_for_term(self, term: str) -> pl.Series:
+        key = (term, self.version)
+        with self._lock:
+            track_ids = self._entries.get(key)
+            if track_ids is not None:
+                self._entries.move_to_end(key)
+                return track_ids
+
+        # Computed outside of the lock, so that a slow exclude doesn't block the other queries
+        track_ids = self.playlists\
+            .filter(create_text_filter([term], Playlist.name))\
+            .select(Playlist.id)\
+            .join(self.playlist_tracks.select(Playlist.id, Track.id), how='inner', on=Playlist.id)\
+            .select(pl.col(Track.id).unique().sort())\
+            .collect()[Track.id]
+
+        with self._lock:
+            self._entries[key] = track_ids
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return track_ids
+
+    def precompute(self, excludes: list[str] = COMMON_EXCLUDES):
+        """Fill the cache with the given (common) `playlist_exclude` terms."""
+        for playlist_exclude in excludes:
+            self.excluded_track_ids(playlist_exclude)
@@ -0,0 +1,99 @@
+"""
+Introspection of `SearchEngine` queries, see `SearchEngine.explain` and `SearchEngine.profile`.
+
+While a query is being built with tracing enabled, `CombinedFilter.apply_filters`
+(and the `find_*` methods not based on it) record the filter order they chose
+and the LazyFrames of their intermediate stages into a `QueryTrace`. Explaining a
+query only renders its plan, while profiling additionally executes the final query
+(via `LazyFrame.profile`) as well as the recorded stages to count their rows. Only the
+stages that actually filter the data are recorded.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+import polars as pl
+
+
+class Stage(StrEnum):
+    Playlists = 'PlaylistSet'
+    PlaylistTracks = 'PlaylistTrackSet'
+    Tracks = 'TrackSet'
+    Lyrics = 'TrackLyricsSet'
+
+
+@dataclass(slots=True)
+class QueryTrace:
+    """Collects information about a query while it is being built."""
+
+    filter_order: str | None = None
+    """The `FilterOrder` (or custom list of `FilterType`s) used for filtering, if any."""
+
+    stages: dict[Stage, pl.LazyFrame] = field(default_factory=dict)
+    """The rows flowing out of each of the filter stages."""
+
+    notes: list[str] = field(default_factory=list)
+    """Other decisions made while building the query (e.g. choosing top-K evaluation)."""
+
+    def record_filter_order(self, order: object):
+        self.filter_order = ', '.join(order) if isinstance(order, list) else str(order)
+
+    def record_stages(self, stages: dict[Stage, pl.LazyFrame | None]):
+        self.stages.update({stage: frame for stage, frame in stages.items() if frame is not None})
+
+
+@dataclass(slots=True)
+class QueryExplanation:
+    """The plan chosen for a query, see `SearchEngine.explain`."""
+
+    method: str
+    """The `find_*` method that has been called."""
+
+    filter_order: str | None
+    """The filter order chosen by `CombinedFilter.get_optimal_filter_order`, if any."""
+
+    notes: list[str]
+    """Other decisions made while building the query."""
+
+    plan: str
+    """The optimized Polars plan of the final query."""
+
+    def __str__(self) -> str:
+        return '\n'.join([
+            f'Method: {self.method}',
+            f'Filter order: {self.filter_order or "-"}',
+            *(f'Note: {note}' for note in self.notes),
+            '',
+            self.plan,
+        ])
+
+
+@dataclass(slots=True)
+class QueryProfile:
+    """The plan & execution statistics of a query, see `SearchEngine.profile`."""
+
+    explanation: QueryExplanation
+    """The plan of the query."""
+
+    build_seconds: float
+    """Time spent building the query (including any eager evaluation, e.g. for top-K queries)."""
+
+    node_timings: pl.DataFrame
+    """The `node`, `start` and `end` (in microseconds) of every node of the plan, from `LazyFrame.profile`."""
+
+    stage_row_counts: dict[Stage, int]
+    """The number of rows flowing out of each of the filter stages."""
+
+    result_row_count: int
+    """The number of rows of the final result."""
+
+    def __str__(self) -> str:
+        return '\n'.join([
+            str(self.explanation),
+            '',
+            f'Build time: {self.build_seconds:.3f}s',
+            *(f'{stage}: {count:,} rows' for stage, count in self.stage_row_counts.items()),
+            f'Result: {self.result_row_count:,} rows',
+            '',
+            str(self.node_timings),
+        ])
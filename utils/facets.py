@@ -0,0 +1,161 @@
+"""
+Bitmap indexes over the low-cardinality "facet" columns of the playlist and track tables.
+
+Every row of an indexed table is identified by its dense row number within the
+(sorted) Parquet file. For each distinct value of a facet column, we store the
+set of rows having that value as a `RoaringBitmap`, so that combinations of facet
+filters can be evaluated via bitmap AND/OR/ANDNOT operations before any row data
+is read. The resulting row set is then translated back into IDs, which allows the
+actual scan to skip row groups based on the Parquet statistics of the sorted ID column.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Literal
+
+import polars as pl
+
+from utils.common.bitmaps import RoaringBitmap, union_all
+from utils.common.filters import parse_filter_values
+
+_ROW: str = '__row'
+
+
+@dataclass(slots=True)
+class FacetColumn:
+    """The bitmap index for a single facet column."""
+
+    values: dict[str | bool, RoaringBitmap]
+    """Maps each (lowercased) value to the rows containing it."""
+
+    nulls: RoaringBitmap
+    """The rows where the column is null."""
+
+    empty: RoaringBitmap
+    """The rows where the column is an empty list (only used for list columns)."""
+
+    def match_exact(self, terms: list[str]) -> RoaringBitmap:
+        """Rows with at least one value equal to any of the (lowercased) terms."""
+        return union_all(self.values[term] for term in terms if term in self.values)
+
+    def match_contains(self, terms: list[str]) -> RoaringBitmap:
+        """Rows with at least one value containing any of the (lowercased) terms."""
+        return union_all(rows for value, rows in self.values.items()
+                         if isinstance(value, str) and any(term in value for term in terms))
+
+    def match_true(self) -> RoaringBitmap:
+        """Rows where the (boolean) column is true."""
+        return self.values.get(True, RoaringBitmap())
+
+    def match_missing(self) -> RoaringBitmap:
+        """Rows where the column is null or an empty list."""
+        return self.nulls | self.empty
+
+
+@dataclass(slots=True)
+class FacetIndex:
+    """Bitmap indexes for the facet columns of a single table."""
+
+    ids: pl.Series
+    """Maps dense row numbers to the IDs of the rows."""
+
+    columns: dict[str, FacetColumn]
+    """The indexes of the individual facet columns."""
+
+    @property
+    def all_rows(self) -> RoaringBitmap:
+        return RoaringBitmap.full(len(self.ids))
+
+    def __getitem__(self, column: str) -> FacetColumn:
+        return self.columns[column]
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def match_text(
+        self,
+        column: str,
+        filter_expression: str | list[str] | None,
+        *,
+        match_mode: Literal['exact', 'contains'] = 'contains',
+        no_value: str = '',
+    ) -> RoaringBitmap | None:
+        """Bitmap equivalent of `create_text_filter(...)`. Returns `None` if there is nothing to filter by."""
+        values = parse_filter_values(filter_expression)
+        if not values:
+            return None
+
+        facet = self.columns[column]
+        if no_value and no_value.lower() in values:
+            return facet.match_missing()
+        elif match_mode == 'exact':
+            return facet.match_exact(values)
+        elif match_mode == 'contains':
+            return facet.match_contains(values)
+        else:
+            raise ValueError(f'Invalid match mode: {match_mode}')
+
+    def exclude_text(
+        self,
+        column: str,
+        filter_expression: str | list[str] | None,
+        *,
+        match_mode: Literal['exact', 'contains'] = 'contains',
+        no_value: str = '',
+    ) -> RoaringBitmap | None:
+        """Bitmap equivalent of `~create_text_filter(...)`. Returns `None` if there is nothing to filter by."""
+        matched = self.match_text(column, filter_expression, match_mode=match_mode, no_value=no_value)
+        if matched is None:
+            return None
+
+        # Just like the row-wise filter, never keep rows where the column is null
+        return self.all_rows - matched - self.columns[column].nulls
+
+    def id_filter(self, rows: RoaringBitmap) -> pl.Expr:
+        """Create a filter expression that only keeps the rows from the given bitmap."""
+        row_count = len(rows)
+        id_column = pl.col(self.ids.name)
+
+        # Whichever side is smaller results in the cheaper membership test
+        if row_count <= len(self.ids) // 2:
+            return id_column.is_in(self.ids.gather(rows.to_rows()).implode())
+        else:
+            return id_column.is_in(self.ids.gather((self.all_rows - rows).to_rows()).implode()).not_()
+
+    @staticmethod
+    def build(data: pl.LazyFrame, *, id_column: str, facet_columns: list[str]) -> FacetIndex:
+        """Build the bitmap indexes for the given columns of `data`."""
+        schema = data.collect_schema()
+        facet_columns = [column for column in facet_columns if column in schema]
+        rows = data\
+            .select(id_column, *facet_columns)\
+            .with_row_index(_ROW)\
+            .collect(engine='streaming')
+
+        columns: dict[str, FacetColumn] = {}
+        for column in facet_columns:
+            dtype = schema[column]
+            values = rows.select(_ROW, pl.col(column))
+
+            nulls = RoaringBitmap.from_rows(values.filter(pl.col(column).is_null())[_ROW])
+            empty = RoaringBitmap()
+
+            if isinstance(dtype, pl.List):
+                empty = RoaringBitmap.from_rows(values.filter(pl.col(column).list.len().eq(0))[_ROW])
+                values = values.explode(column)
+
+            if dtype == pl.Boolean:
+                values = values.filter(pl.col(column))
+            else:
+                values = values.with_columns(pl.col(column).cast(pl.String).str.to_lowercase())
+
+            columns[column] = FacetColumn(
+                values={value: RoaringBitmap.from_rows(group_rows)
+                        for value, group_rows in values
+                        .drop_nulls(column)
+                        .group_by(column)
+                        .agg(pl.col(_ROW))
+                        .iter_rows()},
+                nulls=nulls,
+                empty=empty)
+
+        return FacetIndex(ids=rows[id_column], columns=columns)
@@ -0,0 +1,198 @@
+"""
+Typo-tolerant lookup of songs, artists and DJs by name.
+
+Names are normalized (lowercase, without accents and punctuation) and split into
+words. Misspelled query words are resolved via a SymSpell-style deletion dictionary:
+every word of the vocabulary is stored under all strings that can be obtained by
+deleting up to `max_edit_distance(word)` of its (first `PREFIX_LENGTH`) characters. The words within the
+edit distance budget of a query word share at least one such deletion with it, so
+only the words found under the deletions of the query word need to be compared.
+
+A name matches a query if every query word matches one of its words. Matches are
+ranked by their total edit distance, and then by popularity.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from bisect import bisect_left
+import re
+import unicodedata
+
+import numpy as np
+import polars as pl
+
+DEFAULT_CANDIDATE_LIMIT: int = 20
+
+PREFIX_LENGTH: int = 7
+"""As in SymSpell, only the deletions of the first characters of each word are stored, which keeps the dictionary small."""
+
+EDIT_DISTANCE: str = 'edit_distance'
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase the name, and remove accents & punctuation (e.g. "Beyoncé - Halo" => "beyonce halo")."""
+    decomposed = unicodedata.normalize('NFKD', name.lower())
+    return ' '.join(re.findall(r'\w+', ''.join(c for c in decomposed if not unicodedata.combining(c))))
+
+
+def name_words(names: pl.Expr) -> pl.Expr:
+    """The words of the normalized names (like `normalize_name(name).split()`, but for a whole column)."""
+    return names\
+        .str.to_lowercase()\
+        .str.normalize('NFKD')\
+        .str.replace_all(r'\p{M}', '')\
+        .str.extract_all(r'\w+')
+
+
+def max_edit_distance(word: str) -> int:
+    """The number of typos tolerated in a word, depending on its length."""
+    return 0 if len(word) <= 3 else 1 if len(word) <= 6 else 2
+
+
+def _deletions(word: str, distance: int) -> set[str]:
+    """All strings that can be obtained by deleting up to `distance` characters from the word."""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {deleted[:i] + deleted[i + 1:] for deleted in frontier for i in range(len(deleted))}
+        result |= frontier
+    return result
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """The optimal string alignment distance (Levenshtein distance plus transpositions)."""
+    previous2: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
+
+
+@dataclass(slots=True)
+class FuzzyIndex:
+    """Typo-tolerant lookup of entries (songs, artists or DJs) by name, see the module docstring."""
+
+    entries: pl.DataFrame
+    """The ID, name and popularity of every entry."""
+
+    id_column: str
+    name_column: str
+    popularity: np.ndarray
+
+    words: list[str]
+    """The distinct words of all normalized names, sorted."""
+
+    word_offsets: np.ndarray
+    """The entries containing `words[i]` are stored at `word_entries[word_offsets[i]:word_offsets[i + 1]]`."""
+
+    word_entries: np.ndarray
+
+    deletion_keys: pl.Series
+    """All deletions of all words, sorted (and repeated once per word they were obtained from)."""
+
+    deletion_words: np.ndarray
+    """The word (index into `words`) every deletion in `deletion_keys` was obtained from."""
+
+    def find_words(self, query_word: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the vocabulary words within the edit distance budget of the query word, and their distances."""
+        budget = max_edit_distance(query_word)
+        deletions = pl.Series(sorted(_deletions(query_word[:PREFIX_LENGTH], budget)), dtype=pl.String)
+        starts = self.deletion_keys.search_sorted(deletions, side='left').to_numpy()
+        stops = self.deletion_keys.search_sorted(deletions, side='right').to_numpy()
+        candidates = set(np.concatenate([self.deletion_words[start:stop] for start, stop in zip(starts, stops)]
+                                        or [np.zeros(0, dtype=np.int64)]).tolist())
+
+        words, distances = [], []
+        for word in candidates:
+            distance = _edit_distance(query_word, self.words[word])
+            if distance <= budget:
+                words.append(word)
+                distances.append(distance)
+        return np.array(words, dtype=np.int64), np.array(distances, dtype=np.int64)
+
+    def contains_words(self, query: str) -> bool:
+        """Return whether every word of the query is (exactly) a word of some name, i.e. needs no correction."""
+        def contains_word(word: str) -> bool:
+            i = bisect_left(self.words, word)
+            return i < len(self.words) and self.words[i] == word
+
+        return all(contains_word(word) for word in normalize_name(query).split())
+
+    def find(self, query: str, *, limit: int | None = DEFAULT_CANDIDATE_LIMIT) -> pl.DataFrame:
+        """
+        Return the entries whose names (approximately) contain all words of the query, with their
+        total `edit_distance`, sorted by edit distance and then by popularity.
+        """
+        query_words = normalize_name(query).split()
+        total_distances = np.zeros(len(self.entries)) if query_words else np.full(len(self.entries), np.inf)
+
+        for query_word in dict.fromkeys(query_words):
+            words, distances = self.find_words(query_word)
+
+            # The best match of the query word within every entry
+            starts, stops = self.word_offsets[words], self.word_offsets[words + 1]
+            entries = np.concatenate([self.word_entries[start:stop] for start, stop in zip(starts, stops)]
+                                     or [np.zeros(0, dtype=np.int64)])
+            best_distances = np.full(len(self.entries), np.inf)
+            np.minimum.at(best_distances, entries, np.repeat(distances, stops - starts).astype(np.float64))
+            total_distances += best_distances
+
+        matches = np.flatnonzero(np.isfinite(total_distances))
+        order = np.lexsort((-self.popularity[matches], total_distances[matches]))
+        matches = matches[order[:limit] if limit is not None else order]
+
+        return self.entries[matches]\
+            .with_columns(pl.Series(EDIT_DISTANCE, total_distances[matches], dtype=pl.UInt32))
+
+    @staticmethod
+    def build(entries: pl.DataFrame, *, id_column: str, name_column: str, popularity_column: str) -> FuzzyIndex:
+        """Create the index for the given entries, which need an ID, a name and a popularity column."""
+        entries = entries\
+            .select(id_column, name_column, pl.col(popularity_column).fill_null(0))\
+            .filter(pl.col(name_column).is_not_null())
+
+        entry_words = entries\
+            .with_row_index('entry')\
+            .select('entry', name_words(pl.col(name_column)).alias('words'))\
+            .explode('words')\
+            .drop_nulls()\
+            .unique()\
+            .sort('words', 'entry')
+
+        word_counts = entry_words.group_by('words', maintain_order=True).len()
+        words: list[str] = word_counts['words'].to_list()
+
+        # Generate all deletions of all words at once, one column slice per deleted position (pair)
+        prefixes = pl.DataFrame({
+            'word': pl.Series(range(len(words)), dtype=pl.Int64),
+            'key': [word[:PREFIX_LENGTH] for word in words],
+            'budget': [max_edit_distance(word) for word in words],
+        })
+        key = pl.col('key')
+        deletions = [prefixes.select('word', 'key')]
+        for i in range(PREFIX_LENGTH):
+            deletions.append(prefixes
+                             .filter(pl.col('budget').ge(1), key.str.len_chars().gt(i))
+                             .select('word', (key.str.slice(0, i) + key.str.slice(i + 1)).alias('key')))
+            for j in range(i + 1, PREFIX_LENGTH):
+                deletions.append(prefixes
+                                 .filter(pl.col('budget').ge(2), key.str.len_chars().gt(j))
+                                 .select('word', (key.str.slice(0, i) + key.str.slice(i + 1, j - i - 1)
+                                                  + key.str.slice(j + 1)).alias('key')))
+        deletions = pl.concat(deletions).unique().sort('key', 'word')
+
+        return FuzzyIndex(
+            entries=entries,
+            id_column=id_column,
+            name_column=name_column,
+            popularity=entries[popularity_column].cast(pl.Float64).to_numpy(),
+            words=words,
+            word_offsets=np.concatenate([[0], np.cumsum(word_counts['len'].to_numpy())]).astype(np.int64),
+            word_entries=entry_words['entry'].to_numpy().astype(np.int64),
+            deletion_keys=deletions['key'],
+            deletion_words=deletions['word'].to_numpy())
@@ -0,0 +1,328 @@
+"""
+In-memory graph of the transitions between songs, built from `data_song_adjacent.parquet`.
+
+Every track that appears in the adjacency table becomes a node (numbered by the sorted
+`track.id`s), and every pair of songs played directly after each other becomes an edge
+weighted by the number of playlists containing that transition. The edges are stored
+in compressed sparse row (CSR) form, i.e. the outgoing edges of node `i` are
+`neighbours[offsets[i]:offsets[i + 1]]`, sorted by descending weight.
+
+On top of that, `TransitionGraph` answers the following queries for a set of seed tracks:
+
+- `expand`: All tracks within N transitions, with their distance and connection strength.
+- `personalized_pagerank`: Tracks "in the orbit" of the seeds, i.e. the ones a random
+  walk through the playlists starting at the seeds visits most often. Computed via
+  (vectorized) forward push, so only the neighbourhood of the seeds is ever touched.
+- `strongest_path`: The most likely chain of transitions from one track to another.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Literal
+import heapq
+import math
+
+import numpy as np
+import polars as pl
+
+from utils.tables import Stats, Track, TrackAdjacent
+
+type Direction = Literal['any', 'prev', 'next']
+
+DEFAULT_ALPHA: float = 0.15
+"""The probability of the random walk jumping back to the seeds at each step."""
+
+DEFAULT_TOLERANCE: float = 1e-5
+"""Stop pushing the probability mass of a node once its residual per outgoing edge drops below this value."""
+
+MAX_PUSH_ROUNDS: int = 100
+MAX_VISITED_NODES: int = 100_000
+
+HOPS: str = 'hops'
+ORBIT_SCORE: str = 'orbit_score'
+TRANSITION_PROBABILITY: str = 'transition_probability'
+PATH_STEP: str = 'path_step'
+
+
+@dataclass(slots=True)
+class CsrAdjacency:
+    """The weighted edges of a directed graph in compressed sparse row form."""
+
+    offsets: np.ndarray
+    """The outgoing edges of node `i` are stored at `offsets[i]:offsets[i + 1]`."""
+
+    neighbours: np.ndarray
+    """The target node of every edge."""
+
+    weights: np.ndarray
+    """The weight of every edge, i.e. how many playlists contain the transition."""
+
+    probabilities: np.ndarray
+    """The weight of every edge divided by the total weight of the outgoing edges of its source."""
+
+    def gather(self, nodes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the index into `nodes` of the source of each outgoing edge of `nodes`, and the edge indexes."""
+        starts = self.offsets[nodes]
+        lengths = self.offsets[nodes + 1] - starts
+        sources = np.repeat(np.arange(len(nodes)), lengths)
+        edge_starts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return sources, edge_starts + np.arange(len(sources))
+
+    @staticmethod
+    def from_edges(sources: np.ndarray, targets: np.ndarray, weights: np.ndarray, *, node_count: int) -> CsrAdjacency:
+        order = np.lexsort((-weights.astype(np.int64), sources))
+        sources, targets, weights = sources[order], targets[order], weights[order]
+
+        out_degree = np.bincount(sources, minlength=node_count)
+        out_weight = np.bincount(sources, weights=weights, minlength=node_count)
+        return CsrAdjacency(
+            offsets=np.concatenate([[0], np.cumsum(out_degree)]),
+            neighbours=targets,
+            weights=weights,
+            probabilities=weights / out_weight[sources])
+
+
+@dataclass(slots=True)
+class TransitionGraph:
+    """The transitions between songs, see the module docstring."""
+
+    track_ids: pl.Series
+    """The (sorted) `track.id` of every node."""
+
+    next: CsrAdjacency
+    """Edges from each track to the tracks played after it."""
+
+    prev: CsrAdjacency
+    """Edges from each track to the tracks played before it."""
+
+    any: CsrAdjacency
+    """Edges in both directions, with the weights of both directions summed up."""
+
+    def adjacency(self, direction: Direction) -> CsrAdjacency:
+        match direction:
+            case 'next':
+                return self.next
+            case 'prev':
+                return self.prev
+            case 'any':
+                return self.any
+            case _:
+                raise ValueError(f'Invalid value for direction: {direction}')
+
+    def node_of(self, track_id: str) -> int | None:
+        """Map a track ID to its node, or `None` if the track is not part of the graph."""
+        position = self.track_ids.search_sorted(track_id)
+        if position < len(self.track_ids) and self.track_ids[position] == track_id:
+            return position
+        return None
+
+    def node_indexes(self, track_ids: pl.Series) -> np.ndarray:
+        """Map track IDs to nodes (in the same order), using -1 for tracks that are not part of the graph."""
+        track_ids = track_ids.cast(pl.String)
+        positions = self.track_ids.search_sorted(track_ids).to_numpy().astype(np.int64)
+        is_found = positions < len(self.track_ids)
+        is_found[is_found] = (self.track_ids.gather(positions[is_found]) == track_ids.filter(pl.Series(is_found)))\
+            .fill_null(False)\
+            .to_numpy()
+        return np.where(is_found, positions, -1)
+
+    def nodes_of(self, track_ids: pl.Series) -> np.ndarray:
+        """Map track IDs to nodes, skipping duplicates and tracks that are not part of the graph."""
+        nodes = self.node_indexes(track_ids.drop_nulls().unique())
+        return nodes[nodes >= 0]
+
+    def top_edges(self, limit: int) -> pl.DataFrame:
+        """The `limit` most frequent transitions (like sorting the adjacency table, without sorting all of it)."""
+        weights = self.next.weights
+        limit = min(limit, len(weights))
+        edges = np.argpartition(-weights.astype(np.int64), limit - 1)[:limit] if limit > 0 else np.array([], dtype=np.int64)
+        sources = np.searchsorted(self.next.offsets, edges, side='right') - 1
+        return pl.DataFrame({
+            TrackAdjacent.FirstTrack.id: self.track_ids.gather(sources),
+            TrackAdjacent.SecondTrack.id: self.track_ids.gather(self.next.neighbours[edges]),
+            TrackAdjacent.times_played_together: pl.Series(weights[edges], dtype=pl.UInt32),
+        }).sort(TrackAdjacent.times_played_together, descending=True)
+
+    def expand(
+        self,
+        seed_track_ids: pl.Series,
+        *,
+        direction: Direction = 'any',
+        hops: int = 2,
+        limit_per_hop: int | None = None,
+    ) -> pl.DataFrame:
+        """
+        Find all tracks within `hops` transitions of the seeds (excluding the seeds themselves).
+
+        Returns the `track.id`, the number of `hops` to the closest seed, and the total
+        `times_played_together` with the tracks one hop closer to the seeds. With
+        `limit_per_hop`, only the strongest connected tracks of each hop are expanded further.
+        """
+        adjacency = self.adjacency(direction)
+        distance = np.full(len(self.track_ids), -1, dtype=np.int32)
+        frontier = self.nodes_of(seed_track_ids)
+        distance[frontier] = 0
+
+        found_nodes, found_hops, found_weights = [], [], []
+        for hop in range(1, hops + 1):
+            _, edges = adjacency.gather(frontier)
+            totals = np.bincount(adjacency.neighbours[edges], weights=adjacency.weights[edges],
+                                 minlength=len(self.track_ids))
+            nodes = np.flatnonzero((totals > 0) & (distance < 0))
+            totals = totals[nodes]
+
+            if limit_per_hop is not None and len(nodes) > limit_per_hop:
+                strongest = np.argpartition(-totals, limit_per_hop - 1)[:limit_per_hop]
+                nodes, totals = nodes[strongest], totals[strongest]
+
+            distance[nodes] = hop
+            found_nodes.append(nodes)
+            found_hops.append(np.full(len(nodes), hop, dtype=np.int32))
+            found_weights.append(totals)
+            frontier = nodes
+
+        nodes = np.concatenate(found_nodes) if found_nodes else np.array([], dtype=np.int64)
+        return pl.DataFrame({
+            Track.id: self.track_ids.gather(nodes),
+            HOPS: np.concatenate(found_hops) if found_hops else np.array([], dtype=np.int32),
+            TrackAdjacent.times_played_together: pl.Series(
+                np.concatenate(found_weights) if found_weights else [], dtype=pl.UInt32),
+        }).sort(HOPS, TrackAdjacent.times_played_together, descending=[False, True])
+
+    def personalized_pagerank(
+        self,
+        seed_track_ids: pl.Series,
+        *,
+        direction: Direction = 'any',
+        alpha: float = DEFAULT_ALPHA,
+        tolerance: float = DEFAULT_TOLERANCE,
+        limit: int | None = 100,
+    ) -> pl.DataFrame:
+        """
+        Rank the tracks by how often a random walk through the transitions, restarting at the
+        seeds with probability `alpha` at every step, visits them (excluding the seeds themselves).
+
+        Instead of iterating over the whole graph, the probability mass is pushed outwards
+        from the seeds, all nodes with a residual above `tolerance` times their number of
+        outgoing edges at once per round. This bounds the total work by roughly
+        `1 / (tolerance * alpha)` edges, independent of the size of the graph.
+        """
+        adjacency = self.adjacency(direction)
+        seeds = self.nodes_of(seed_track_ids)
+        scores = np.zeros(len(self.track_ids))
+        residuals = np.zeros(len(self.track_ids))
+        residuals[seeds] = 1 / max(len(seeds), 1)
+
+        thresholds = tolerance * np.maximum(np.diff(adjacency.offsets), 1)
+        active = seeds
+        for _ in range(MAX_PUSH_ROUNDS):
+            active = active[residuals[active] > thresholds[active]]
+            if len(active) == 0:
+                break
+
+            mass = residuals[active]
+            residuals[active] = 0
+            scores[active] += alpha * mass
+
+            sources, edges = adjacency.gather(active)
+            pushed = np.bincount(adjacency.neighbours[edges],
+                                 weights=(1 - alpha) * mass[sources] * adjacency.probabilities[edges],
+                                 minlength=len(self.track_ids))
+            residuals += pushed
+            active = np.flatnonzero(pushed)
+
+        scores[seeds] = 0
+        ranked = np.flatnonzero(scores)
+        if limit is not None and len(ranked) > limit:
+            ranked = ranked[np.argpartition(-scores[ranked], limit - 1)[:limit]]
+
+        return pl.DataFrame({
+            Track.id: self.track_ids.gather(ranked),
+            ORBIT_SCORE: scores[ranked],
+        }).sort(ORBIT_SCORE, descending=True)
+
+    def strongest_path(
+        self,
+        from_track_id: str,
+        to_track_id: str,
+        *,
+        direction: Direction = 'next',
+        max_visited: int = MAX_VISITED_NODES,
+    ) -> pl.DataFrame | None:
+        """
+        Find the most likely chain of transitions from one track to another, i.e. the path
+        maximizing the product of the transition probabilities. Returns `None` if there is
+        no such path (or it could not be found within `max_visited` visited tracks).
+        """
+        adjacency = self.adjacency(direction)
+        source = self.node_of(from_track_id)
+        target = self.node_of(to_track_id)
+        if source is None or target is None:
+            return None
+
+        # Dijkstra, where the cost of an edge is the negative log of its probability
+        costs: dict[int, float] = {source: 0.0}
+        previous: dict[int, tuple[int, float]] = {}
+        queue = [(0.0, source)]
+        visited: set[int] = set()
+
+        while queue and len(visited) < max_visited:
+            cost, node = heapq.heappop(queue)
+            if node in visited:
+                continue
+            visited.add(node)
+            if node == target:
+                break
+
+            start, end = adjacency.offsets[node], adjacency.offsets[node + 1]
+            for neighbour, probability in zip(adjacency.neighbours[start:end].tolist(),
+                                              adjacency.probabilities[start:end].tolist()):
+                neighbour_cost = cost - math.log(probability)
+                if neighbour_cost < costs.get(neighbour, math.inf):
+                    costs[neighbour] = neighbour_cost
+                    previous[neighbour] = (node, probability)
+                    heapq.heappush(queue, (neighbour_cost, neighbour))
+
+        if target not in visited:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(previous[path[-1]][0])
+        path.reverse()
+
+        return pl.DataFrame({
+            Track.id: self.track_ids.gather(path),
+            TRANSITION_PROBABILITY: pl.Series([None] + [previous[node][1] for node in path[1:]], dtype=pl.Float64),
+        })
+
+    @staticmethod
+    def build(tracks_adjacent: pl.LazyFrame) -> TransitionGraph:
+        """Build the graph from the adjacency table (as stored in `data_song_adjacent.parquet`)."""
+        edges = tracks_adjacent\
+            .select(pl.col(TrackAdjacent.FirstTrack.id).cast(pl.String),
+                    pl.col(TrackAdjacent.SecondTrack.id).cast(pl.String),
+                    pl.col(Stats.playlist_count).alias(TrackAdjacent.times_played_together))\
+            .collect()
+
+        track_ids = pl.concat([edges[TrackAdjacent.FirstTrack.id], edges[TrackAdjacent.SecondTrack.id]])\
+            .unique()\
+            .sort()\
+            .rename(Track.id)
+        first = track_ids.search_sorted(edges[TrackAdjacent.FirstTrack.id]).to_numpy().astype(np.int64)
+        second = track_ids.search_sorted(edges[TrackAdjacent.SecondTrack.id]).to_numpy().astype(np.int64)
+        weights = edges[TrackAdjacent.times_played_together].to_numpy().astype(np.float64)
+        node_count = len(track_ids)
+
+        # Both directions of a pair are separate edges in the adjacency table, so we sum them up
+        pairs = pl.DataFrame({'a': np.concatenate([first, second]),
+                              'b': np.concatenate([second, first]),
+                              'w': np.concatenate([weights, weights])})\
+            .group_by('a', 'b')\
+            .agg(pl.col('w').sum())
+
+        return TransitionGraph(
+            track_ids=track_ids,
+            next=CsrAdjacency.from_edges(first, second, weights, node_count=node_count),
+            prev=CsrAdjacency.from_edges(second, first, weights, node_count=node_count),
+            any=CsrAdjacency.from_edges(pairs['a'].to_numpy(), pairs['b'].to_numpy(), pairs['w'].to_numpy(),
+                                        node_count=node_count))
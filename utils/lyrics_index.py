@@ -0,0 +1,185 @@
+"""
+Ranked lyrics search via BM25, with support for "quoted phrases".
+
+At build time, `compute_lyrics_postings` splits the lyrics of every song into
+lowercase words, and stores one row per (word, song) with the positions of the
+word within the song. At runtime, `LyricsIndex` keeps these postings as flat
+arrays grouped by word, so that looking up a word is a binary search plus a slice.
+
+A query is scored with the usual BM25 formula over its words and phrases, where
+the matches of a phrase are found by intersecting the (song, position) pairs of
+its consecutive words. Songs must contain every quoted phrase, but only one of
+the other words.
+
+Snippets are extracted by `highlight_snippets` (one regex over the lyrics column),
+which should only be applied to the final top rows, not to every match.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import re
+
+import numpy as np
+import polars as pl
+
+from utils.tables import Track, TrackLyrics
+
+WORD_PATTERN: str = r"\w+(?:'\w+)*"
+"""What counts as a word, for both the lyrics and the queries (so that e.g. "don't" is a single word)."""
+
+BM25_K1: float = 1.2
+BM25_B: float = 0.75
+
+SNIPPET_CONTEXT: int = 60
+"""The number of characters to show before & after the first match in a snippet."""
+
+HIGHLIGHT_MARKERS: tuple[str, str] = ('«', '»')
+"""Surround the matches in a snippet (in plain text, as table cells don't render markdown)."""
+
+TERM: str = 'term'
+POSITIONS: str = 'positions'
+LYRICS_SCORE: str = 'lyrics_score'
+LYRICS_SNIPPET: str = 'lyrics_snippet'
+
+
+def compute_lyrics_postings(lyrics: pl.LazyFrame) -> pl.DataFrame:
+    """Split the lyrics into words, returning the positions of every word within every song, sorted by word."""
+    return lyrics\
+        .select(Track.id, pl.col(TrackLyrics.lyrics).str.to_lowercase().str.extract_all(WORD_PATTERN).alias(TERM))\
+        .with_columns(pl.int_ranges(pl.col(TERM).list.len().clip(upper_bound=2 ** 16 - 1),
+                                    dtype=pl.UInt16).alias(POSITIONS))\
+        .explode(TERM, POSITIONS)\
+        .filter(pl.col(TERM).is_not_null())\
+        .group_by(TERM, Track.id)\
+        .agg(pl.col(POSITIONS).sort())\
+        .sort(TERM, Track.id)\
+        .collect()
+
+
+def parse_lyrics_query(query: str) -> tuple[list[str], list[list[str]]]:
+    """Split a query into its individual words and its "quoted phrases" (as lists of words)."""
+    query = query.lower()
+    phrases = [re.findall(WORD_PATTERN, phrase) for phrase in re.findall(r'"([^"]*)"', query)]
+    words = re.findall(WORD_PATTERN, re.sub(r'"[^"]*"?', ' ', query))
+    return list(dict.fromkeys(words)), [phrase for phrase in phrases if phrase]
+
+
+def highlight_snippets(lyrics: pl.Expr, query: str) -> pl.Expr:
+    """Extract the text around the first match of the query from the lyrics, with all matches highlighted."""
+    words, phrases = parse_lyrics_query(query)
+    alternatives = [r'\W+'.join(map(re.escape, phrase)) for phrase in phrases] + list(map(re.escape, words))
+    if not alternatives:
+        return pl.lit(None, pl.String)
+
+    match = r'\b(?:' + '|'.join(alternatives) + r')\b'
+    return lyrics\
+        .str.extract(f'(?is)(.{{0,{SNIPPET_CONTEXT}}}{match}.{{0,{SNIPPET_CONTEXT}}})')\
+        .str.replace_all(r'\s*\n\s*', ' / ')\
+        .str.replace_all(f'(?i){match}', HIGHLIGHT_MARKERS[0] + '${0}' + HIGHLIGHT_MARKERS[1])
+
+
+@dataclass(slots=True)
+class LyricsIndex:
+    """An inverted index over the words of the lyrics, see the module docstring."""
+
+    terms: pl.Series
+    """All distinct words, sorted."""
+
+    term_offsets: np.ndarray
+    """The postings of `terms[i]` are stored at `term_offsets[i]:term_offsets[i + 1]`."""
+
+    posting_songs: np.ndarray
+    """The song (index into `track_ids`) of every posting."""
+
+    position_offsets: np.ndarray
+    """The positions of posting `j` are stored at `positions[position_offsets[j]:position_offsets[j + 1]]`."""
+
+    positions: np.ndarray
+
+    track_ids: pl.Series
+    """The `track.id` of every song with lyrics."""
+
+    song_lengths: np.ndarray
+    """The number of words of every song."""
+
+    def _postings_of(self, term: str) -> slice:
+        index = self.terms.search_sorted(term)
+        if index >= len(self.terms) or self.terms[index] != term:
+            return slice(0, 0)
+        return slice(int(self.term_offsets[index]), int(self.term_offsets[index + 1]))
+
+    def _term_frequencies(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the songs containing the word, and how often they contain it."""
+        postings = self._postings_of(term)
+        return self.posting_songs[postings], np.diff(self.position_offsets[postings.start:postings.stop + 1])
+
+    def _phrase_frequencies(self, phrase: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Return the songs containing the phrase, and how often they contain it."""
+        def encoded_positions(term: str) -> np.ndarray:
+            postings = self._postings_of(term)
+            position_range = slice(int(self.position_offsets[postings.start]),
+                                   int(self.position_offsets[postings.stop]))
+            songs = np.repeat(self.posting_songs[postings],
+                              np.diff(self.position_offsets[postings.start:postings.stop + 1]))
+            return songs.astype(np.int64) << 16 | self.positions[position_range].astype(np.int64)
+
+        # The (song, position) pairs where the phrase starts
+        starts = encoded_positions(phrase[0])
+        for offset, term in enumerate(phrase[1:], start=1):
+            starts = starts[np.isin(starts + offset, encoded_positions(term))]
+
+        songs, counts = np.unique(starts >> 16, return_counts=True)
+        return songs, counts
+
+    def search(self, query: str, *, limit: int | None = 50) -> pl.DataFrame:
+        """Return the `track.id` and BM25 `lyrics_score` of the best matching songs."""
+        words, phrases = parse_lyrics_query(query)
+        song_count = len(self.track_ids)
+        average_length = max(float(self.song_lengths.mean()), 1.0) if song_count > 0 else 1.0
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.song_lengths / average_length)
+
+        scores = np.zeros(song_count)
+        matches_all_phrases = np.ones(song_count, dtype=bool)
+        matches_any_word = np.zeros(song_count, dtype=bool) if words else np.ones(song_count, dtype=bool)
+
+        for is_phrase, term in [(False, word) for word in words] + [(True, phrase) for phrase in phrases]:
+            songs, frequencies = self._phrase_frequencies(term) if is_phrase else self._term_frequencies(term)
+            idf = np.log(1 + (song_count - len(songs) + 0.5) / (len(songs) + 0.5))
+            scores[songs] += idf * frequencies * (BM25_K1 + 1) / (frequencies + length_norm[songs])
+
+            if is_phrase:
+                matches_phrase = np.zeros(song_count, dtype=bool)
+                matches_phrase[songs] = True
+                matches_all_phrases &= matches_phrase
+            else:
+                matches_any_word[songs] = True
+
+        matching_songs = np.flatnonzero(matches_all_phrases & matches_any_word & (scores > 0))
+        if limit is not None and len(matching_songs) > limit:
+            matching_songs = matching_songs[np.argpartition(-scores[matching_songs], limit - 1)[:limit]]
+
+        return pl.DataFrame({
+            Track.id: self.track_ids.gather(matching_songs),
+            LYRICS_SCORE: pl.Series(scores[matching_songs], dtype=pl.Float32),
+        }).sort(LYRICS_SCORE, Track.id, descending=[True, False])
+
+    @staticmethod
+    def from_frame(postings: pl.DataFrame) -> LyricsIndex:
+        """Create the index from the output of `compute_lyrics_postings` (which must be sorted by word)."""
+        term_counts = postings.group_by(TERM, maintain_order=True).len()
+        songs = postings.select(pl.col(Track.id).unique().sort())[Track.id]
+        posting_songs = songs.search_sorted(postings[Track.id]).to_numpy().astype(np.int64)
+        frequencies = postings[POSITIONS].list.len().to_numpy().astype(np.int64)
+
+        return LyricsIndex(
+            terms=term_counts[TERM],
+            term_offsets=np.concatenate([[0], np.cumsum(term_counts['len'].to_numpy())]).astype(np.int64),
+            posting_songs=posting_songs,
+            position_offsets=np.concatenate([[0], np.cumsum(frequencies)]).astype(np.int64),
+            positions=postings[POSITIONS].explode().to_numpy().astype(np.uint16)
+            if len(postings) > 0 else np.zeros(0, dtype=np.uint16),
+            track_ids=songs,
+            song_lengths=np.bincount(posting_songs, weights=frequencies, minlength=len(songs)))
+
+    @staticmethod
+    def load(file_name: str) -> LyricsIndex:
+        return LyricsIndex.from_frame(pl.read_parquet(file_name))
@@ -0,0 +1,145 @@
+"""
+MinHash signatures of the song sets of the DJs, for finding DJs playing similar music.
+
+For each of `SIGNATURE_SIZE` random hash functions, the signature of a DJ stores the
+minimum hash over all songs in the DJ's playlists. The probability of two DJs having
+the same minimum for a hash function equals the Jaccard similarity of their song sets,
+so the fraction of matching signature entries estimates it (and the signature of the
+union of several song sets is simply the element-wise minimum of their signatures).
+
+The signatures are computed at build time. For lookups, `DjSimilarityIndex` applies
+locality sensitive hashing (LSH): the signatures are split into `LSH_BANDS` bands, and
+only DJs sharing at least one band with the query are compared in detail.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+import polars as pl
+
+from utils.tables import Playlist, PlaylistOwner, PlaylistTrack, Stats
+
+SIGNATURE_SIZE: int = 128
+
+LSH_BANDS: int = 64
+"""With 2 rows per band, DJs with a Jaccard similarity of ~0.15 or more are very likely to become candidates."""
+
+MIN_SONG_COUNT: int = 10
+"""DJs with fewer songs do not get a signature, as the estimates would be too noisy."""
+
+JACCARD_SIMILARITY: str = 'jaccard_similarity'
+SHARED_SONG_COUNT: str = 'shared_song_count'
+
+
+def _hash_functions(count: int) -> tuple[np.ndarray, np.ndarray]:
+    """The (odd) multipliers and offsets of the multiply-shift hash functions."""
+    rng = np.random.default_rng(0)
+    multipliers = rng.integers(0, 2 ** 63, size=count, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=count, dtype=np.uint64)
+    return multipliers, offsets
+
+
+def compute_dj_signatures(playlists: pl.LazyFrame, playlist_tracks: pl.LazyFrame) -> pl.DataFrame:
+    """Compute the signature of every DJ with at least `MIN_SONG_COUNT` songs (see the module docstring)."""
+    dj_tracks = playlists\
+        .select(Playlist.id, PlaylistOwner.id)\
+        .join(playlist_tracks.select(PlaylistTrack.Playlist.id, PlaylistTrack.Track.id),
+              how='inner', on=Playlist.id)\
+        .filter(pl.col(PlaylistOwner.id).is_not_null())\
+        .select(PlaylistOwner.id, pl.col(PlaylistTrack.Track.id).hash(seed=0).alias('track_hash'))\
+        .unique()\
+        .filter(pl.len().over(PlaylistOwner.id) >= MIN_SONG_COUNT)\
+        .sort(PlaylistOwner.id)\
+        .collect()
+
+    owners = dj_tracks.group_by(PlaylistOwner.id, maintain_order=True).agg(pl.len().alias(Stats.song_count))
+    owner_starts = np.concatenate([[0], np.cumsum(owners[Stats.song_count].to_numpy())[:-1]]).astype(np.int64)
+    track_hashes = dj_tracks['track_hash'].to_numpy()
+
+    signatures = np.empty((len(owners), SIGNATURE_SIZE), dtype=np.uint32)
+    if len(owners) > 0:
+        for i, (multiplier, offset) in enumerate(zip(*_hash_functions(SIGNATURE_SIZE))):
+            hashes = ((track_hashes * multiplier + offset) >> np.uint64(32)).astype(np.uint32)
+            signatures[:, i] = np.minimum.reduceat(hashes, owner_starts)
+
+    owner_names = playlists\
+        .select(PlaylistOwner.id, PlaylistOwner.name)\
+        .group_by(PlaylistOwner.id)\
+        .agg(pl.col(PlaylistOwner.name).drop_nulls().first())\
+        .collect()
+
+    return owners\
+        .with_columns(pl.Series(PlaylistOwner.track_signature, signatures, dtype=pl.Array(pl.UInt32, SIGNATURE_SIZE)))\
+        .join(owner_names, how='left', on=PlaylistOwner.id)\
+        .select(PlaylistOwner.id, PlaylistOwner.name, Stats.song_count, PlaylistOwner.track_signature)
+
+
+@dataclass(slots=True)
+class DjSimilarityIndex:
+    """Estimates the similarity of the song sets of DJs from their signatures, see the module docstring."""
+
+    djs: pl.DataFrame
+    """The `owner.id`, `owner.name` and `song_count` of every DJ with a signature."""
+
+    signatures: np.ndarray
+    """The signature of every DJ, in the same order as `djs`."""
+
+    buckets: dict[tuple[int, bytes], list[int]]
+    """The DJs (rows) sharing each band of their signatures."""
+
+    def find_similar(self, rows: np.ndarray, *, limit: int | None = 20) -> pl.DataFrame:
+        """
+        Find the DJs whose songs are most similar to the songs of the DJs in the given rows
+        (taken together), excluding those DJs themselves. Returns the `owner.id`, `owner.name`
+        and `song_count` of the DJs, with the estimated `jaccard_similarity` & `shared_song_count`.
+        """
+        if len(rows) == 0:
+            return self.djs.clear().with_columns(pl.lit(0.0).alias(JACCARD_SIMILARITY),
+                                                 pl.lit(0.0).alias(SHARED_SONG_COUNT))
+
+        signature = self.signatures[rows].min(axis=0)
+        candidates = np.unique([candidate
+                                for band, key in enumerate(self._band_keys(signature[None, :])[0])
+                                for candidate in self.buckets.get((band, key), [])])
+        # There are few enough DJs that we can afford comparing all of them if LSH finds too few
+        if limit is None or len(candidates) <= limit + len(rows):
+            candidates = np.arange(len(self.signatures))
+        candidates = candidates[~np.isin(candidates, rows)]
+
+        similarities = (self.signatures[candidates] == signature).mean(axis=1)
+        song_count = float(self.djs[Stats.song_count].gather(rows).sum())
+
+        return self.djs[candidates]\
+            .with_columns(pl.Series(JACCARD_SIMILARITY, similarities))\
+            .with_columns(
+                # |A ∩ B| = J * |A ∪ B| = J / (1 + J) * (|A| + |B|)
+                (pl.col(JACCARD_SIMILARITY) / (1 + pl.col(JACCARD_SIMILARITY))
+                 * (pl.col(Stats.song_count) + song_count)).round().alias(SHARED_SONG_COUNT))\
+            .sort(JACCARD_SIMILARITY, descending=True)\
+            .head(limit or len(candidates))
+
+    @staticmethod
+    def _band_keys(signatures: np.ndarray) -> list[list[bytes]]:
+        bands = signatures.reshape(len(signatures), LSH_BANDS, -1)
+        return [[band.tobytes() for band in dj_bands] for dj_bands in bands]
+
+    @staticmethod
+    def from_frame(signatures: pl.DataFrame) -> DjSimilarityIndex:
+        """Create the index from the output of `compute_dj_signatures`."""
+        matrix = signatures[PlaylistOwner.track_signature].to_numpy().astype(np.uint32)\
+            if len(signatures) > 0 else np.zeros((0, SIGNATURE_SIZE), dtype=np.uint32)
+
+        buckets: dict[tuple[int, bytes], list[int]] = defaultdict(list)
+        for row, keys in enumerate(DjSimilarityIndex._band_keys(matrix)):
+            for band, key in enumerate(keys):
+                buckets[(band, key)].append(row)
+
+        return DjSimilarityIndex(
+            djs=signatures.drop(PlaylistOwner.track_signature),
+            signatures=matrix,
+            buckets=dict(buckets))
+
+    @staticmethod
+    def load(file_name: str) -> DjSimilarityIndex:
+        return DjSimilarityIndex.from_frame(pl.read_parquet(file_name))
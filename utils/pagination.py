@@ -0,0 +1,184 @@
+"""
+Cursor-based pagination over the results of the `SearchEngine.find_*` queries.
+
+The first request for a query computes the complete list of matching IDs in
+result order (with the ID as a tie-breaker, so the order is deterministic), and
+keeps it in an LRU cache keyed by the query and the dataset version. Every page
+then only has to look up its slice of that list and fetch the full rows for the
+IDs in it.
+
+A cursor stores the sort key of the last row before the requested page. If the
+sorted ID list has been evicted from the cache in the meantime, it is recomputed
+and the page is located via a keyset predicate on that sort key instead of the offset.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from threading import Lock
+from typing import Any, Callable
+import base64
+import binascii
+import hashlib
+import json
+
+import polars as pl
+
+from utils.query_context import collect_stage
+
+DEFAULT_PAGE_SIZE: int = 250
+DEFAULT_CACHE_SIZE: int = 32
+
+
+class InvalidCursorError(ValueError):
+    """Raised for cursors that are malformed, belong to another query or to an outdated dataset."""
+
+
+@dataclass(slots=True)
+class Cursor:
+    """The (decoded) position of a page within the results of a query."""
+
+    query_key: str
+    """Identifies the query the cursor belongs to."""
+
+    version: str
+    """The dataset version the cursor was created for."""
+
+    offset: int
+    """The index of the first row of the page."""
+
+    after_key: list[Any] | None
+    """The sort key (including the ID) of the last row before the page, or `None` for the first page."""
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(json.dumps(asdict(self)).encode()).decode()
+
+    @staticmethod
+    def decode(cursor: str) -> Cursor:
+        try:
+            return Cursor(**json.loads(base64.urlsafe_b64decode(cursor.encode())))
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError) as e:
+            raise InvalidCursorError(f'Malformed cursor: {cursor!r}') from e
+
+
+@dataclass(slots=True)
+class Page:
+    """A single page of query results."""
+
+    results: pl.LazyFrame
+    """The rows of this page, in result order."""
+
+    offset: int
+    """The index of the first row of this page within the complete result."""
+
+    total_count: int
+    """The number of rows of the complete result."""
+
+    next_cursor: str | None
+    """The cursor for the next page, or `None` if this is the last page."""
+
+    previous_cursor: str | None
+    """The cursor for the previous page, or `None` if this is the first page."""
+
+
+class SortedIdCache:
+    """A thread-safe LRU cache for the sorted ID lists of recent queries."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], pl.DataFrame] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, query_key: str, version: str) -> pl.DataFrame | None:
+        with self._lock:
+            sorted_ids = self._entries.get((query_key, version))
+            if sorted_ids is not None:
+                self._entries.move_to_end((query_key, version))
+            return sorted_ids
+
+    def put(self, query_key: str, version: str, sorted_ids: pl.DataFrame):
+        with self._lock:
+            self._entries[(query_key, version)] = sorted_ids
+            self._entries.move_to_end((query_key, version))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_query_key(kind: str, query: dict[str, Any]) -> str:
+    """Derive a stable key for the given query parameters."""
+    serialized = json.dumps([kind, query], sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()[:32]
+
+
+def keyset_predicate(columns: list[str], after_key: list[Any], descending: list[bool]) -> pl.Expr:
+    """Match all rows that come strictly after `after_key` when sorted by `columns`."""
+    predicate: pl.Expr | None = None
+    for column, value, is_descending in reversed(list(zip(columns, after_key, descending))):
+        comes_after = pl.col(column).lt(value) if is_descending else pl.col(column).gt(value)
+        predicate = comes_after if predicate is None else\
+            comes_after | (pl.col(column).eq(value) & predicate)
+    return predicate if predicate is not None else pl.lit(False)
+
+
+def paginate(
+    *,
+    kind: str,
+    query: dict[str, Any],
+    cursor: str | None,
+    page_size: int,
+    version: str,
+    cache: SortedIdCache,
+    id_column: str,
+    sort_by: list[str],
+    descending: bool,
+    find_sorted_ids: Callable[[], pl.LazyFrame],
+    fetch_rows: Callable[[pl.Series], pl.LazyFrame],
+) -> Page:
+    """
+    Return a single page of the results of a query.
+
+    `find_sorted_ids` returns the (unsorted) `id_column` and `sort_by` columns of all
+    matching rows, `fetch_rows` returns the full rows for the given IDs (in any order).
+    """
+    if page_size <= 0:
+        raise ValueError(f'Invalid page_size: {page_size}')
+
+    query_key = get_query_key(kind, query)
+    columns = [*sort_by, id_column]
+    column_descending = [descending] * len(sort_by) + [False]
+
+    position = Cursor.decode(cursor) if cursor else Cursor(query_key, version, offset=0, after_key=None)
+    if position.query_key != query_key:
+        raise InvalidCursorError('The cursor belongs to a different query')
+    if position.version != version:
+        raise InvalidCursorError('The cursor belongs to an outdated version of the dataset')
+
+    sorted_ids = cache.get(query_key, version)
+    if sorted_ids is None:
+        sorted_ids = collect_stage(find_sorted_ids()
+                                   .select(columns)
+                                   .sort(columns, descending=column_descending, nulls_last=True))
+        cache.put(query_key, version, sorted_ids)
+
+        # Locate the page via its sort key, which does not depend on the offset being valid
+        if position.after_key is not None:
+            position.offset = len(sorted_ids) - sorted_ids\
+                .select(keyset_predicate(columns, position.after_key, column_descending).sum())\
+                .item()
+
+    offset = min(position.offset, len(sorted_ids))
+    page_ids = sorted_ids.slice(offset, page_size).select(id_column).with_row_index('__page_order')
+
+    def cursor_at(page_offset: int) -> str:
+        after_key = list(sorted_ids.row(page_offset - 1)) if page_offset > 0 else None
+        return Cursor(query_key, version, page_offset, after_key).encode()
+
+    return Page(
+        results=fetch_rows(page_ids[id_column])
+        .join(page_ids.lazy(), how='inner', on=id_column)
+        .sort('__page_order')
+        .drop('__page_order'),
+        offset=offset,
+        total_count=len(sorted_ids),
+        next_cursor=cursor_at(offset + page_size) if offset + page_size < len(sorted_ids) else None,
+        previous_cursor=cursor_at(max(offset - page_size, 0)) if offset > 0 else None,
+    )
@@ -0,0 +1,195 @@
+"""
+Deadlines, cancellation & admission control for the eager stages of a query.
+
+Some `SearchEngine` methods already collect intermediate results while the query
+is built (e.g. the sorted ID list of `find_*_page`, the batches of `find_songs_top_k`
+or the results of `batch`). When a query is run via `AsyncSearchEngine`, it activates
+a `QueryContext` for the worker thread building it, and these stages are collected via
+`collect_stage`/`collect_stages`, which run them as a background polars query and cancel it
+as soon as the deadline passes or the query is cancelled. If the context has a
+`QueryScheduler`, every stage also has to be admitted by it first (with an estimate
+of the memory usage of its plan), just like the final query. Without an active
+context, the stages are collected as usual.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator
+import threading
+import time
+
+import polars as pl
+from polars.lazyframe.in_process import InProcessQuery
+
+from utils.scheduler import QueryRejectedError, QueryScheduler, QueryTicket, estimate_memory_usage
+
+_active = threading.local()
+
+STAGE: str = '__stage'
+"""The column identifying the frame every row belongs to, when the frames of a stage are collected together."""
+
+
+class QueryTooBroadError(Exception):
+    """Raised when a query does not finish before its deadline."""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        super().__init__(f'Query did not finish within {timeout_seconds:g} seconds')
+
+    @property
+    def user_message(self) -> str:
+        return (f"This search took longer than {self.timeout_seconds:g} seconds and was stopped."
+                " It is probably too broad - please add some more filters and try again.")
+
+
+class QueryCancelledError(Exception):
+    """Raised when a query is cancelled via its `CancellationToken`."""
+
+
+class CancellationToken:
+    """Allows cancelling one or more queries from the outside (e.g. from another Streamlit run)."""
+
+    __slots__ = ('_cancelled',)
+
+    def __init__(self):
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._cancelled
+
+
+@dataclass(slots=True)
+class QueryContext:
+    """The deadline, cancellation & admission state of a query that is being built."""
+
+    timeout: float
+    deadline: float
+    """In `time.monotonic()` seconds."""
+
+    poll_interval: float
+    token: CancellationToken | None = None
+
+    scheduler: QueryScheduler | None = None
+
+    on_abandon: Callable[[InProcessQuery, QueryTicket | None], None] | None = None
+    """Receives the background queries that were cancelled (but may still be running), with their ticket."""
+
+    release_abandoned: Callable[[], None] | None = None
+    """Releases the tickets of abandoned queries that have finished in the meantime."""
+
+    queued_ticket: QueryTicket | None = None
+    """The ticket of the stage that is currently waiting for admission, if any."""
+
+    stopped: bool = False
+    """Set when the caller has given up on the query (e.g. after the deadline)."""
+
+    def stop(self):
+        self.stopped = True
+
+    def check(self):
+        """Raise if the query should not continue."""
+        if self.stopped or (self.token is not None and self.token.is_cancelled):
+            raise QueryCancelledError('Query was cancelled')
+        if time.monotonic() >= self.deadline:
+            raise QueryTooBroadError(self.timeout)
+
+    def admit(self, frames: list[pl.LazyFrame]) -> QueryTicket | None:
+        """Wait until the scheduler admits a stage. The time spent in its queue does not count towards the deadline."""
+        if self.scheduler is None:
+            return None
+
+        ticket = self.scheduler.submit(sum(estimate_memory_usage(frame) for frame in frames))
+        queued_at = last_polled_at = time.monotonic()
+        self.queued_ticket = ticket
+        try:
+            while True:
+                if self.release_abandoned is not None:
+                    self.release_abandoned()
+                if self.scheduler.try_admit(ticket):
+                    return ticket
+
+                now = time.monotonic()
+                self.deadline += now - last_polled_at
+                last_polled_at = now
+                self.check()
+                if now - queued_at >= self.scheduler.max_wait_seconds:
+                    raise QueryRejectedError('Query was not admitted in time')
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self.scheduler.release(ticket)
+            raise
+        finally:
+            self.queued_ticket = None
+
+    def release(self, ticket: QueryTicket | None):
+        if self.scheduler is not None and ticket is not None:
+            self.scheduler.release(ticket)
+
+    @contextmanager
+    def activate(self) -> Iterator[QueryContext]:
+        """Use this context for the eager stages collected by the current thread."""
+        previous = getattr(_active, 'context', None)
+        _active.context = self
+        try:
+            yield self
+        finally:
+            _active.context = previous
+
+
+def active_context() -> QueryContext | None:
+    return getattr(_active, 'context', None)
+
+
+def collect_stages(frames: list[pl.LazyFrame]) -> list[pl.DataFrame]:
+    """
+    Collect the frames of an eager stage of a query, honoring the deadline & cancellation of the active context.
+
+    Within a context, the frames are combined into a single background query (see `_combine_stages`),
+    so like with `pl.collect_all`, subplans common to several frames are only evaluated once,
+    and the whole stage is cancelled as a unit.
+    """
+    context = active_context()
+    if context is None:
+        return pl.collect_all(frames, engine='streaming')
+
+    context.check()
+    ticket = context.admit(frames)
+    query: InProcessQuery | None = None
+    try:
+        stage = frames[0] if len(frames) == 1 else _combine_stages(frames)
+        query = stage.collect(background=True, engine='streaming')
+        while (result := query.fetch()) is None:
+            context.check()
+            time.sleep(context.poll_interval)
+        context.release(ticket)
+    except BaseException:
+        if query is not None and context.on_abandon is not None:
+            query.cancel()
+            # The abandoned query keeps the ticket, as the stage still uses memory until it finishes
+            context.on_abandon(query, ticket)
+        else:
+            context.release(ticket)
+        raise
+
+    return [result] if len(frames) == 1 else _split_stages(result, len(frames))
+
+
+def _combine_stages(frames: list[pl.LazyFrame]) -> pl.LazyFrame:
+    """Stack the frames into a single one, with the rows of every frame packed into its own struct column."""
+    return pl.concat([frame.select(pl.lit(i, pl.UInt32).alias(STAGE), pl.struct(pl.all()).alias(f'{STAGE}_{i}'))
+                      for i, frame in enumerate(frames)], how='diagonal')
+
+
+def _split_stages(combined: pl.DataFrame, count: int) -> list[pl.DataFrame]:
+    """The inverse of `_combine_stages`."""
+    return [combined.filter(pl.col(STAGE).eq(i)).select(pl.col(f'{STAGE}_{i}').struct.unnest())
+            for i in range(count)]
+
+
+def collect_stage(frame: pl.LazyFrame) -> pl.DataFrame:
+    """Collect a single eager stage of a query, see `collect_stages`."""
+    return collect_stages([frame])[0]
@@ -0,0 +1,131 @@
+"""
+Point lookups by ID in Parquet files that are sorted by an ID column.
+
+The files are written with a fixed number of rows per row group (`ROW_GROUP_SIZE`),
+and a sidecar index stores the first ID and the row offset of every row group.
+To fetch the rows for a small set of IDs, we locate the row groups that may contain
+them via binary search, and read only those row ranges (polars pushes the slice
+down into the Parquet reader, so the other row groups are never decoded).
+
+Reading the row ranges is done eagerly, as polars does not push the slices of a
+combined plan (e.g. `pl.concat` of several sliced scans) down into the reader.
+If the IDs are spread over a large part of the file, we fall back to a lazy scan.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import os
+
+import numpy as np
+import polars as pl
+
+ROW_GROUP_SIZE: int = 8192
+"""The number of rows per row group of the indexed files."""
+
+INDEX_FILE_SUFFIX: str = '.index.parquet'
+
+MAX_FETCHED_FRACTION: float = 0.25
+"""Read the whole file (lazily) instead if more than this fraction of its rows would be fetched."""
+
+_FIRST_ID: str = 'first_id'
+_ROW_OFFSET: str = 'row_offset'
+
+
+def get_index_file_name(file_name: str) -> str:
+    return file_name.removesuffix('.parquet') + INDEX_FILE_SUFFIX
+
+
+@dataclass(slots=True)
+class RowGroupIndex:
+    """Maps ID ranges of a sorted Parquet file to the row groups (and row offsets) containing them."""
+
+    file_name: str
+    """The indexed Parquet file."""
+
+    id_column: str
+    """The column the file is sorted by."""
+
+    first_ids: pl.Series
+    """The first ID of every row group."""
+
+    row_offsets: np.ndarray
+    """The row offset of every row group, followed by the total number of rows."""
+
+    @property
+    def row_count(self) -> int:
+        return int(self.row_offsets[-1])
+
+    def find_row_ranges(self, ids: pl.Series) -> list[tuple[int, int]]:
+        """Return the (offset, length) of the row ranges containing the given IDs, merging adjacent row groups."""
+        ids = ids.cast(self.first_ids.dtype).drop_nulls().unique().sort()
+        group_count = len(self.first_ids)
+        if len(ids) == 0 or group_count == 0:
+            return []
+
+        # The rows for an ID start in the last row group whose first ID is smaller than it (or in the
+        # row group starting with it), and end in the last row group whose first ID is not larger
+        first_groups = np.maximum(self.first_ids.search_sorted(ids, side='left').to_numpy().astype(np.int64) - 1, 0)
+        last_groups = self.first_ids.search_sorted(ids, side='right').to_numpy().astype(np.int64) - 1
+        found = last_groups >= 0
+
+        # Mark all row groups covered by any of the [first, last] ranges
+        coverage = np.zeros(group_count + 1, dtype=np.int64)
+        np.add.at(coverage, first_groups[found], 1)
+        np.add.at(coverage, last_groups[found] + 1, -1)
+        is_needed = np.cumsum(coverage[:-1]) > 0
+
+        changes = np.flatnonzero(np.diff(np.concatenate([[0], is_needed.astype(np.int8), [0]])))
+        return [(int(self.row_offsets[start]), int(self.row_offsets[end] - self.row_offsets[start]))
+                for start, end in zip(changes[::2], changes[1::2])]
+
+    def scan_ids(self, ids: pl.Series, *, columns: list[str] | None = None) -> pl.LazyFrame:
+        """Return the rows with the given IDs, reading only the row groups that may contain them."""
+        scan = pl.scan_parquet(self.file_name)
+        if columns is not None:
+            scan = scan.select(columns)
+        match_ids = pl.col(self.id_column).is_in(ids.implode())
+
+        row_ranges = self.find_row_ranges(ids)
+        if sum(length for _, length in row_ranges) > MAX_FETCHED_FRACTION * self.row_count:
+            return scan.filter(match_ids)
+        if not row_ranges:
+            return scan.clear()
+
+        return pl.concat([scan.slice(offset, length).collect() for offset, length in row_ranges])\
+            .lazy()\
+            .filter(match_ids)
+
+    def write(self):
+        """Store the index in a sidecar file next to the indexed file."""
+        pl.DataFrame({
+            _FIRST_ID: self.first_ids.append(pl.Series([None], dtype=self.first_ids.dtype)),
+            _ROW_OFFSET: self.row_offsets,
+        }).write_parquet(get_index_file_name(self.file_name))
+
+    @staticmethod
+    def build(file_name: str, *, id_column: str, row_group_size: int = ROW_GROUP_SIZE) -> RowGroupIndex:
+        """Build the index from the ID column of the file."""
+        ids = pl.scan_parquet(file_name).select(id_column).collect()[id_column]
+        offsets = np.arange(0, len(ids), row_group_size, dtype=np.int64)
+        return RowGroupIndex(
+            file_name=file_name,
+            id_column=id_column,
+            first_ids=ids.gather(offsets),
+            row_offsets=np.append(offsets, len(ids)))
+
+    @staticmethod
+    def load(file_name: str, *, id_column: str) -> RowGroupIndex:
+        """Load the index from its sidecar file, or build it if the sidecar is missing or outdated."""
+        index_file_name = get_index_file_name(file_name)
+        if os.path.exists(index_file_name) and os.path.getmtime(index_file_name) >= os.path.getmtime(file_name):
+            stored = pl.read_parquet(index_file_name)
+            index = RowGroupIndex(
+                file_name=file_name,
+                id_column=id_column,
+                first_ids=stored[_FIRST_ID].head(-1),
+                row_offsets=stored[_ROW_OFFSET].to_numpy())
+
+            # The row count is stored in the Parquet metadata, so this does not read any data
+            if index.row_count == pl.scan_parquet(file_name).select(pl.len()).collect().item():
+                return index
+
+        return RowGroupIndex.build(file_name, id_column=id_column)
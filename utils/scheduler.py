@@ -0,0 +1,152 @@
+"""
+Process-wide admission control for expensive queries.
+
+All Streamlit sessions share the same process (and thus the same memory), so a
+few concurrent broad queries are enough to run out of memory. Before a query is
+executed, its memory usage is estimated from the Parquet scans in its plan, and it
+is only admitted if fewer than `max_running_queries` queries are running and the
+estimate fits into the currently available memory (as reported by `psutil`).
+Otherwise, it waits in a FIFO queue, and is rejected if the queue is full or it has
+waited for longer than `max_wait_seconds`.
+"""
+from __future__ import annotations
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Lock
+import itertools
+import math
+import os
+import re
+import time
+
+import polars as pl
+import psutil
+
+DEFAULT_MAX_RUNNING_QUERIES: int = 2
+DEFAULT_MAX_QUEUED_QUERIES: int = 16
+DEFAULT_MAX_WAIT_SECONDS: float = 120.0
+DEFAULT_MIN_AVAILABLE_MEMORY: int = 512 * 1024 * 1024
+DEFAULT_QUERY_SECONDS: float = 5.0
+
+DECOMPRESSION_FACTOR: float = 4.0
+"""How much larger the in-memory representation of a Parquet column is (roughly) than on disk."""
+
+_SCAN_PATTERN = re.compile(r'Parquet SCAN \[(?P<path>[^\]]+)\]\s*\n\s*PROJECT (?P<projected>\d+|\*)/(?P<total>\d+) COLUMNS')
+
+
+class QueryRejectedError(Exception):
+    """Raised when a query can not be admitted because too many other queries are running."""
+
+    @property
+    def user_message(self) -> str:
+        return ("The server is currently busy with too many other searches."
+                " Please wait a moment and try again.")
+
+
+def estimate_memory_usage(query: pl.LazyFrame) -> int:
+    """Estimate the peak memory usage (in bytes) of a query from the Parquet files it scans."""
+    estimate = 0.0
+    for scan in _SCAN_PATTERN.finditer(query.explain(optimized=True)):
+        try:
+            file_size = os.path.getsize(scan['path'])
+        except OSError:
+            continue
+
+        total = int(scan['total'])
+        projected = total if scan['projected'] == '*' else int(scan['projected'])
+        estimate += file_size * (projected / max(total, 1)) * DECOMPRESSION_FACTOR
+    return int(estimate)
+
+
+@dataclass(slots=True)
+class QueryTicket:
+    """A query that has been submitted to a `QueryScheduler`."""
+
+    id: int
+    estimated_memory: int
+    submitted_at: float = field(default_factory=time.monotonic)
+    admitted_at: float | None = None
+
+    @property
+    def is_admitted(self) -> bool:
+        return self.admitted_at is not None
+
+
+class QueryScheduler:
+    """Limits the number and the (estimated) memory usage of concurrently running queries."""
+
+    def __init__(
+        self,
+        *,
+        max_running_queries: int = DEFAULT_MAX_RUNNING_QUERIES,
+        max_queued_queries: int = DEFAULT_MAX_QUEUED_QUERIES,
+        max_wait_seconds: float = DEFAULT_MAX_WAIT_SECONDS,
+        min_available_memory: int = DEFAULT_MIN_AVAILABLE_MEMORY,
+    ):
+        self.max_running_queries = max_running_queries
+        self.max_queued_queries = max_queued_queries
+        self.max_wait_seconds = max_wait_seconds
+        self.min_available_memory = min_available_memory
+
+        self._lock = Lock()
+        self._ids = itertools.count()
+        self._queue: deque[QueryTicket] = deque()
+        self._running: dict[int, QueryTicket] = {}
+        self._average_seconds = DEFAULT_QUERY_SECONDS
+
+    def submit(self, estimated_memory: int) -> QueryTicket:
+        """Append a query to the queue. Raises `QueryRejectedError` if the queue is full."""
+        with self._lock:
+            if len(self._queue) >= self.max_queued_queries:
+                raise QueryRejectedError(f'Too many queued queries ({len(self._queue)})')
+            ticket = QueryTicket(next(self._ids), estimated_memory)
+            self._queue.append(ticket)
+            return ticket
+
+    def try_admit(self, ticket: QueryTicket) -> bool:
+        """Admit the query if it is next in line and there are enough resources for it."""
+        with self._lock:
+            if ticket.is_admitted:
+                return True
+            if not self._queue or self._queue[0] is not ticket or not self._has_capacity_for(ticket):
+                return False
+
+            self._queue.popleft()
+            ticket.admitted_at = time.monotonic()
+            self._running[ticket.id] = ticket
+            return True
+
+    def release(self, ticket: QueryTicket):
+        """Remove a query from the queue, or mark it as finished if it has been admitted."""
+        with self._lock:
+            if ticket.admitted_at is None:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+            elif self._running.pop(ticket.id, None) is not None:
+                # Exponential moving average of the query durations, used for the ETA
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * (time.monotonic() - ticket.admitted_at)
+
+    def position(self, ticket: QueryTicket) -> int:
+        """The number of queries ahead of this one in the queue (0 if it is next or already admitted)."""
+        with self._lock:
+            return self._queue.index(ticket) if ticket in self._queue else 0
+
+    def estimated_wait_seconds(self, ticket: QueryTicket) -> float:
+        """A rough estimate of how long it will take until the query is admitted."""
+        position = self.position(ticket)
+        with self._lock:
+            if ticket.is_admitted:
+                return 0.0
+            return math.ceil((position + 1) / self.max_running_queries) * self._average_seconds
+
+    def _has_capacity_for(self, ticket: QueryTicket) -> bool:
+        # Always run at least one query, even if it does not seem to fit, as it would never be admitted otherwise
+        if not self._running:
+            return True
+        if len(self._running) >= self.max_running_queries:
+            return False
+
+        # The running queries might not have allocated all of their memory yet
+        reserved = sum(running.estimated_memory for running in self._running.values())
+        available = psutil.virtual_memory().available - self.min_available_memory - reserved
+        return ticket.estimated_memory <= available
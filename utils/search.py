@@ -63,18 +63,38 @@ The `SearchEngine` class provides public methods (like `find_songs`, `find_playl
 for running the different possible queries over the data.
 """
 from __future__ import annotations
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import StrEnum
-from typing import Final, Literal, NamedTuple
+import datetime
+import hashlib
+import math
+import re
+import os
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Final, Literal, Mapping, NamedTuple
 
 import polars as pl
 import polars.selectors as cs
 
 from utils.common.entities import PolarsLazyFrame
-from utils.common.filters import create_date_filter, create_text_filter, or_filter
+from utils.common.filters import FilterCompiler, create_date_filter, create_text_filter, or_filter, parse_filter_values
 from utils.common.stats import count_n_unique
+from utils.explain import QueryExplanation, QueryProfile, QueryTrace, Stage
+from utils.embeddings import SIMILARITY, SimilarityIndex
+from utils.exclusions import ExclusionCache
+from utils.facets import FacetIndex
+from utils.autocomplete import DEFAULT_COMPLETION_LIMIT, PrefixIndex
+from utils.fuzzy import DEFAULT_CANDIDATE_LIMIT, FuzzyIndex
+from utils.graph import HOPS, ORBIT_SCORE, PATH_STEP, TRANSITION_PROBABILITY, Direction, TransitionGraph
+from utils.lyrics_index import LYRICS_SCORE, LYRICS_SNIPPET, LyricsIndex, highlight_snippets
+from utils.minhash import DjSimilarityIndex
+from utils.pagination import DEFAULT_PAGE_SIZE, Page, SortedIdCache, get_query_key, paginate
 from utils.playlist_classifiers import extract_date_strings_from_name, extract_date_types_from_name
-from utils.tables import Playlist, PlaylistOwner, PlaylistTags, PlaylistTrack, Stats, Tag, Track, TrackAdjacent, TrackLyrics, TrackTag, TrackTags
+from utils.query_context import collect_stage, collect_stages
+from utils.row_groups import RowGroupIndex
+from utils.trends import DEFAULT_BASELINE_MONTHS, DEFAULT_WINDOW_MONTHS, MIN_PLAY_COUNT, TREND_SCORE, TrendScoreCache, compute_trend_scores
+from utils.tables import Artist, Playlist, PlaylistOwner, PlaylistTags, PlaylistTrack, Stats, Tag, Track, TrackAdjacent, TrackLyrics, TrackTag, TrackTags
 
 
 ####################
@@ -83,6 +103,8 @@ from utils.tables import Playlist, PlaylistOwner, PlaylistTags, PlaylistTrack, S
 
 type TextFilter = str | list[str]
 
+_REGEX_METACHARACTERS: Final = frozenset('.^$*+?{}[]\\|()')
+
 
 class PreFilterOptions(NamedTuple):
     sort_by: str
@@ -123,13 +145,39 @@ TRACK_PLAYLISTS_DATA_FILE: Final = DATA_DIR + 'data_song_playlists.parquet'
 TRACK_DATA_FILE: Final = DATA_DIR + 'data_song_metadata.parquet'
 TRACK_ADJACENT_DATA_FILE: Final = DATA_DIR + 'data_song_adjacent.parquet'
 TRACK_LYRICS_DATA_FILE: Final = DATA_DIR + 'data_song_lyrics.parquet'
+TRACK_LYRICS_POSTINGS_DATA_FILE: Final = DATA_DIR + 'data_song_lyrics_postings.parquet'
 TRACK_TAGS_DATA_FILE: Final = DATA_DIR + 'data_song_tags.parquet'
+TRACK_EMBEDDINGS_DATA_FILE: Final = DATA_DIR + 'data_song_embeddings.parquet'
+DJ_SIGNATURES_DATA_FILE: Final = DATA_DIR + 'data_dj_signatures.parquet'
+OWNERS_DATA_FILE: Final = DATA_DIR + 'data_playlist_owners.parquet'
+ARTISTS_DATA_FILE: Final = DATA_DIR + 'data_artists.parquet'
+TRACK_ARTISTS_DATA_FILE: Final = DATA_DIR + 'data_song_artists.parquet'
+TRACK_SUMMARIES_DATA_FILE: Final = DATA_DIR + 'data_song_playlist_summaries.parquet'
 COUNTRY_DATA_FILE: Final = DATA_DIR + 'data_countries.csv'
 REGION_DATA_FILE: Final = DATA_DIR + 'data_regions.csv'
 
 TRACK_DUPLICATES_DATA_FILE: Final = DATA_DIR + 'data_song_duplicates.parquet'
 TRACK_CANONICAL_DATA_FILE: Final = DATA_DIR + 'data_song_canonical.parquet'
 
+TRACK_SUMMARY_PLAYLIST_LIMIT: Final = 30
+"""How many playlists (and DJs) of each song are stored in `TRACK_SUMMARIES_DATA_FILE`."""
+
+# Files sorted by an ID column, which get a sidecar `RowGroupIndex` for point lookups
+ROW_GROUP_INDEXED_FILES: Final = {
+    TRACK_DATA_FILE: Track.id,
+    TRACK_PLAYLISTS_DATA_FILE: Track.id,
+    PLAYLIST_TRACKS_DATA_FILE: Playlist.id,
+    TRACK_LYRICS_DATA_FILE: Track.id,
+}
+
+
+def get_data_version(data_dir: str = DATA_DIR) -> str:
+    """Identify the current version of the processed data files, based on their sizes and modification times."""
+    file_stats = sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir(data_dir) if entry.is_file())
+    return hashlib.sha256(repr(file_stats).encode()).hexdigest()[:16]
+
 #############################
 # INDIVIDUAL FILTER & JOINS #
 #############################
@@ -147,6 +195,8 @@ class PlaylistSet:
     excluded_playlists: PolarsLazyFrame[Playlist] | None
     all_playlists: PolarsLazyFrame[Playlist]
     is_filtered: bool
+    excluded_track_ids: pl.Series | None = None
+    """The tracks to remove from the result (in addition to the tracks of `excluded_playlists`)."""
 
     def with_playlist_url(self):
         return PlaylistSet(
@@ -155,7 +205,8 @@ class PlaylistSet:
                     pl.lit('https://open.spotify.com/playlist/'), Playlist.id)).alias(Playlist.url)),
             excluded_playlists=self.excluded_playlists,
             all_playlists=self.all_playlists,
-            is_filtered=self.is_filtered)
+            is_filtered=self.is_filtered,
+            excluded_track_ids=self.excluded_track_ids)
 
     def with_owner_url(self):
         return PlaylistSet(
@@ -164,7 +215,8 @@ class PlaylistSet:
                     pl.lit('https://open.spotify.com/user/'), PlaylistOwner.id)).alias(PlaylistOwner.url)),
             excluded_playlists=self.excluded_playlists,
             all_playlists=self.all_playlists,
-            is_filtered=self.is_filtered)
+            is_filtered=self.is_filtered,
+            excluded_track_ids=self.excluded_track_ids)
 
     def with_extra_columns(self):
         return self\
@@ -178,14 +230,16 @@ class PlaylistSet:
                 Playlist.name().pipe(extract_date_types_from_name).alias(Stats.date_formats)),
             excluded_playlists=self.excluded_playlists,
             all_playlists=self.all_playlists,
-            is_filtered=self.is_filtered)
+            is_filtered=self.is_filtered,
+            excluded_track_ids=self.excluded_track_ids)
 
     def sort_by(self, by, *more_by, descending: bool):
         return (self if by is None or (isinstance(by, list) and len(by) == 0) else
                 PlaylistSet(included_playlists=self.included_playlists.sort(by, *more_by, descending=descending),
                             excluded_playlists=self.excluded_playlists,
                             all_playlists=self.all_playlists,
-                            is_filtered=self.is_filtered))
+                            is_filtered=self.is_filtered,
+                            excluded_track_ids=self.excluded_track_ids))
 
     def filter_playlist_tracks(self, playlist_tracks: PlaylistTrackSet, *, include_playlist_info: bool) -> PlaylistTrackSet:
         """Filter the specified playlist_tracks to only include tracks from matched playlists."""
@@ -206,9 +260,14 @@ class PlaylistSet:
             matching_playlist_tracks = matching_playlist_tracks.join(
                 excluded_playlist_tracks, how='anti', on=Track.id)
 
+        if self.excluded_track_ids is not None:
+            matching_playlist_tracks = matching_playlist_tracks.join(
+                self.excluded_track_ids.to_frame().lazy(), how='anti', on=Track.id)
+
         return PlaylistTrackSet(
             matching_playlist_tracks,
-            is_filtered=self.is_filtered or playlist_tracks.is_filtered
+            is_filtered=self.is_filtered or playlist_tracks.is_filtered,
+            track_summaries=playlist_tracks.track_summaries if not self.is_filtered else None,
         )
 
     def filter_tracks(self, playlist_tracks: PlaylistTrackSet, tracks: TrackSet, *, include_playlist_info: bool, include_playlist_track_info: bool, playlist_limit: int | None) -> TrackSet:
@@ -234,6 +293,7 @@ class PlaylistFilter:
 
     # User-provided parameters
     country: TextFilter = ''
+    region: TextFilter = ''
     dj_name: TextFilter = ''
     dj_name_exclude: TextFilter = ''
     playlist_include: TextFilter = ''
@@ -242,14 +302,21 @@ class PlaylistFilter:
     playlist_tag_exclude: TextFilter = ''
     playlist_is_social_set: bool = False
 
+    # Internal optimizations
+    facets: FacetIndex | None = None
+    exclusions: ExclusionCache | None = None
+    compiler: FilterCompiler | None = None
+
     # Parsed filters
     match_country: pl.Expr = field(init=False)
+    match_region: pl.Expr = field(init=False)
     match_dj_name: pl.Expr = field(init=False)
     match_dj_name_exclude: pl.Expr = field(init=False)
     match_playlist: pl.Expr = field(init=False)
     match_excluded_playlist: pl.Expr = field(init=False)
     match_tag: pl.Expr = field(init=False)
     match_excluded_tag: pl.Expr = field(init=False)
+    match_facets: pl.Expr | None = field(init=False)
 
     def __post_init__(self):
         """Parses the user-provided filter specifications."""
@@ -261,8 +328,13 @@ class PlaylistFilter:
             create_text_filter(self.dj_name_exclude, PlaylistOwner.name),
             create_text_filter(self.dj_name_exclude, PlaylistOwner.id))
 
+        text_filter = self.compiler.create_text_filter if self.compiler is not None else create_text_filter
+
         self.match_country =\
-            create_text_filter(self.country, Playlist.country)
+            text_filter(self.country, Playlist.country)
+
+        self.match_region =\
+            text_filter(self.region, Playlist.region)
 
         self.match_playlist =\
             create_text_filter(self.playlist_include, Playlist.name)
@@ -271,12 +343,35 @@ class PlaylistFilter:
             create_text_filter(self.playlist_exclude, Playlist.name)
 
         self.match_tag =\
-            create_text_filter(self.playlist_tag_include, PlaylistTags.tags,
-                               is_list_column=True, match_mode='exact', no_value='untagged')
+            text_filter(self.playlist_tag_include, PlaylistTags.tags,
+                        is_list_column=True, match_mode='exact', no_value='untagged')
 
         self.match_excluded_tag =\
-            create_text_filter(self.playlist_tag_exclude, PlaylistTags.tags,
-                               is_list_column=True, match_mode='exact', no_value='untagged')
+            text_filter(self.playlist_tag_exclude, PlaylistTags.tags,
+                        is_list_column=True, match_mode='exact', no_value='untagged')
+
+        self.match_facets =\
+            self.evaluate_facets(self.facets) if self.facets is not None else None
+
+    def evaluate_facets(self, facets: FacetIndex) -> pl.Expr | None:
+        """Evaluate the facet filters (social sets, tags, country, region) using the bitmap indexes."""
+        rows = facets.all_rows
+        is_filtered = False
+
+        for matched_rows in [
+            facets.match_text(Playlist.country, self.country),
+            facets.match_text(Playlist.region, self.region),
+            facets.match_text(PlaylistTags.tags, self.playlist_tag_include,
+                              match_mode='exact', no_value='untagged'),
+            facets.exclude_text(PlaylistTags.tags, self.playlist_tag_exclude,
+                                match_mode='exact', no_value='untagged'),
+            facets[Playlist.is_social_set].match_true() if self.playlist_is_social_set else None,
+        ]:
+            if matched_rows is not None:
+                rows = rows & matched_rows
+                is_filtered = True
+
+        return facets.id_filter(rows) if is_filtered else None
 
     @property
     def has_filters(self) -> bool:
@@ -284,29 +379,63 @@ class PlaylistFilter:
         return self.match_dj_name is not None\
             or self.match_dj_name_exclude is not None\
             or self.match_country is not None\
+            or self.match_region is not None\
             or self.match_playlist is not None\
             or self.match_excluded_playlist is not None\
             or self.match_tag is not None\
             or self.match_excluded_tag is not None\
             or self.playlist_is_social_set
 
+    @property
+    def max_hit_count(self) -> float:
+        """Upper bound for the number of distinct matched terms (`hit_count`) of any playlist or track."""
+        if not self.playlist_include:
+            # The aggregated (empty) terms of a track still count as a single null term
+            return 1
+        if not isinstance(self.playlist_include, str):
+            return math.inf
+
+        # Terms with regex metacharacters may match arbitrarily many distinct strings
+        terms = set(self.playlist_include.lower().split(','))
+        if any(char in _REGEX_METACHARACTERS for term in terms for char in term):
+            return math.inf
+        return len(terms)
+
     def filter_playlists(self, playlists: PlaylistSet, *, include_matched_terms: bool) -> PlaylistSet:
         """Filter the specified playlists to only include playlists matching this filter."""
         matching_playlists = playlists.included_playlists
 
-        if self.playlist_is_social_set:
-            matching_playlists = matching_playlists.filter(
-                pl.col(Playlist.is_social_set))
+        if self.facets is not None:
+            # The facet filters have already been evaluated via the bitmap indexes
+            if self.match_facets is not None:
+                matching_playlists = matching_playlists.filter(
+                    self.match_facets)
+        else:
+            if self.playlist_is_social_set:
+                matching_playlists = matching_playlists.filter(
+                    pl.col(Playlist.is_social_set))
+
+            # Courtesy of Franzi M. (for the country filter suggestion)
+            if self.match_country is not None:
+                matching_playlists = matching_playlists.filter(
+                    self.match_country)
+
+            if self.match_region is not None:
+                matching_playlists = matching_playlists.filter(
+                    self.match_region)
+
+            if self.match_tag is not None:
+                matching_playlists = matching_playlists.filter(
+                    self.match_tag)
+
+            if self.match_excluded_tag is not None:
+                matching_playlists = matching_playlists.filter(
+                    ~self.match_excluded_tag)
 
         if self.match_playlist is not None:
             matching_playlists = matching_playlists.filter(
                 self.match_playlist)
 
-        # Courtesy of Franzi M. (for the country filter suggestion)
-        if self.match_country is not None:
-            matching_playlists = matching_playlists.filter(
-                self.match_country)
-
         if self.match_dj_name is not None:
             matching_playlists = matching_playlists.filter(
                 self.match_dj_name)
@@ -315,18 +444,21 @@ class PlaylistFilter:
             matching_playlists = matching_playlists.filter(
                 ~self.match_dj_name_exclude)
 
-        if self.match_tag is not None:
-            matching_playlists = matching_playlists.filter(
-                self.match_tag)
-
-        if self.match_excluded_tag is not None:
-            matching_playlists = matching_playlists.filter(
-                ~self.match_excluded_tag)
-
         # Courtesy of Tobias N. (for the suggestion of the playlist_exclude filter)
         excluded_playlists: pl.LazyFrame | None
+        excluded_track_ids = playlists.excluded_track_ids
+
+        if self.match_excluded_playlist is not None and self.exclusions is not None:
+            # The tracks of the excluded playlists are cached, so we only need to avoid the excluded playlists
+            matching_playlists = matching_playlists.filter(
+                self.match_excluded_playlist.not_())
 
-        if self.match_excluded_playlist is not None:
+            excluded_playlists = playlists.excluded_playlists
+            excluded_track_ids = self.exclusions.excluded_track_ids(self.playlist_exclude)\
+                if excluded_track_ids is None else\
+                pl.concat([excluded_track_ids, self.exclusions.excluded_track_ids(self.playlist_exclude)])\
+                .unique().sort()
+        elif self.match_excluded_playlist is not None:
             anti_predicate = self.match_excluded_playlist
 
             # We want to remove tracks that are in these excluded playlists
@@ -371,6 +503,7 @@ class PlaylistFilter:
             excluded_playlists=excluded_playlists,
             all_playlists=playlists.all_playlists,
             is_filtered=self.has_filters or playlists.is_filtered,
+            excluded_track_ids=excluded_track_ids,
         )
 
 
@@ -384,6 +517,11 @@ class PlaylistTrackSet:
     """A collection of playlist-to-track relations."""
     included_playlist_tracks: PolarsLazyFrame[PlaylistTrack]  # PlaylistTrackWithPlaylist
     is_filtered: bool
+    track_summaries: pl.LazyFrame | None = None
+    """
+    The pre-aggregated playlist info of every track (see `TRACK_SUMMARIES_DATA_FILE`),
+    only set as long as this set still contains all playlists & entries of its tracks.
+    """
 
     def filter_playlists(self, playlists: PlaylistSet) -> PlaylistSet:
         """Filter the specified playlists to only include playlists mentioned in this set."""
@@ -402,6 +540,7 @@ class PlaylistTrackSet:
             excluded_playlists=playlists.excluded_playlists,
             all_playlists=playlists.all_playlists,
             is_filtered=self.is_filtered or playlists.is_filtered,
+            excluded_track_ids=playlists.excluded_track_ids,
         )
 
     def filter_tracks(self, tracks: TrackSet, *, include_playlist_info: bool, include_playlist_track_info: bool, playlist_limit: int | None) -> TrackSet:
@@ -437,11 +576,23 @@ class PlaylistTrackSet:
             if include_playlist_track_info:
                 columns_to_select |= PlaylistTrack.matching_columns()
 
-            matching_playlist_tracks = self.included_playlist_tracks\
-                .group_by(Track.id)\
-                .agg(columns_to_select.slice(0, playlist_limit),
-                     *additional_aggregate_columns)\
-                .with_columns(*additional_columns)
+            if self.track_summaries is not None and playlist_limit is not None\
+                    and playlist_limit <= TRACK_SUMMARY_PLAYLIST_LIMIT:
+                # The same aggregation has already been computed for all tracks during pre-processing
+                summary_columns = columns_to_select | PlaylistOwner.matching_columns()\
+                    if include_playlist_info else columns_to_select
+                matching_playlist_tracks = self.track_summaries\
+                    .select(Track.id,
+                            summary_columns.as_expr().list.head(playlist_limit),
+                            *([Playlist.matching_playlist_count, cs.matches("^" + Playlist.matched_terms + "$")]
+                              if include_playlist_info else []))\
+                    .with_columns(*additional_columns)
+            else:
+                matching_playlist_tracks = self.included_playlist_tracks\
+                    .group_by(Track.id)\
+                    .agg(columns_to_select.slice(0, playlist_limit),
+                         *additional_aggregate_columns)\
+                    .with_columns(*additional_columns)
         else:
             matching_playlist_tracks = self.included_playlist_tracks
 
@@ -455,6 +606,65 @@ class PlaylistTrackSet:
             is_filtered=self.is_filtered or tracks.is_filtered,
         )
 
+    def aggregate_by_owner(self, playlists: PlaylistSet, tracks: TrackSet, owners: pl.LazyFrame | None, *, playlist_limit: int | None) -> PlaylistOwnerSet:
+        """
+        Aggregate the playlist entries in this set by the owners of their playlists.
+
+        If nothing has been filtered, the pre-computed `owners` table is returned as-is
+        (if available), otherwise only the matching entries are aggregated, and the
+        region & country of the owners are taken from the `owners` table.
+        """
+        if owners is not None and not self.is_filtered and not playlists.is_filtered:
+            return PlaylistOwnerSet(
+                owners.with_columns(pl.col(Playlist.name).list.head(playlist_limit))
+                if playlist_limit is not None else owners,
+                is_filtered=False)
+
+        matching_owners = self.included_playlist_tracks\
+            .select(Playlist.id, Track.id)\
+            .join(playlists.included_playlists
+                  .select(Playlist.id, Playlist.name, Playlist.region, Playlist.country,
+                          PlaylistOwner.id, PlaylistOwner.name,
+                          pl.col(Stats.song_count).alias('playlist_song_count')),
+                  how='inner', on=Playlist.id)\
+            .join(tracks.included_tracks.select(Track.id, Track.artist_names), how='inner', on=Track.id)\
+            .group_by(PlaylistOwner.name, PlaylistOwner.id)\
+            .agg(pl.n_unique(Track.id).alias(Stats.song_count),
+                 pl.n_unique(Track.artist_names).alias(Stats.artist_count),
+                 pl.n_unique(Playlist.name).alias(Stats.playlist_count),
+                 # The owner's biggest playlists first
+                 pl.col(Playlist.name).sort_by('playlist_song_count', Playlist.name, descending=[True, False])
+                 .drop_nulls().unique(maintain_order=True).slice(0, playlist_limit or None),
+                 pl.col(Playlist.region).drop_nulls().mode().first().alias(PlaylistOwner.region),
+                 pl.col(Playlist.country).drop_nulls().mode().first().alias(PlaylistOwner.country))\
+            .with_columns(
+                pl.when(pl.col(PlaylistOwner.id).is_not_null()).then(pl.concat_str(
+                    pl.lit('https://open.spotify.com/user/'), PlaylistOwner.id)).alias(PlaylistOwner.url))
+
+        if owners is not None:
+            matching_owners = matching_owners\
+                .drop(PlaylistOwner.region, PlaylistOwner.country)\
+                .join(owners.select(PlaylistOwner.id, PlaylistOwner.region, PlaylistOwner.country),
+                      how='left', on=PlaylistOwner.id)
+
+        return PlaylistOwnerSet(
+            matching_owners.select(PlaylistOwner.name, PlaylistOwner.id, PlaylistOwner.region, PlaylistOwner.country,
+                                   Stats.song_count, Stats.artist_count, Stats.playlist_count,
+                                   Playlist.name, PlaylistOwner.url),
+            is_filtered=True)
+
+
+@dataclass(slots=True)
+class PlaylistOwnerSet:
+    """A collection of playlist owners. Each `owner.id` should appear at most once within each collection."""
+    included_owners: PolarsLazyFrame[PlaylistOwner]
+    is_filtered: bool
+
+    def sort_by(self, by, *more_by, descending: bool):
+        return (self if by is None or (isinstance(by, list) and len(by) == 0) else
+                PlaylistOwnerSet(self.included_owners.sort(by, *more_by, descending=descending),
+                                 is_filtered=self.is_filtered))
+
 
 @dataclass(slots=True)
 class PlaylistTrackFilter:
@@ -488,7 +698,8 @@ class PlaylistTrackFilter:
 
         return PlaylistTrackSet(
             matching_playlist_tracks,
-            is_filtered=self.has_filters or playlist_tracks.is_filtered
+            is_filtered=self.has_filters or playlist_tracks.is_filtered,
+            track_summaries=playlist_tracks.track_summaries if not self.has_filters else None,
         )
 
 
@@ -519,6 +730,20 @@ class TrackSet:
                 TrackSet(self.included_tracks.sort(by, *more_by, descending=descending),
                          is_filtered=self.is_filtered))
 
+    def aggregate_by_artist(self, track_artists: pl.LazyFrame, artists: pl.LazyFrame, *, song_limit: int | None) -> ArtistSet:
+        """Aggregate the tracks in this set by their (individual) artists."""
+        matching_artists = self.included_tracks\
+            .select(Track.id, Track.name, Stats.playlist_count)\
+            .join(track_artists, how='inner', on=Track.id)\
+            .group_by(Artist.id)\
+            .agg(pl.col(Track.id).n_unique().alias(Artist.matching_song_count),
+                 pl.col(Track.name).sort_by(Stats.playlist_count, descending=True, nulls_last=True)
+                 .unique(maintain_order=True).slice(0, song_limit).alias(Artist.matching_song_names))
+
+        return ArtistSet(
+            artists.join(matching_artists, how='inner', on=Artist.id),
+            is_filtered=self.is_filtered)
+
     def filter_lyrics(self, lyrics: TrackLyricsSet) -> TrackLyricsSet:
         """Filter the specified track lyrics to only include ones for tracks in this set."""
 
@@ -545,8 +770,10 @@ class TrackSet:
             how='inner' if include_track_info else 'semi',
             on=Track.id)
 
+        # Only whole tracks are removed, so the summaries of the remaining tracks stay valid
         return PlaylistTrackSet(matching_playlist_tracks,
-                                is_filtered=True)
+                                is_filtered=True,
+                                track_summaries=playlist_tracks.track_summaries)
 
     def filter_playlists(self, playlist_tracks: PlaylistTrackSet, playlists: PlaylistSet, *, tracks_in_result: bool, tracks_limit: int | None) -> PlaylistSet:
         """Filter the specified playlists to only include playlists that contain at least one track from this set."""
@@ -586,6 +813,7 @@ class TrackSet:
             playlists.excluded_playlists,
             playlists.all_playlists,
             is_filtered=True,
+            excluded_track_ids=playlists.excluded_track_ids,
         )
 
 
@@ -605,6 +833,8 @@ class TrackFilter:
 
     # Internal optimizations
     pre_filter: PreFilterOptions | None = None
+    facets: FacetIndex | None = None
+    compiler: FilterCompiler | None = None
 
     # Parsed filters
     match_song_name: pl.Expr = field(init=False)
@@ -612,6 +842,7 @@ class TrackFilter:
     match_artist_name: pl.Expr = field(init=False)
     match_tag: pl.Expr = field(init=False)
     match_excluded_tag: pl.Expr = field(init=False)
+    match_facets: pl.Expr | None = field(init=False)
 
     def __post_init__(self):
         """Parses the user-provided filter specifications."""
@@ -621,12 +852,34 @@ class TrackFilter:
             create_date_filter(self.song_release_date, Track.release_date)
         self.match_artist_name =\
             create_text_filter(self.artist_name, Track.artist_names)
+        text_filter = self.compiler.create_text_filter if self.compiler is not None else create_text_filter
         self.match_tag =\
-            create_text_filter(self.tag_include, TrackTags.tags,
-                               is_list_column=True, match_mode='exact', no_value='untagged')
+            text_filter(self.tag_include, TrackTags.tags,
+                        is_list_column=True, match_mode='exact', no_value='untagged')
         self.match_excluded_tag =\
-            create_text_filter(self.tag_exclude, TrackTags.tags,
-                               is_list_column=True, match_mode='exact', no_value='untagged')
+            text_filter(self.tag_exclude, TrackTags.tags,
+                        is_list_column=True, match_mode='exact', no_value='untagged')
+        self.match_facets =\
+            self.evaluate_facets(self.facets) if self.facets is not None else None
+
+    def evaluate_facets(self, facets: FacetIndex) -> pl.Expr | None:
+        """Evaluate the facet filters (tags, queer/POC artists) using the bitmap indexes."""
+        rows = facets.all_rows
+        is_filtered = False
+
+        for matched_rows in [
+            facets.match_text(TrackTags.tags, self.tag_include,
+                              match_mode='exact', no_value='untagged'),
+            facets.exclude_text(TrackTags.tags, self.tag_exclude,
+                                match_mode='exact', no_value='untagged'),
+            facets[Track.has_queer_artist].match_true() if self.artist_is_queer else None,
+            facets[Track.has_poc_artist].match_true() if self.artist_is_poc else None,
+        ]:
+            if matched_rows is not None:
+                rows = rows & matched_rows
+                is_filtered = True
+
+        return facets.id_filter(rows) if is_filtered else None
 
     @property
     def has_filters(self) -> bool:
@@ -635,8 +888,8 @@ class TrackFilter:
             or self.song_bpm_range is not None\
             or self.match_song_release_date is not None\
             or self.match_artist_name is not None\
-            or self.match_tag\
-            or self.match_excluded_tag\
+            or self.match_tag is not None\
+            or self.match_excluded_tag is not None\
             or self.artist_is_queer\
             or self.artist_is_poc\
             or self.pre_filter is not None
@@ -645,29 +898,35 @@ class TrackFilter:
         """Filter the specified tracks to only include tracks matching this filter."""
         matching_tracks = tracks.included_tracks
 
-        if self.match_song_name is not None:
-            matching_tracks = matching_tracks.filter(
-                self.match_song_name)
+        if self.facets is not None:
+            # The facet filters have already been evaluated via the bitmap indexes
+            if self.match_facets is not None:
+                matching_tracks = matching_tracks.filter(
+                    self.match_facets)
+        else:
+            if self.match_tag is not None:
+                matching_tracks = matching_tracks.filter(
+                    self.match_tag)
 
-        if self.match_artist_name is not None:
-            matching_tracks = matching_tracks.filter(
-                self.match_artist_name)
+            if self.match_excluded_tag is not None:
+                matching_tracks = matching_tracks.filter(
+                    ~self.match_excluded_tag)
 
-        if self.match_tag is not None:
-            matching_tracks = matching_tracks.filter(
-                self.match_tag)
+            if self.artist_is_queer:
+                matching_tracks = matching_tracks.filter(
+                    pl.col(Track.has_queer_artist))
 
-        if self.match_excluded_tag is not None:
-            matching_tracks = matching_tracks.filter(
-                ~self.match_excluded_tag)
+            if self.artist_is_poc:
+                matching_tracks = matching_tracks.filter(
+                    pl.col(Track.has_poc_artist))
 
-        if self.artist_is_queer:
+        if self.match_song_name is not None:
             matching_tracks = matching_tracks.filter(
-                pl.col(Track.has_queer_artist))
+                self.match_song_name)
 
-        if self.artist_is_poc:
+        if self.match_artist_name is not None:
             matching_tracks = matching_tracks.filter(
-                pl.col(Track.has_poc_artist))
+                self.match_artist_name)
 
         if self.song_bpm_range:
             matching_tracks = matching_tracks.filter(
@@ -759,7 +1018,7 @@ class TrackLyricsFilter:
                 .with_columns(
                     pl.col(TrackLyrics.lyrics)
                     .str.to_lowercase()
-                    .str.extract_all('|'.join(self.lyrics_include.lower().split(',')))
+                    .str.extract_all('|'.join(map(re.escape, parse_filter_values(self.lyrics_include))))
                     .list.eval(pl.element().str.to_lowercase())
                     .list.unique()
                     .alias(TrackLyrics.matched_lyrics))\
@@ -775,6 +1034,18 @@ class TrackLyricsFilter:
         )
 
 
+@dataclass(slots=True)
+class ArtistSet:
+    """A collection of artists. Each `artist.id` should appear at most once within each collection."""
+    included_artists: PolarsLazyFrame[Artist]
+    is_filtered: bool
+
+    def sort_by(self, by, *more_by, descending: bool):
+        return (self if by is None or (isinstance(by, list) and len(by) == 0) else
+                ArtistSet(self.included_artists.sort(by, *more_by, descending=descending),
+                          is_filtered=self.is_filtered))
+
+
 ##############################
 # COMBINED FILTERING & JOINS #
 ##############################
@@ -794,6 +1065,38 @@ class CombinedData:
     tags: PolarsLazyFrame[Tag]
     tag_stats: PolarsLazyFrame[Tag]
     countries: list[str]
+    track_facets: FacetIndex | None = None
+    playlist_facets: FacetIndex | None = None
+    tracks_by_playlist_count: pl.DataFrame | None = None
+    """All track IDs with their global `playlist_count`, sorted by descending `playlist_count`."""
+    version: str = ''
+    """Identifies the version of the underlying data files (see `get_data_version`)."""
+    transition_graph: TransitionGraph | None = None
+    """The `tracks_adjacent` table as an in-memory graph, for the graph-based related song queries."""
+    similarity_index: SimilarityIndex | None = None
+    """Nearest neighbour lookups over the song embeddings (if they have been computed)."""
+    dj_similarity_index: DjSimilarityIndex | None = None
+    """Similarity estimates between the song sets of the DJs (if the signatures have been computed)."""
+    lyrics_index: LyricsIndex | None = None
+    """Word postings of the lyrics for ranked lyrics search (if they have been computed)."""
+    owners: PolarsLazyFrame[PlaylistOwner] | None = None
+    """The playlist owners with their global statistics (if they have been computed)."""
+    artists: PolarsLazyFrame[Artist] | None = None
+    """The individual artists with their global statistics (if they have been computed)."""
+    track_artists: PolarsLazyFrame[Artist] | None = None
+    """The `track.id` and `artist.id` of every (track, artist) pair, sorted by `track.id`."""
+    playlist_exclusions: ExclusionCache | None = None
+    """The tracks to remove for recent `playlist_exclude` filters (only set for the unrestricted playlists)."""
+    track_summaries: pl.LazyFrame | None = None
+    """The pre-aggregated playlist info of every track (if it has been computed, and only for the unrestricted playlists)."""
+    filter_compiler: FilterCompiler | None = None
+    """Resolves filter terms against the dictionaries of the `Enum` and tag columns."""
+
+    # Point lookups by ID, only set as long as the corresponding table is the unmodified file
+    track_row_groups: RowGroupIndex | None = None
+    track_playlist_row_groups: RowGroupIndex | None = None
+    playlist_track_row_groups: RowGroupIndex | None = None
+    track_lyrics_row_groups: RowGroupIndex | None = None
 
     @property
     def all_playlists(self) -> PlaylistSet:
@@ -801,9 +1104,9 @@ class CombinedData:
 
     def all_playlist_tracks(self, sorted_column: Literal['track.id', 'playlist.id']) -> PlaylistTrackSet:
         if sorted_column == Playlist.id:
-            return PlaylistTrackSet(self.playlist_tracks, is_filtered=False)
+            return PlaylistTrackSet(self.playlist_tracks, is_filtered=False, track_summaries=self.track_summaries)
         elif sorted_column == Track.id:
-            return PlaylistTrackSet(self.track_playlists, is_filtered=False)
+            return PlaylistTrackSet(self.track_playlists, is_filtered=False, track_summaries=self.track_summaries)
         else:
             raise ValueError(f'Invalid sorted_column: {sorted_column}')
 
@@ -815,21 +1118,100 @@ class CombinedData:
     def all_track_lyrics(self):
         return TrackLyricsSet(self.track_lyrics, is_filtered=False)
 
+    def restrict_to_tracks(self, track_ids: pl.Series) -> CombinedData:
+        """Return a view of this data that only contains the tracks with the given IDs."""
+        match_track_ids = pl.col(Track.id).is_in(track_ids.implode())
+
+        def restrict(data: pl.LazyFrame, row_groups: RowGroupIndex | None) -> pl.LazyFrame:
+            return row_groups.scan_ids(track_ids) if row_groups is not None else data.filter(match_track_ids)
+
+        return replace(
+            self,
+            playlist_tracks=self.playlist_tracks.filter(match_track_ids),
+            track_playlists=restrict(self.track_playlists, self.track_playlist_row_groups),
+            tracks=restrict(self.tracks, self.track_row_groups),
+            track_lyrics=restrict(self.track_lyrics, self.track_lyrics_row_groups),
+            owners=None,
+            track_row_groups=None,
+            track_playlist_row_groups=None,
+            playlist_track_row_groups=None,
+            track_lyrics_row_groups=None)
+
+    def restrict_to_playlists(self, playlist_ids: pl.Series) -> CombinedData:
+        """Return a view of this data that only contains the playlists with the given IDs."""
+        match_playlist_ids = pl.col(Playlist.id).is_in(playlist_ids.implode())
+        return replace(
+            self,
+            playlists=self.playlists.filter(match_playlist_ids),
+            playlist_tracks=self.playlist_track_row_groups.scan_ids(playlist_ids)
+            if self.playlist_track_row_groups is not None else self.playlist_tracks.filter(match_playlist_ids),
+            track_playlists=self.track_playlists.filter(match_playlist_ids),
+            owners=None,
+            playlist_exclusions=None,
+            track_summaries=None,
+            track_playlist_row_groups=None,
+            playlist_track_row_groups=None)
+
     @staticmethod
     def load_from_files():
         """Load the pre-generated data from the Parquet files."""
+        playlists = pl.scan_parquet(PLAYLIST_DATA_FILE)
+        playlist_tracks = pl.scan_parquet(PLAYLIST_TRACKS_DATA_FILE)
+        tracks = pl.scan_parquet(TRACK_DATA_FILE)
+        version = get_data_version()
+
+        playlist_exclusions = ExclusionCache(playlists, playlist_tracks, version=version)
+        playlist_exclusions.precompute()
+
+        filter_compiler = FilterCompiler(
+            dtypes=dict(playlists.collect_schema()) | dict(tracks.collect_schema()),
+            dictionaries={TrackTags.tags: pl.scan_parquet(TAGS_DATA_FILE)
+                          .select(pl.col(Tag.name).drop_nulls().unique().sort()).collect()[Tag.name].to_list()})
+
         return CombinedData(
-            playlists=pl.scan_parquet(PLAYLIST_DATA_FILE),
+            playlists=playlists,
             playlist_tags=pl.scan_parquet(PLAYLIST_TAGS_DATA_FILE),
-            playlist_tracks=pl.scan_parquet(PLAYLIST_TRACKS_DATA_FILE),
+            playlist_tracks=playlist_tracks,
             track_playlists=pl.scan_parquet(TRACK_PLAYLISTS_DATA_FILE),
-            tracks=pl.scan_parquet(TRACK_DATA_FILE),
+            tracks=tracks,
             tracks_adjacent=pl.scan_parquet(TRACK_ADJACENT_DATA_FILE),
             track_lyrics=pl.scan_parquet(TRACK_LYRICS_DATA_FILE),
             track_tags=pl.scan_parquet(TRACK_TAGS_DATA_FILE),
             tags=pl.scan_parquet(TAGS_DATA_FILE),
             tag_stats=pl.scan_parquet(TAG_STATS_DATA_FILE),
             countries=pl.read_csv(COUNTRY_DATA_FILE)['country'].to_list(),
+            track_facets=FacetIndex.build(
+                tracks, id_column=Track.id,
+                facet_columns=[Track.has_queer_artist, Track.has_poc_artist, TrackTags.tags]),
+            playlist_facets=FacetIndex.build(
+                playlists, id_column=Playlist.id,
+                facet_columns=[Playlist.is_social_set, Playlist.country, Playlist.region, PlaylistTags.tags]),
+            tracks_by_playlist_count=tracks
+            .select(Track.id, Stats.playlist_count)
+            .sort(Stats.playlist_count, descending=True, nulls_last=True)
+            .collect(),
+            version=version,
+            transition_graph=TransitionGraph.build(pl.scan_parquet(TRACK_ADJACENT_DATA_FILE)),
+            similarity_index=SimilarityIndex.load(TRACK_EMBEDDINGS_DATA_FILE)
+            if os.path.exists(TRACK_EMBEDDINGS_DATA_FILE) else None,
+            dj_similarity_index=DjSimilarityIndex.load(DJ_SIGNATURES_DATA_FILE)
+            if os.path.exists(DJ_SIGNATURES_DATA_FILE) else None,
+            lyrics_index=LyricsIndex.load(TRACK_LYRICS_POSTINGS_DATA_FILE)
+            if os.path.exists(TRACK_LYRICS_POSTINGS_DATA_FILE) else None,
+            owners=pl.scan_parquet(OWNERS_DATA_FILE)
+            if os.path.exists(OWNERS_DATA_FILE) else None,
+            artists=pl.scan_parquet(ARTISTS_DATA_FILE)
+            if os.path.exists(ARTISTS_DATA_FILE) else None,
+            track_artists=pl.scan_parquet(TRACK_ARTISTS_DATA_FILE)
+            if os.path.exists(TRACK_ARTISTS_DATA_FILE) else None,
+            playlist_exclusions=playlist_exclusions,
+            track_summaries=pl.scan_parquet(TRACK_SUMMARIES_DATA_FILE)
+            if os.path.exists(TRACK_SUMMARIES_DATA_FILE) else None,
+            filter_compiler=filter_compiler,
+            track_row_groups=RowGroupIndex.load(TRACK_DATA_FILE, id_column=Track.id),
+            track_playlist_row_groups=RowGroupIndex.load(TRACK_PLAYLISTS_DATA_FILE, id_column=Track.id),
+            playlist_track_row_groups=RowGroupIndex.load(PLAYLIST_TRACKS_DATA_FILE, id_column=Playlist.id),
+            track_lyrics_row_groups=RowGroupIndex.load(TRACK_LYRICS_DATA_FILE, id_column=Track.id),
         )
 
 
@@ -882,6 +1264,9 @@ class CombinedFilter:
     lyrics_in_result: bool = True
     """Whether to included lyrics-related columns in the returned dataset."""
 
+    trace: QueryTrace | None = None
+    """Records the chosen filter order and the intermediate stages (see `SearchEngine.explain`)."""
+
     def get_optimal_filter_order(self) -> FilterOrder | list[FilterType]:
         """
         Decide the performance-optimal filtering order for the current query.
@@ -1029,22 +1414,41 @@ class CombinedFilter:
         else:
             raise ValueError(f'Invalid order value: {order}')
 
+        if self.trace is not None:
+            self.trace.record_filter_order(order)
+            # Unfiltered sets, and the lyrics unless they are filtered by or included in the result,
+            # do not feed into this query (and would only be counted needlessly by `profile`)
+            uses_lyrics = self.lyrics_filter.has_filters or self.lyrics_in_result
+            self.trace.record_stages({
+                Stage.Playlists: matching_playlists.included_playlists
+                if matching_playlists.is_filtered else None,
+                Stage.PlaylistTracks: matching_playlist_tracks.included_playlist_tracks
+                if matching_playlist_tracks.is_filtered else None,
+                Stage.Tracks: matching_tracks.included_tracks
+                if matching_tracks.is_filtered else None,
+                Stage.Lyrics: matching_lyrics.included_track_lyrics
+                if matching_lyrics.is_filtered and uses_lyrics else None,
+            })
+
         aggregation_mode = aggregate_by or self.aggregate_by
 
         # NOTE: This protects users from limitations of the current implementation
-        if aggregation_mode != 'track' and not isinstance(order, list):
+        if aggregation_mode not in ('owner', 'track', 'artist') and not isinstance(order, list):
             raise ValueError(f'Aggregation mode {aggregation_mode} is not allowed for non-custom filter orders')
 
         match aggregation_mode:
             case 'playlist':
                 return matching_playlists
             case 'owner':
-                return matching_playlists.group_by(PlaylistOwner.id)
+                return matching_playlist_tracks.aggregate_by_owner(
+                    matching_playlists, data.all_tracks, data.owners, playlist_limit=self.playlist_limit)
             case 'track':
                 return matching_tracks
             case 'artist':
-                # TODO: Group by individual artists
-                return matching_tracks.group_by(Track.artist_names)
+                if data.artists is None or data.track_artists is None:
+                    raise RuntimeError('data.artists must be initialized to aggregate by artist')
+                return matching_tracks.aggregate_by_artist(
+                    data.track_artists, data.artists, song_limit=self.playlist_limit)
             case _:
                 raise ValueError(f'Invalid aggregate_by value: {aggregate_by}')
 
@@ -1076,21 +1480,165 @@ type PlaylistSortKey = Literal[
 ]
 
 
+class QuerySpec(NamedTuple):
+    """A single query within a `SearchEngine.batch(...)` call."""
+
+    method: str
+    """The name of the `SearchEngine.find_*` method to call."""
+
+    params: Mapping[str, Any] = MappingProxyType({})
+    """The keyword arguments to pass to the method (read-only by default, as it is shared by all instances)."""
+
+    output: int | None = None
+    """For methods returning a tuple of LazyFrames (e.g. `find_related_songs`), which one to use."""
+
+    then: Callable[[pl.LazyFrame], pl.LazyFrame] | None = None
+    """Additional processing to apply to the result of the method."""
+
+
+class _BuiltQuery(NamedTuple):
+    query: pl.LazyFrame
+    seconds: float
+
+
+TOP_K_SORT_KEYS: Final[tuple[TrackSortKey, ...]] = (
+    'hit_count',
+    'matching_playlist_count',
+    'playlist_count',
+    'dj_count',
+)
+"""Sort keys whose values are bounded by `hit_count` resp. the global `playlist_count` of a track."""
+
+TOP_K_MIN_BATCH_SIZE: Final = 1000
+"""The minimum number of tracks visited by the first batch of a top-K query."""
+
+
 class SearchEngine:
     """Encapsulates the logic of filtering for specific songs, playlists etc."""
 
     data: CombinedData
 
+    use_top_k: bool = True
+    """Whether to evaluate sorted & limited `find_songs` queries via `find_songs_top_k`."""
+
+    page_cache: SortedIdCache
+    """The sorted ID lists of recent `find_*_page` queries."""
+
+    trend_cache: TrendScoreCache
+    """The trend scores of all songs for recent `find_trending_songs` parameters."""
+
+    fuzzy_indexes: dict[str, FuzzyIndex]
+    """The name lookup indexes for `find_fuzzy_matches`, built on first use."""
+
+    autocomplete_indexes: dict[str, PrefixIndex]
+    """The name prefix indexes for `autocomplete`, built on first use."""
+
+    trace: QueryTrace | None = None
+    """Collects information about the queries being built, see `explain`."""
+
     def load_data(self):
         """Load the pre-generated data from the Parquet files."""
         self.data = CombinedData.load_from_files()
+        self.page_cache = SortedIdCache()
+        self.trend_cache = TrendScoreCache()
+        self.fuzzy_indexes = {}
+        self.autocomplete_indexes = {}
+
+    def with_data(self, data: CombinedData) -> SearchEngine:
+        """Return a search engine over a different view of the data (e.g. from `CombinedData.restrict_to_tracks`)."""
+        engine = SearchEngine()
+        engine.data = data
+        engine.page_cache = self.page_cache
+        engine.trend_cache = self.trend_cache
+        # The names in a different view of the data differ, so its name indexes need to be built separately
+        engine.fuzzy_indexes = {}
+        engine.autocomplete_indexes = {}
+        engine.use_top_k = self.use_top_k
+        engine.trace = self.trace
+        return engine
+
+    def build_query(self, query: QuerySpec) -> pl.LazyFrame:
+        """Build the (lazy) query for a single `QuerySpec`."""
+        return self._finish_query(query, self._start_query(query))
+
+    def batch(self, queries: list[QuerySpec]) -> list[pl.DataFrame]:
+        """
+        Evaluate several queries at once, returning the results in the same order.
+
+        Queries calling the same method with the same parameters share a single
+        (sub)plan, even if they apply different processing to it afterwards, and
+        everything is collected via a single `collect_all`, so scans and joins
+        common to several of the queries are only evaluated once (also when run via
+        `AsyncSearchEngine`, see `utils.query_context`).
+        """
+        shared_results: dict[str, pl.LazyFrame | tuple[pl.LazyFrame, ...]] = {}
+        frames: list[pl.LazyFrame] = []
+
+        for query in queries:
+            query_key = get_query_key(query.method, dict(query.params))
+            if query_key not in shared_results:
+                shared_results[query_key] = self._start_query(query)
+            frames.append(self._finish_query(query, shared_results[query_key]))
+
+        return collect_stages(frames)
+
+    def _start_query(self, query: QuerySpec) -> pl.LazyFrame | tuple[pl.LazyFrame, ...]:
+        if not query.method.startswith('find_') or query.method.endswith('_page'):
+            raise ValueError(f'Invalid query method: {query.method}')
+        return getattr(self, query.method)(**query.params)
+
+    def _finish_query(self, query: QuerySpec, result: pl.LazyFrame | tuple[pl.LazyFrame, ...]) -> pl.LazyFrame:
+        if isinstance(result, tuple):
+            if query.output is None:
+                raise ValueError(f'Must specify the output to use for {query.method}')
+            result = result[query.output]
+        return query.then(result) if query.then is not None else result
+
+    def explain(self, query: QuerySpec) -> QueryExplanation:
+        """Describe how a query (for any of the `find_*` methods) would be evaluated, without running it."""
+        explanation, _, _ = self._trace_query(query)
+        return explanation
+
+    def profile(self, query: QuerySpec) -> QueryProfile:
+        """Run a query, and report its plan, per-node timings and the row counts of its filter stages."""
+        explanation, trace, built = self._trace_query(query)
+        result, node_timings = built.query.profile(engine='streaming')
+        # NOTE: Collected one by one, because polars fails to resolve some combinations of stages
+        #       (e.g. an unfiltered lyrics stage without the lyrics column) in a single collect_all
+        stage_counts = [frame.select(pl.len()).collect(engine='streaming') for frame in trace.stages.values()]
+
+        return QueryProfile(
+            explanation=explanation,
+            build_seconds=built.seconds,
+            node_timings=node_timings,
+            stage_row_counts={stage: counts.item() for stage, counts in zip(trace.stages, stage_counts)},
+            result_row_count=len(result),
+        )
+
+    def _trace_query(self, query: QuerySpec) -> tuple[QueryExplanation, QueryTrace, _BuiltQuery]:
+        # Tracing happens on a copy, as the engine itself may be shared between threads
+        traced = self.with_data(self.data)
+        traced.trace = QueryTrace()
+
+        started_at = time.perf_counter()
+        built = _BuiltQuery(traced.build_query(query), time.perf_counter() - started_at)
+
+        explanation = QueryExplanation(
+            method=query.method,
+            filter_order=traced.trace.filter_order,
+            notes=traced.trace.notes,
+            plan=built.query.explain(optimized=True),
+        )
+        return explanation, traced.trace, built
 
     def get_stats(self) -> tuple[int, int, int, int, int]:
         """Compute statistics about the database content."""
         songs_count, = count_n_unique(self.data.tracks, [Track.id])
-        # TODO: Count the number of unique artsits within track.artists instead
-        artists_count, = count_n_unique(
-            self.data.tracks, [Track.artist_names])
+        if self.data.artists is not None:
+            artists_count, = count_n_unique(self.data.artists, [Artist.id])
+        else:
+            artists_count, = count_n_unique(
+                self.data.tracks, [Track.artist_names])
         playlists_count, djs_count = count_n_unique(
             self.data.playlists, [Playlist.id, PlaylistOwner.name])
         lyrics_count = count_n_unique(
@@ -1245,6 +1793,127 @@ class SearchEngine:
 
         return matching_tracks.with_extra_columns().included_tracks
 
+    def get_fuzzy_index(self, kind: Literal['track', 'artist', 'owner']) -> FuzzyIndex:
+        """Return the name lookup index for the given kind of entries, building it on first use."""
+        index = self.fuzzy_indexes.get(kind)
+        if index is not None:
+            return index
+
+        match kind:
+            case 'track':
+                entries = self.data.tracks.select(Track.id, Track.name, Stats.playlist_count).collect()
+                index = FuzzyIndex.build(entries, id_column=Track.id, name_column=Track.name,
+                                         popularity_column=Stats.playlist_count)
+            case 'artist':
+                if self.data.artists is None:
+                    raise RuntimeError('data.artists must be initialized to look up artists')
+                entries = self.data.artists.select(Artist.id, Artist.name, Stats.playlist_count).collect()
+                index = FuzzyIndex.build(entries, id_column=Artist.id, name_column=Artist.name,
+                                         popularity_column=Stats.playlist_count)
+            case 'owner':
+                entries = self.data.owners.select(PlaylistOwner.id, PlaylistOwner.name, Stats.playlist_count)\
+                    .collect() if self.data.owners is not None else self.data.playlists\
+                    .group_by(PlaylistOwner.id)\
+                    .agg(pl.col(PlaylistOwner.name).drop_nulls().first(), pl.len().alias(Stats.playlist_count))\
+                    .collect()
+                index = FuzzyIndex.build(entries, id_column=PlaylistOwner.id, name_column=PlaylistOwner.name,
+                                         popularity_column=Stats.playlist_count)
+            case _:
+                raise ValueError(f'Invalid kind: {kind}')
+
+        self.fuzzy_indexes[kind] = index
+        return index
+
+    def find_fuzzy_matches(
+        self,
+        kind: Literal['track', 'artist', 'owner'],
+        name: str,
+        *,
+        limit: int | None = DEFAULT_CANDIDATE_LIMIT,
+    ) -> pl.LazyFrame:
+        """
+        Returns the songs, artists or DJs whose names match the given (possibly misspelled) name,
+        ranked by `edit_distance` and then by `playlist_count`.
+        """
+        return self.get_fuzzy_index(kind).find(name, limit=limit).lazy()
+
+    def expand_fuzzy_names(
+        self,
+        *,
+        song_name: TextFilter = '',
+        artist_name: TextFilter = '',
+        dj_name: TextFilter = '',
+    ) -> tuple[TextFilter, TextFilter, TextFilter]:
+        """
+        Add the names of the fuzzy matches of each (comma-separated) value of the name filters.
+
+        The values themselves are kept, so the expanded filters match at least what they matched before.
+        Values whose words all occur in some name are not misspelled, and are not expanded at all
+        (e.g. "love" is not expanded by "live" or "move").
+        """
+        def expand(kind: Literal['track', 'artist', 'owner'], filter_expression: TextFilter) -> TextFilter:
+            values = parse_filter_values(filter_expression)
+            if not values:
+                return filter_expression
+
+            index = self.get_fuzzy_index(kind)
+            expanded_values = []
+            for value in values:
+                expanded_values.append(value)
+                if not index.contains_words(value):
+                    expanded_values.extend(name.lower() for name in index.find(value)[index.name_column].to_list())
+            return list(dict.fromkeys(expanded_values))
+
+        return expand('track', song_name), expand('artist', artist_name), expand('owner', dj_name)
+
+    def get_autocomplete_index(self, kind: Literal['track', 'artist', 'owner', 'playlist', 'tag']) -> PrefixIndex:
+        """Return the name prefix index for the given kind of names, building it on first use."""
+        index = self.autocomplete_indexes.get(kind)
+        if index is not None:
+            return index
+
+        match kind:
+            case 'track':
+                index = PrefixIndex.build(self.data.tracks, name_column=Track.name,
+                                          popularity_column=Stats.playlist_count)
+            case 'artist':
+                artists = self.data.artists if self.data.artists is not None else self.data.tracks\
+                    .select(pl.col(Track.artists).alias(Artist.name), Stats.playlist_count)\
+                    .explode(Artist.name)
+                index = PrefixIndex.build(artists, name_column=Artist.name,
+                                          popularity_column=Stats.playlist_count)
+            case 'owner':
+                owners = self.data.owners if self.data.owners is not None else self.data.playlists\
+                    .group_by(PlaylistOwner.id)\
+                    .agg(pl.col(PlaylistOwner.name).drop_nulls().first(), pl.len().alias(Stats.playlist_count))
+                index = PrefixIndex.build(owners, name_column=PlaylistOwner.name,
+                                          popularity_column=Stats.playlist_count)
+            case 'playlist':
+                playlists = self.data.playlists.select(Playlist.name, pl.lit(1).alias(Stats.playlist_count))
+                index = PrefixIndex.build(playlists, name_column=Playlist.name,
+                                          popularity_column=Stats.playlist_count)
+            case 'tag':
+                index = PrefixIndex.build(self.data.tags, name_column=Tag.name,
+                                          popularity_column=Tag.playlist_count)
+            case _:
+                raise ValueError(f'Invalid kind: {kind}')
+
+        self.autocomplete_indexes[kind] = index
+        return index
+
+    def autocomplete(
+        self,
+        kind: Literal['track', 'artist', 'owner', 'playlist', 'tag'],
+        prefix: str,
+        *,
+        limit: int | None = DEFAULT_COMPLETION_LIMIT,
+    ) -> pl.DataFrame:
+        """
+        Returns the most popular song, artist, DJ, playlist or tag names that
+        have a word starting with the given prefix, with their `playlist_count`.
+        """
+        return self.get_autocomplete_index(kind).complete(prefix, limit=limit)
+
     def find_songs(
         self,
         *,
@@ -1267,6 +1936,7 @@ class SearchEngine:
         # Playlist-specific filters
         #
         country: str | list[str] = '',
+        region: TextFilter = '',
         dj_name: str = '',
         dj_name_exclude: str = '',
         playlist_include: str = '',
@@ -1285,8 +1955,17 @@ class SearchEngine:
         descending: bool = True,
         skip_num_top_results: int = 0,
         limit: int | None = None,
+        fuzzy: bool = False,
     ) -> pl.LazyFrame:
-        """Returns the songs that match the given query."""
+        """
+        Returns the songs that match the given query.
+
+        With `fuzzy`, misspelled song, artist and DJ names also match the closest matching names.
+        """
+
+        if fuzzy:
+            song_name, artist_name, dj_name = self.expand_fuzzy_names(
+                song_name=song_name, artist_name=artist_name, dj_name=dj_name)
 
         if isinstance(sort_by, str):
             _sort_by: list[TrackSortKey] = [sort_by]
@@ -1308,10 +1987,14 @@ class SearchEngine:
 
         playlist_filter = PlaylistFilter(
             country=country,
+            region=region,
             dj_name=dj_name,
             dj_name_exclude=dj_name_exclude,
             playlist_include=playlist_include,
             playlist_exclude=playlist_exclude,
+            facets=self.data.playlist_facets,
+            compiler=self.data.filter_compiler,
+            exclusions=self.data.playlist_exclusions,
         )
 
         playlist_track_filter = PlaylistTrackFilter(
@@ -1330,6 +2013,8 @@ class SearchEngine:
             pre_filter=PreFilterOptions(sort_by, limit, descending)
             if is_sorted_by_any_of('playlist_count', 'dj_count')
             and limit is not None else None,
+            facets=self.data.track_facets,
+            compiler=self.data.filter_compiler,
         )
 
         lyrics_filter = TrackLyricsFilter(
@@ -1349,18 +2034,113 @@ class SearchEngine:
             track_in_result=True,
             lyrics_filter=lyrics_filter,
             lyrics_in_result=lyrics_in_result,
+            trace=self.trace,
         )
 
         #####################
         # Perform filtering #
         #####################
 
-        matching_tracks = combined_filter.filter_tracks(self.data)
+        if self.use_top_k\
+                and limit is not None\
+                and descending\
+                and playlist_in_result\
+                and track_filter.pre_filter is None\
+                and is_sorted_by_any_of(*TOP_K_SORT_KEYS):
+            if self.trace is not None:
+                self.trace.notes.append(f'Top-K evaluation (k={skip_num_top_results + limit}),'
+                                        ' stages are from the last batch')
+            matching_tracks = self.find_songs_top_k(
+                combined_filter, sort_by=_sort_by, k=skip_num_top_results + limit)
+        else:
+            matching_tracks = combined_filter.filter_tracks(self.data)
 
         return matching_tracks.with_extra_columns()\
             .sort_by(sort_by, descending=descending)\
             .included_tracks.slice(skip_num_top_results, limit or None)
 
+    def find_songs_top_k(self, combined_filter: CombinedFilter, *, sort_by: list[TrackSortKey], k: int) -> TrackSet:
+        """
+        Find the (up to) `k` best tracks matching `combined_filter`, sorted descending by `sort_by`.
+
+        All of the `TOP_K_SORT_KEYS` of a track are bounded by either the number of
+        search terms (`hit_count`) or by its global `playlist_count` (everything else),
+        so we visit the tracks in batches of decreasing global `playlist_count` and
+        stop as soon as the K-th best result found so far can no longer be beaten by
+        any of the remaining tracks. Unlike the other `find_*` methods, this performs
+        the actual aggregation eagerly.
+        """
+        if not set(sort_by).issubset(TOP_K_SORT_KEYS):
+            raise ValueError(f'Top-K evaluation is not supported for sort_by={sort_by}')
+
+        ranked_tracks = self.data.tracks_by_playlist_count
+        max_hit_count = combined_filter.playlist_filter.max_hit_count
+        data = self.data
+
+        # Only tracks from matching playlists can be part of the result, and only
+        # playlists that are matching (or excluded) affect their aggregated columns,
+        # so we read those once instead of scanning the full files for every batch
+        if combined_filter.playlist_filter.has_filters:
+            playlists = combined_filter.playlist_filter.filter_playlists(
+                data.all_playlists, include_matched_terms=False)
+            matching_playlist_ids, excluded_playlist_ids = collect_stages([
+                playlists.included_playlists.select(Playlist.id),
+                playlists.excluded_playlists.select(Playlist.id) if playlists.excluded_playlists is not None
+                else pl.LazyFrame(schema={Playlist.id: pl.String}),
+            ])
+            relevant_playlist_ids = pl.concat([matching_playlist_ids, excluded_playlist_ids]).lazy()
+
+            relevant_playlists, relevant_playlist_tracks = collect_stages([
+                data.playlists.join(relevant_playlist_ids, how='semi', on=Playlist.id),
+                data.playlist_tracks.join(relevant_playlist_ids, how='semi', on=Playlist.id),
+            ])
+            candidate_track_ids = relevant_playlist_tracks\
+                .filter(pl.col(Playlist.id).is_in(matching_playlist_ids[Playlist.id].implode()))\
+                .join(relevant_playlist_tracks
+                      .filter(pl.col(Playlist.id).is_in(excluded_playlist_ids[Playlist.id].implode())),
+                      how='anti', on=Track.id)\
+                .select(pl.col(Track.id).unique())
+
+            candidate_tracks = pl.col(Track.id).is_in(candidate_track_ids[Track.id].implode())
+            ranked_tracks = ranked_tracks.filter(candidate_tracks)
+            data = replace(data,
+                           playlists=relevant_playlists.lazy(),
+                           playlist_tracks=relevant_playlist_tracks.lazy(),
+                           track_playlists=relevant_playlist_tracks.lazy(),
+                           tracks=collect_stage(data.tracks.filter(candidate_tracks)).lazy(),
+                           track_row_groups=None,
+                           track_playlist_row_groups=None,
+                           playlist_track_row_groups=None)
+
+        best_tracks: pl.DataFrame | None = None
+        start = 0
+        batch_size = max(k, TOP_K_MIN_BATCH_SIZE)
+
+        while True:
+            batch = ranked_tracks.slice(start, batch_size)
+            start += batch_size
+            batch_size *= 2
+
+            matching_tracks = collect_stage(combined_filter
+                                            .filter_tracks(data.restrict_to_tracks(batch[Track.id]))
+                                            .included_tracks)
+
+            best_tracks = matching_tracks if best_tracks is None else\
+                pl.concat([best_tracks, matching_tracks]).top_k(k, by=sort_by)
+
+            if start >= len(ranked_tracks):
+                break
+
+            if len(best_tracks) >= k:
+                remaining_playlist_count = ranked_tracks[Stats.playlist_count][start] or 0
+                upper_bound = tuple(max_hit_count if key == 'hit_count' else remaining_playlist_count
+                                    for key in sort_by)
+                kth_best = best_tracks.sort(sort_by, descending=True).select(sort_by).row(k - 1)
+                if tuple(value or 0 for value in kth_best) >= upper_bound:
+                    break
+
+        return TrackSet(best_tracks.top_k(k, by=sort_by).lazy(), is_filtered=True)
+
     def find_playlists(
         self,
         *,
@@ -1373,6 +2153,7 @@ class SearchEngine:
         # Playlist-specific filters
         #
         country: TextFilter = '',
+        region: TextFilter = '',
         dj_name: TextFilter = '',
         playlist_include: TextFilter = '',
         playlist_exclude: TextFilter = '',
@@ -1401,11 +2182,15 @@ class SearchEngine:
 
         playlist_filter = PlaylistFilter(
             country=country,
+            region=region,
             dj_name=dj_name,
             playlist_include=playlist_include,
             playlist_exclude=playlist_exclude,
             playlist_tag_include=tag_include,
             playlist_tag_exclude=tag_exclude,
+            facets=self.data.playlist_facets,
+            compiler=self.data.filter_compiler,
+            exclusions=self.data.playlist_exclusions,
         )
 
         #####################
@@ -1430,6 +2215,14 @@ class SearchEngine:
                     self.data.all_playlists,
                     include_matched_terms=True)
 
+        if self.trace is not None:
+            self.trace.record_stages({
+                Stage.Playlists: matching_playlists.included_playlists
+                if matching_playlists.is_filtered else None,
+                Stage.Tracks: matching_tracks.included_tracks
+                if matching_tracks.is_filtered else None,
+            })
+
         if extracted_playlist_data_in_result:
             matching_playlists =\
                 matching_playlists.with_extracted_data()
@@ -1438,6 +2231,172 @@ class SearchEngine:
             .sort_by(sort_by, descending=descending)\
             .included_playlists.slice(0, limit or None)
 
+    def find_artists(
+        self,
+        *,
+        #
+        # Track-specific filters
+        #
+        song_name: str = '',
+        song_bpm_range: tuple[int, int] | None = None,
+        song_release_date: str = '',
+        artist_name: TextFilter = '',
+        artist_is_queer: bool = False,
+        artist_is_poc: bool = False,
+        lyrics_include: TextFilter = '',
+        lyrics_exclude: TextFilter = '',
+        tag_include: TextFilter = '',
+        tag_exclude: TextFilter = '',
+        #
+        # Playlist-specific filters
+        #
+        country: str | list[str] = '',
+        region: TextFilter = '',
+        dj_name: str = '',
+        dj_name_exclude: str = '',
+        playlist_include: str = '',
+        playlist_exclude: str = '',
+        #
+        # Playlist-membership specific filters
+        #
+        added_to_playlist_date: str = '',
+        #
+        # Result options
+        #
+        song_limit: int | None = 10,
+        sort_by: Artist.SortFields | list[Artist.SortFields] | None = 'matching_song_count',
+        descending: bool = True,
+        limit: int | None = None,
+    ) -> pl.LazyFrame:
+        """Returns the artists of the songs that match the given query, with the number of matching songs per artist."""
+
+        #####################
+        # Filter parameters #
+        #####################
+
+        combined_filter = CombinedFilter(
+            aggregate_by='artist',
+            playlist_filter=PlaylistFilter(
+                country=country,
+                region=region,
+                dj_name=dj_name,
+                dj_name_exclude=dj_name_exclude,
+                playlist_include=playlist_include,
+                playlist_exclude=playlist_exclude,
+                facets=self.data.playlist_facets,
+                compiler=self.data.filter_compiler,
+                exclusions=self.data.playlist_exclusions,
+            ),
+            playlist_in_result=False,
+            playlist_limit=song_limit,
+            playlist_track_filter=PlaylistTrackFilter(
+                added_to_playlist_date=added_to_playlist_date,
+            ),
+            playlist_track_in_result=False,
+            track_filter=TrackFilter(
+                song_name=song_name,
+                song_bpm_range=song_bpm_range,
+                song_release_date=song_release_date,
+                artist_name=artist_name,
+                artist_is_queer=artist_is_queer,
+                artist_is_poc=artist_is_poc,
+                tag_include=tag_include,
+                tag_exclude=tag_exclude,
+                facets=self.data.track_facets,
+                compiler=self.data.filter_compiler,
+            ),
+            track_in_result=False,
+            lyrics_filter=TrackLyricsFilter(
+                lyrics_include=lyrics_include,
+                lyrics_exclude=lyrics_exclude,
+            ),
+            lyrics_in_result=False,
+            trace=self.trace,
+        )
+
+        #####################
+        # Perform filtering #
+        #####################
+
+        matching_artists: ArtistSet = combined_filter.apply_filters(
+            self.data,
+            order=combined_filter.get_optimal_filter_order(),
+            aggregate_by='artist')
+
+        return matching_artists\
+            .sort_by(sort_by, descending=descending)\
+            .included_artists.slice(0, limit or None)
+
+    def find_songs_page(
+        self,
+        *,
+        cursor: str | None = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        **query: Any,
+    ) -> Page:
+        """
+        Returns a single page of the results of `find_songs(**query)`.
+
+        Pass the `next_cursor` resp. `previous_cursor` of the returned page
+        (together with the same query) to get the next resp. previous page.
+        """
+        if 'skip_num_top_results' in query or 'limit' in query:
+            raise ValueError("Use cursor and page_size instead of skip_num_top_results and limit")
+
+        if query.get('fuzzy'):
+            # Resolve the names once, so all pages (and the sorted IDs) use the same ones
+            song_name, artist_name, dj_name = self.expand_fuzzy_names(
+                song_name=query.get('song_name', ''),
+                artist_name=query.get('artist_name', ''),
+                dj_name=query.get('dj_name', ''))
+            query = query | {'song_name': song_name, 'artist_name': artist_name, 'dj_name': dj_name, 'fuzzy': False}
+
+        sort_by = query.get('sort_by') or []
+        sort_by = [sort_by] if isinstance(sort_by, str) else list(sort_by)
+
+        return paginate(
+            kind='songs',
+            query=query,
+            cursor=cursor,
+            page_size=page_size,
+            version=self.data.version,
+            cache=self.page_cache,
+            id_column=Track.id,
+            sort_by=sort_by,
+            descending=query.get('descending', True),
+            find_sorted_ids=lambda: self.find_songs(**(query | {'sort_by': None})).select(Track.id, *sort_by),
+            fetch_rows=lambda track_ids: self.with_data(self.data.restrict_to_tracks(track_ids)).find_songs(**query),
+        )
+
+    def find_playlists_page(
+        self,
+        *,
+        cursor: str | None = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        **query: Any,
+    ) -> Page:
+        """Returns a single page of the results of `find_playlists(**query)`, see `find_songs_page`."""
+        if 'limit' in query:
+            raise ValueError("Use cursor and page_size instead of limit")
+
+        sort_by = query.get('sort_by') or []
+        sort_by = [sort_by] if isinstance(sort_by, str) else list(sort_by)
+
+        return paginate(
+            kind='playlists',
+            query=query,
+            cursor=cursor,
+            page_size=page_size,
+            version=self.data.version,
+            cache=self.page_cache,
+            id_column=Playlist.id,
+            sort_by=sort_by,
+            descending=query.get('descending', True),
+            find_sorted_ids=lambda: self.find_playlists(**(query | {'sort_by': None})).select(Playlist.id, *sort_by),
+            fetch_rows=lambda playlist_ids: self.with_data(
+                self.data.restrict_to_playlists(playlist_ids)).find_playlists(**query),
+        )
+
     def find_date_formats_by_dj(
         self,
         *,
@@ -1485,7 +2444,7 @@ class SearchEngine:
             .explode(Stats.date_formats)\
             .group_by(PlaylistOwner.id, Stats.date_formats().alias(Stats.date_formats))\
             .agg(PlaylistOwner.name().first(),
-                 Stats.date_formats().count())\
+                 Stats.date_formats().count().alias(Stats.date_format_counts))\
             .group_by(PlaylistOwner.id)\
             .agg(PlaylistOwner.name().first(),
                  Stats.date_formats().sort_by(Stats.date_format_counts, descending=True),
@@ -1516,37 +2475,64 @@ class SearchEngine:
         # Filter parameters #
         #####################
 
-        playlist_filter = PlaylistFilter(
-            dj_name=dj_name,
-            playlist_include=playlist_name,
+        combined_filter = CombinedFilter(
+            aggregate_by='owner',
+            playlist_filter=PlaylistFilter(
+                dj_name=dj_name,
+                playlist_include=playlist_name,
+            ),
+            playlist_in_result=False,
+            playlist_limit=playlist_limit,
+            playlist_track_in_result=False,
+            track_in_result=False,
+            lyrics_in_result=False,
+            trace=self.trace,
         )
 
         #####################
         # Perform filtering #
         #####################
 
-        matching_playlists =\
-            playlist_filter.filter_playlists(
-                self.data.all_playlists,
-                include_matched_terms=False)
-
-        return self.data.all_tracks\
-            .filter_playlist_tracks(
-                matching_playlists.filter_playlist_tracks(
-                    self.data.all_playlist_tracks(Playlist.id),
-                    include_playlist_info=True),
-                include_track_info=True)\
-            .included_playlist_tracks.group_by(PlaylistOwner.name, PlaylistOwner.id)\
-            .agg(pl.n_unique(Track.id).alias(Stats.song_count),
-                 pl.n_unique(Track.artist_names).alias(Stats.artist_count),
-                 pl.n_unique(Playlist.name).alias(Stats.playlist_count),
-                 pl.col(Playlist.name).drop_nulls().unique()
-                 .sort().slice(0, playlist_limit or None))\
-            .with_columns(
+        matching_owners: PlaylistOwnerSet = combined_filter.apply_filters(
+            self.data,
+            order=combined_filter.get_optimal_filter_order(),
+            aggregate_by='owner')
+
+        return matching_owners\
+            .sort_by(Stats.playlist_count, descending=True)\
+            .included_owners.slice(0, dj_limit or None)
+
+    def find_similar_djs(
+        self,
+        *,
+        dj_name: TextFilter = '',
+        dj_limit: int | None = 20,
+    ) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+        """
+        Returns the DJs whose songs overlap most with the songs of the specified DJs (taken together),
+        based on the MinHash signatures computed at build time instead of the playlist entries.
+        """
+        if self.data.dj_similarity_index is None:
+            raise RuntimeError(
+                'self.data.dj_similarity_index must be initialized to use similar DJ lookup')
+
+        # Same matching logic as the dj_name filter of PlaylistFilter
+        match_dj_name = or_filter(
+            create_text_filter(dj_name, PlaylistOwner.name),
+            create_text_filter(dj_name, PlaylistOwner.id))
+        if match_dj_name is None:
+            raise ValueError('Must specify dj_name for similar DJ lookup')
+
+        def with_owner_url(djs: pl.DataFrame) -> pl.LazyFrame:
+            return djs.lazy().with_columns(
                 pl.when(pl.col(PlaylistOwner.id).is_not_null()).then(pl.concat_str(
-                    pl.lit('https://open.spotify.com/user/'), PlaylistOwner.id)).alias(PlaylistOwner.url))\
-            .sort(Stats.playlist_count, descending=True)\
-            .slice(0, dj_limit or None)
+                    pl.lit('https://open.spotify.com/user/'), PlaylistOwner.id)).alias(PlaylistOwner.url))
+
+        index = self.data.dj_similarity_index
+        matching_rows = index.djs.with_row_index().filter(match_dj_name)['index'].to_numpy()
+
+        return (with_owner_url(index.djs[matching_rows]),
+                with_owner_url(index.find_similar(matching_rows, limit=dj_limit)))
 
     def find_related_songs(
         self,
@@ -1572,14 +2558,22 @@ class SearchEngine:
             track_filter.filter_tracks(
                 self.data.all_tracks)
 
+        if self.trace is not None:
+            self.trace.record_stages({Stage.Tracks: matching_tracks.included_tracks
+                                      if matching_tracks.is_filtered else None})
+
         tracks_adjacent = self.data.tracks_adjacent\
             .rename({Stats.playlist_count: TrackAdjacent.times_played_together})
 
         if not matching_tracks.is_filtered:
             # Prefilter to avoid very large join
-            tracks_adjacent = tracks_adjacent\
-                .sort(TrackAdjacent.times_played_together, descending=True)\
-                .slice(0, limit)
+            if self.data.transition_graph is not None and limit is not None:
+                # Selects the top pairs without sorting the whole table
+                tracks_adjacent = self.data.transition_graph.top_edges(limit).lazy()
+            else:
+                tracks_adjacent = tracks_adjacent\
+                    .sort(TrackAdjacent.times_played_together, descending=True)\
+                    .slice(0, limit)
 
         def find_adjacent_tracks(starting_tracks: TrackSet, direction: Literal['prev', 'next']):
             if direction == 'next':
@@ -1648,6 +2642,195 @@ class SearchEngine:
                     .included_tracks.sort(TrackAdjacent.times_played_together, descending=True)
                     .slice(0, limit or None))
 
+    def _get_transition_graph(self) -> TransitionGraph:
+        if self.data.transition_graph is None:
+            raise RuntimeError(
+                'self.data.transition_graph must be initialized to use graph-based related track lookup')
+        return self.data.transition_graph
+
+    def _find_seed_tracks(self, *, song_name: TextFilter, artist_name: TextFilter) -> TrackSet:
+        matching_tracks = TrackFilter(
+            song_name=song_name,
+            artist_name=artist_name,
+        ).filter_tracks(self.data.all_tracks)
+
+        # Do not perform search without any filter, as that would use all tracks as seeds
+        if not matching_tracks.is_filtered:
+            raise ValueError('Must specify song_name or artist_name to find related songs')
+
+        if self.trace is not None:
+            self.trace.record_stages({Stage.Tracks: matching_tracks.included_tracks})
+
+        return matching_tracks
+
+    def _join_with_tracks(self, track_ids: pl.DataFrame) -> TrackSet:
+        tracks = self.data.restrict_to_tracks(track_ids[Track.id]).tracks
+        return TrackSet(track_ids.lazy().join(tracks, how='inner', on=Track.id), is_filtered=True)
+
+    def find_songs_in_orbit(
+        self,
+        direction: Direction = 'any',
+        *,
+        song_name: TextFilter = '',
+        artist_name: TextFilter = '',
+        limit: int | None = 100,
+    ) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+        """
+        Returns the songs "in the orbit" of the specified songs, i.e. the ones most often reached
+        when following the transitions in the playlists (via personalized PageRank).
+
+        Unlike `find_related_songs`, this also finds songs that are only indirectly related.
+        """
+        matching_tracks = self._find_seed_tracks(song_name=song_name, artist_name=artist_name)
+        seed_track_ids = collect_stage(matching_tracks.included_tracks.select(Track.id))[Track.id]
+
+        ranked_track_ids = self._get_transition_graph()\
+            .personalized_pagerank(seed_track_ids, direction=direction, limit=limit)
+
+        return (matching_tracks.with_extra_columns().included_tracks.limit(100),
+                self._join_with_tracks(ranked_track_ids).with_extra_columns()
+                .included_tracks.sort(ORBIT_SCORE, descending=True))
+
+    def find_song_neighbourhood(
+        self,
+        direction: Direction = 'any',
+        *,
+        song_name: TextFilter = '',
+        artist_name: TextFilter = '',
+        hops: int = 2,
+        limit_per_hop: int | None = None,
+        limit: int | None = 100,
+    ) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+        """Returns the songs within `hops` transitions of the specified songs, closest and most often played together first."""
+        matching_tracks = self._find_seed_tracks(song_name=song_name, artist_name=artist_name)
+        seed_track_ids = collect_stage(matching_tracks.included_tracks.select(Track.id))[Track.id]
+
+        nearby_track_ids = self._get_transition_graph()\
+            .expand(seed_track_ids, direction=direction, hops=hops, limit_per_hop=limit_per_hop)\
+            .slice(0, limit or None)
+
+        return (matching_tracks.with_extra_columns().included_tracks.limit(100),
+                self._join_with_tracks(nearby_track_ids).with_extra_columns()
+                .included_tracks.sort(HOPS, TrackAdjacent.times_played_together, descending=[False, True]))
+
+    def find_song_path(
+        self,
+        direction: Direction = 'next',
+        *,
+        from_song_name: TextFilter = '',
+        from_artist_name: TextFilter = '',
+        to_song_name: TextFilter = '',
+        to_artist_name: TextFilter = '',
+    ) -> pl.LazyFrame:
+        """
+        Returns the most likely chain of transitions from one song to another (empty if there is none).
+        If several songs match, the ones in the most playlists are used.
+        """
+        def find_most_played_track_id(song_name: TextFilter, artist_name: TextFilter) -> str | None:
+            track_ids = collect_stage(self._find_seed_tracks(song_name=song_name, artist_name=artist_name)
+                                      .included_tracks
+                                      .sort(Stats.playlist_count, descending=True, nulls_last=True)
+                                      .select(Track.id)
+                                      .head(1))[Track.id]
+            return track_ids[0] if len(track_ids) > 0 else None
+
+        graph = self._get_transition_graph()
+        from_track_id = find_most_played_track_id(from_song_name, from_artist_name)
+        to_track_id = find_most_played_track_id(to_song_name, to_artist_name)
+
+        path = graph.strongest_path(from_track_id, to_track_id, direction=direction)\
+            if from_track_id is not None and to_track_id is not None else None
+        if path is None:
+            # Joined like an actual path, so the (empty) result has the same columns
+            path = pl.DataFrame(schema={Track.id: pl.String, TRANSITION_PROBABILITY: pl.Float64})
+
+        return self._join_with_tracks(path.with_row_index(PATH_STEP)).with_extra_columns()\
+            .included_tracks.sort(PATH_STEP)
+
+    def find_similar_songs(
+        self,
+        *,
+        song_name: TextFilter = '',
+        artist_name: TextFilter = '',
+        limit: int = 20,
+    ) -> tuple[pl.LazyFrame, pl.LazyFrame]:
+        """Returns the songs that occur in the most similar playlists as the specified songs (based on the song embeddings)."""
+        if self.data.similarity_index is None:
+            raise RuntimeError(
+                'self.data.similarity_index must be initialized to use similar track lookup')
+
+        matching_tracks = self._find_seed_tracks(song_name=song_name, artist_name=artist_name)
+        seed_track_ids = collect_stage(matching_tracks.included_tracks.select(Track.id))[Track.id]
+        similar_track_ids = self.data.similarity_index.find_similar(seed_track_ids, limit=limit)
+
+        return (matching_tracks.with_extra_columns().included_tracks.limit(100),
+                self._join_with_tracks(similar_track_ids).with_extra_columns()
+                .included_tracks.sort(SIMILARITY, descending=True))
+
+    def find_songs_by_lyrics(
+        self,
+        lyrics_query: str,
+        *,
+        limit: int | None = 50,
+    ) -> pl.LazyFrame:
+        """
+        Returns the songs whose lyrics match the query best (ranked via BM25), with a highlighted snippet
+        of the lyrics. Songs must contain all "quoted phrases" of the query, and at least one of its other words.
+        """
+        if self.data.lyrics_index is None:
+            raise RuntimeError(
+                'self.data.lyrics_index must be initialized to use ranked lyrics search')
+
+        ranked_track_ids = self.data.lyrics_index.search(lyrics_query, limit=limit)
+
+        # Only the lyrics of the final rows are needed for the snippets
+        snippets = self.data.restrict_to_tracks(ranked_track_ids[Track.id]).track_lyrics\
+            .select(Track.id, highlight_snippets(pl.col(TrackLyrics.lyrics), lyrics_query).alias(LYRICS_SNIPPET))
+
+        if self.trace is not None:
+            self.trace.record_stages({Stage.Lyrics: snippets})
+
+        return self._join_with_tracks(ranked_track_ids).with_extra_columns().included_tracks\
+            .join(snippets, how='left', on=Track.id)\
+            .sort(LYRICS_SCORE, descending=True)
+
+    def find_trending_songs(
+        self,
+        window: int = DEFAULT_WINDOW_MONTHS,
+        baseline: int = DEFAULT_BASELINE_MONTHS,
+        *,
+        declining: bool = False,
+        min_play_count: int = MIN_PLAY_COUNT,
+        limit: int | None = 100,
+    ) -> pl.LazyFrame:
+        """
+        Returns the songs whose popularity in social sets grew the most (or with `declining`, shrank
+        the most) within the last `window` months, compared to the `baseline` months before that.
+        """
+        # Our dataset contains some playlist entries with an added_at date in the future
+        end_date = datetime.date.today()
+        cache_key = (window, baseline, min_play_count, end_date, self.data.version)
+
+        # The scores of all songs only change with the data, so reuse them for the same parameters
+        trend_scores = self.trend_cache.get(cache_key)
+        if trend_scores is None:
+            social_set_playlist_tracks = PlaylistFilter(playlist_is_social_set=True, facets=self.data.playlist_facets)\
+                .filter_playlists(self.data.all_playlists, include_matched_terms=False)\
+                .filter_playlist_tracks(self.data.all_playlist_tracks(Playlist.id), include_playlist_info=False)
+
+            if self.trace is not None:
+                self.trace.record_stages({Stage.PlaylistTracks: social_set_playlist_tracks.included_playlist_tracks})
+
+            trend_scores = compute_trend_scores(
+                social_set_playlist_tracks.included_playlist_tracks,
+                window=window, baseline=baseline, min_play_count=min_play_count, end_date=end_date)
+            self.trend_cache.put(cache_key, trend_scores)
+
+        top_scores = (trend_scores.reverse() if declining else trend_scores).head(limit or len(trend_scores))
+
+        return self._join_with_tracks(top_scores).with_extra_columns()\
+            .included_tracks.sort(TREND_SCORE, descending=not declining)
+
     def get_popularity_over_time(
         self,
         *,
@@ -1670,7 +2853,9 @@ class SearchEngine:
         )
 
         playlist_filter = PlaylistFilter(
-            playlist_is_social_set=playlist_is_social_set
+            playlist_is_social_set=playlist_is_social_set,
+            facets=self.data.playlist_facets,
+            compiler=self.data.filter_compiler,
         )
 
         total_popularity = self._get_popularity_over_time(
@@ -0,0 +1,139 @@
+"""
+Generation of DJ sets that follow a BPM contour (e.g. a high/medium/low "wave").
+
+Choosing the songs one after another greedily easily paints itself into a corner
+(e.g. using up all songs close to the medium BPM early on), so `SetBuilder` uses
+beam search instead: at every position of the set, each of the `beam_width` best
+partial sets so far is extended by every remaining song of the pool at once
+(as a `beam_width x pool size` score matrix), and the best extensions are kept.
+
+A song scores higher the closer its BPM is to the target BPM of its position, the
+smaller the BPM change from the previous song is, and the more often it has been
+played directly after the previous song in the playlists (from the `TransitionGraph`).
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+import polars as pl
+
+from utils.graph import TransitionGraph
+from utils.tables import Track, TrackAdjacent
+
+DEFAULT_BEAM_WIDTH: int = 16
+
+BPM_SCALE: float = 4.0
+"""A song this many BPM off the target costs as much as a (roughly) 3x more frequent transition gains."""
+
+MAX_BPM_STEP: float = 8.0
+"""BPM changes between consecutive songs beyond this value are penalized (on top of the contour)."""
+
+TRANSITION_WEIGHT: float = 1.0
+"""The weight of `log(1 + times_played_together)` with the previous song."""
+
+SET_POSITION: str = 'set_position'
+TARGET_BPM: str = 'target_bpm'
+
+
+def bpm_wave(low: float, medium: float, high: float) -> list[float]:
+    """One period of a high - medium - low - medium wave (repeated by `SetBuilder.build`)."""
+    return [high, medium, low, medium]
+
+
+@dataclass(slots=True)
+class SetBuilder:
+    """Orders a pool of candidate songs into a set following a BPM contour, see the module docstring."""
+
+    transition_graph: TransitionGraph | None = None
+    """Used to prefer transitions that are common in the playlists (if available)."""
+
+    beam_width: int = DEFAULT_BEAM_WIDTH
+
+    def build(self, pool: pl.DataFrame, contour: Sequence[float], *, length: int) -> pl.DataFrame:
+        """
+        Choose `length` songs (each at most once) from `pool`, which needs the `track.id` and
+        `track.bpm` columns. The `contour` lists the target BPMs of the first positions of
+        the set, and is repeated as often as necessary.
+
+        Returns the chosen rows of `pool` in order, with their `set_position`, their
+        `target_bpm`, and how often they have been played after the previous song.
+        """
+        pool = pool.filter(pl.col(Track.beats_per_minute).gt(0))
+        length = min(length, len(pool))
+        if length == 0 or not contour:
+            return pool.clear().with_columns(pl.lit(0, pl.UInt32).alias(SET_POSITION),
+                                             pl.lit(0.0).alias(TARGET_BPM),
+                                             pl.lit(0, pl.UInt32).alias(TrackAdjacent.times_played_together))
+
+        bpm = pool[Track.beats_per_minute].cast(pl.Float64).to_numpy()
+        targets = np.resize(np.asarray(contour, dtype=np.float64), length)
+        find_transitions = self._transition_lookup(pool)
+
+        # The state of every beam: its total score, its last song and the songs used so far
+        scores = np.zeros(1)
+        last = np.full(1, -1)
+        used = np.zeros((1, len(pool)), dtype=bool)
+        parents, chosen, transitions = [], [], []
+
+        for target in targets:
+            candidate_scores = scores[:, None] - ((bpm - target) / BPM_SCALE) ** 2
+
+            is_first = last < 0
+            step = np.abs(bpm[None, :] - bpm[last][:, None])
+            step[is_first] = 0
+            candidate_scores -= (np.maximum(step - MAX_BPM_STEP, 0) / BPM_SCALE) ** 2
+
+            times_played = find_transitions(last)
+            candidate_scores += TRANSITION_WEIGHT * np.log1p(times_played)
+            candidate_scores[used] = -np.inf
+
+            beam_count = min(self.beam_width, int(np.isfinite(candidate_scores).sum()))
+            flat_scores = candidate_scores.ravel()
+            best = np.argpartition(-flat_scores, beam_count - 1)[:beam_count]
+            best = best[np.argsort(-flat_scores[best], kind='stable')]
+            parent, song = np.divmod(best, len(pool))
+
+            scores = flat_scores[best]
+            last = song
+            used = used[parent]
+            used[np.arange(beam_count), song] = True
+            parents.append(parent)
+            chosen.append(song)
+            transitions.append(times_played[parent, song])
+
+        # Follow the back pointers of the best beam
+        order = np.empty(length, dtype=np.int64)
+        times_played_together = np.empty(length)
+        beam = 0
+        for position in range(length - 1, -1, -1):
+            order[position] = chosen[position][beam]
+            times_played_together[position] = transitions[position][beam]
+            beam = parents[position][beam]
+
+        return pool[order].with_columns(
+            pl.Series(SET_POSITION, np.arange(1, length + 1), dtype=pl.UInt32),
+            pl.Series(TARGET_BPM, targets),
+            pl.Series(TrackAdjacent.times_played_together, times_played_together, dtype=pl.UInt32))
+
+    def _transition_lookup(self, pool: pl.DataFrame):
+        """Return a function mapping the last songs of the beams to how often each song of the pool followed them."""
+        graph = self.transition_graph
+        if graph is None:
+            return lambda last: np.zeros((len(last), len(pool)))
+
+        pool_nodes = graph.node_indexes(pool[Track.id])
+        pool_index_of_node = np.full(len(graph.track_ids), -1)
+        pool_index_of_node[pool_nodes[pool_nodes >= 0]] = np.flatnonzero(pool_nodes >= 0)
+
+        def find_transitions(last: np.ndarray) -> np.ndarray:
+            times_played = np.zeros((len(last), len(pool)))
+            is_known = (last >= 0) & (pool_nodes[np.maximum(last, 0)] >= 0)
+            beams = np.flatnonzero(is_known)
+            sources, edges = graph.next.gather(pool_nodes[last[beams]])
+            targets = pool_index_of_node[graph.next.neighbours[edges]]
+            in_pool = targets >= 0
+            times_played[beams[sources[in_pool]], targets[in_pool]] = graph.next.weights[edges[in_pool]]
+            return times_played
+
+        return find_transitions
@@ -0,0 +1,269 @@
+"""
+Generator for synthetic source data, to test the pre-processing & queries at different corpus sizes.
+
+Writes the same files (with the same schemas) as pulled from the HuggingFace source dataset
+into `unprocessed_data_huggingface/`, with roughly realistic distributions:
+
+- Song popularity follows a Zipf distribution, so a few songs appear in most playlists.
+- Some songs are released on multiple albums, i.e. have multiple track IDs (see `process_song_duplicates`).
+- Some songs have multiple artists, which appear as separate rows (one per artist) in the source data.
+- DJ activity is skewed, and each DJ has a location (or none).
+- Many playlists are social sets, named after an event with a date in one of the common formats,
+  and playlist names contain tag keywords (see `utils/keyword_data.yaml`).
+- Most songs have a BPM, and some have lyrics.
+
+The size is controlled by a scale factor, where `scale=1` is roughly the size of the real dataset.
+"""
+from __future__ import annotations
+import datetime
+import os
+
+import numpy as np
+import polars as pl
+
+from utils.additional_data import poc_artists, queer_artists
+from utils.keyword_data import load_keyword_aliases
+from utils.search import (
+    UNPROCESSED_DATA_DIR,
+    UNPROCESSED_PLAYLISTS_DATA_FILE,
+    UNPROCESSED_TRACK_BPM_DATA_FILE,
+    UNPROCESSED_TRACK_LYRICS_DATA_FILE,
+)
+
+BASE_PLAYLIST_COUNT: int = 8_000
+BASE_SONG_COUNT: int = 40_000
+BASE_OWNER_COUNT: int = 1_200
+BASE_ARTIST_COUNT: int = 12_000
+"""The number of playlists, songs, DJs and artists at `scale=1`."""
+
+MIN_PLAYLIST_LENGTH: int = 8
+MAX_PLAYLIST_LENGTH: int = 80
+
+SONG_POPULARITY_EXPONENT: float = 1.0
+"""The exponent of the Zipf distribution of the song popularity (the n-th most popular song has weight 1/n^s)."""
+
+OWNER_ACTIVITY_EXPONENT: float = 0.9
+
+DUPLICATED_SONG_SHARE: float = 0.08
+"""The share of songs with multiple track IDs (e.g. released on a single and an album)."""
+
+MULTI_ARTIST_SONG_SHARE: float = 0.12
+SOCIAL_SET_SHARE: float = 0.45
+TAGGED_PLAYLIST_SHARE: float = 0.6
+SONG_BPM_SHARE: float = 0.85
+SONG_LYRICS_SHARE: float = 0.3
+KNOWN_ARTIST_SHARE: float = 0.05
+"""The share of artists named after an artist of `queer_artists` or `poc_artists`, so those filters match something."""
+
+LOCATIONS: list[str] = [
+    'North America - USA', 'North America - Canada', 'Europe - Germany', 'Europe - France',
+    'Europe - United Kingdom', 'Europe - Sweden', 'Europe - Poland', 'Europe - Netherlands',
+    'Asia - Japan', 'Asia - South Korea', 'Oceania - Australia', 'South America - Brazil', '',
+]
+
+WORDS: list[str] = (
+    'love night dance heart fire blue slow groove rain summer baby dream time light soul way home '
+    'world feel life body mind money gold river road city moon sun star sky ocean water wild sweet '
+    'lonely crazy little golden broken secret midnight electric honey velvet shadow mirror paper '
+    'again tonight forever never always maybe better closer higher deeper stay run fall hold move '
+    'believe remember forget wonder shine burn break call come back down up over under together'
+).split()
+"""The vocabulary of song names and lyrics."""
+
+FIRST_NAMES: list[str] = (
+    'Anna Ben Chloe David Ella Felix Grace Hugo Iris Jonas Kira Leo Maya Nico Olivia Paul Rosa Sam '
+    'Tara Victor Wendy Yara Zoe Aaron Bella Caleb Dina Ethan Fiona Gabriel'
+).split()
+
+LAST_NAMES: list[str] = (
+    'Adams Brooks Carter Diaz Evans Fischer Garcia Hayes Ito Jensen Kim Lopez Martin Novak Okafor '
+    'Perez Quinn Rossi Silva Taylor Urban Vance Weber Xu Young Zhang'
+).split()
+
+EVENT_NAMES: list[str] = [
+    'Friday social', 'Saturday party', 'Monday night dance', 'Swing weekend', 'Summer swing',
+    'Winter swing fest', 'Boogie by the bay', 'Westie spring thing', 'Soirée', 'Social',
+]
+
+DATE_FORMATS: list[str] = ['%Y-%m-%d', '%d.%m.%Y', '%m/%d/%y', '%d/%m/%Y', '%d.%m.%y', '%b %d %Y']
+"""The formats of the dates in the names of social sets, see `extract_date_strings_from_name`."""
+
+FIRST_DATE: datetime.date = datetime.date(2014, 1, 1)
+LAST_DATE: datetime.date = datetime.date(2025, 12, 31)
+
+
+def zipf_weights(count: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def random_names(rng: np.random.Generator, vocabulary: list[str], count: int, *, min_words: int, max_words: int) -> list[str]:
+    word_counts = rng.integers(min_words, max_words + 1, size=count)
+    words = np.array(vocabulary)[rng.integers(0, len(vocabulary), size=word_counts.sum())]
+    return [' '.join(name_words).title() for name_words in np.split(words, np.cumsum(word_counts)[:-1])]
+
+
+def random_dates(rng: np.random.Generator, count: int) -> np.ndarray:
+    return np.datetime64(FIRST_DATE) + rng.integers(0, (LAST_DATE - FIRST_DATE).days, size=count)
+
+
+def generate_artists(rng: np.random.Generator, count: int) -> list[str]:
+    artists = [f'{FIRST_NAMES[first]} {LAST_NAMES[last]}' + (f' {suffix}' if suffix > 0 else '')
+               for first, last, suffix in zip(rng.integers(0, len(FIRST_NAMES), size=count),
+                                              rng.integers(0, len(LAST_NAMES), size=count),
+                                              rng.integers(0, count // 100 + 1, size=count))]
+
+    known_artists = sorted(set(queer_artists) | set(poc_artists))
+    for i in rng.choice(count, size=int(count * KNOWN_ARTIST_SHARE), replace=False):
+        artists[i] = known_artists[rng.integers(len(known_artists))].title()
+    return artists
+
+
+def generate_songs(rng: np.random.Generator, song_count: int, artist_count: int) -> pl.DataFrame:
+    """One row per (song, artist), with the song index ordered by popularity."""
+    artists = generate_artists(rng, artist_count)
+    song_artists = rng.choice(artist_count, size=song_count, p=zipf_weights(artist_count, 0.8))
+    second_artists = np.where(rng.random(song_count) < MULTI_ARTIST_SONG_SHARE,
+                              rng.integers(0, artist_count, size=song_count), -1)
+
+    songs = pl.DataFrame({
+        'song': np.arange(song_count),
+        'track.name': random_names(rng, WORDS, song_count, min_words=1, max_words=4),
+        'artist': song_artists,
+        'second_artist': second_artists,
+        'version_count': np.where(rng.random(song_count) < DUPLICATED_SONG_SHARE,
+                                  rng.integers(2, 4, size=song_count), 1),
+    })
+
+    artist_names = pl.Series(artists)
+    return songs\
+        .with_columns(pl.concat_list(pl.col('artist'),
+                                     pl.when(pl.col('second_artist').ge(0)).then(pl.col('second_artist')))
+                      .list.drop_nulls()
+                      .alias('artists'))\
+        .explode('artists')\
+        .with_columns(pl.col('artists').map_batches(lambda artist: artist_names.gather(artist),
+                                                    return_dtype=pl.String).alias('track.artists.name'))\
+        .select('song', 'track.name', 'track.artists.name', 'version_count')
+
+
+def generate_tracks(rng: np.random.Generator, songs: pl.DataFrame) -> pl.DataFrame:
+    """One row per track ID (i.e. per version of a song), with the release date of its album."""
+    version_counts = songs.unique('song').sort('song')['version_count'].to_numpy()
+    track_count = int(version_counts.sum())
+    return pl.DataFrame({
+        'song': np.repeat(np.arange(len(version_counts)), version_counts),
+        'track.id': [f'{i:08x}{value:014x}' for i, value in enumerate(rng.integers(0, 2 ** 56, size=track_count))],
+        'track.album.release_date': random_dates(rng, track_count) - 365 * 5,
+    })
+
+
+def generate_playlist_names(rng: np.random.Generator, dates: np.ndarray) -> list[str]:
+    keywords = sorted(load_keyword_aliases()[0])
+    is_social_set = rng.random(len(dates)) < SOCIAL_SET_SHARE
+    has_tags = rng.random(len(dates)) < TAGGED_PLAYLIST_SHARE
+
+    names = []
+    for date, social_set, tagged in zip(dates.astype(datetime.date), is_social_set, has_tags):
+        parts = []
+        if social_set:
+            parts.append(EVENT_NAMES[rng.integers(len(EVENT_NAMES))])
+            parts.append(date.strftime(DATE_FORMATS[rng.integers(len(DATE_FORMATS))]))
+        else:
+            parts.append(random_names(rng, WORDS, 1, min_words=1, max_words=3)[0])
+        if tagged:
+            parts.extend(keywords[i] for i in rng.integers(0, len(keywords), size=rng.integers(1, 4)))
+        names.append(' '.join(parts))
+    return names
+
+
+def generate_playlists(rng: np.random.Generator, playlist_count: int, owner_count: int) -> pl.DataFrame:
+    owner_ids = [str(id) if id % 3 else f'dj{id:x}' for id in rng.integers(10 ** 9, 10 ** 11, size=owner_count)]
+    owner_names = [f'DJ {name}' for name in generate_artists(rng, owner_count)]
+    owner_locations = rng.integers(0, len(LOCATIONS), size=owner_count)
+
+    owners = rng.choice(owner_count, size=playlist_count, p=zipf_weights(owner_count, OWNER_ACTIVITY_EXPONENT))
+    dates = random_dates(rng, playlist_count)
+    return pl.DataFrame({
+        'playlist_id': [f'{i:06x}{value:016x}' for i, value in enumerate(rng.integers(0, 2 ** 60, size=playlist_count))],
+        'name': generate_playlist_names(rng, dates),
+        'owner.display_name': pl.Series(owner_names).gather(owners),
+        'owner.id': pl.Series(owner_ids).gather(owners),
+        'location': pl.Series(LOCATIONS).gather(owner_locations[owners]),
+        'created_at': dates,
+        'length': rng.integers(MIN_PLAYLIST_LENGTH, MAX_PLAYLIST_LENGTH + 1, size=playlist_count),
+    })
+
+
+def generate_lyrics(rng: np.random.Generator, line_count: int) -> str:
+    lines = random_names(rng, WORDS, line_count, min_words=3, max_words=8)
+    # Repeat a chorus, like most songs do
+    return '\n'.join(lines + lines[:2] + lines[line_count // 2:] + lines[:2])
+
+
+def generate_synthetic_data(scale: float = 1.0, *, seed: int = 0, output_dir: str = UNPROCESSED_DATA_DIR):
+    """Write synthetic source data files, scaled by the given factor."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    song_count = max(int(BASE_SONG_COUNT * scale), 100)
+    songs = generate_songs(rng, song_count, max(int(BASE_ARTIST_COUNT * scale), 10))
+    tracks = generate_tracks(rng, songs)
+    playlists = generate_playlists(rng,
+                                   max(int(BASE_PLAYLIST_COUNT * scale), 10),
+                                   max(int(BASE_OWNER_COUNT * scale), 5))
+
+    # The playlist entries: pick the songs by popularity (each song at most once per playlist),
+    # and then one of their versions
+    entry_count = int(playlists['length'].sum())
+    entries = pl.DataFrame({
+        'song': rng.choice(song_count, size=entry_count, p=zipf_weights(song_count, SONG_POPULARITY_EXPONENT)),
+        'version': rng.random(entry_count),
+        'days_after_creation': rng.integers(0, 60, size=entry_count),
+    })
+
+    playlist_entries = playlists\
+        .with_columns(pl.int_ranges('length').alias('song_number'))\
+        .explode('song_number')\
+        .hstack(entries)\
+        .unique(['playlist_id', 'song'], keep='first', maintain_order=True)\
+        .join(tracks.group_by('song').agg('track.id', 'track.album.release_date'), on='song')\
+        .with_columns(pl.col('version').mul(pl.col('track.id').list.len()).floor().cast(pl.Int64).alias('version'))\
+        .select(pl.exclude('track.id', 'track.album.release_date'),
+                pl.col('track.id').list.get(pl.col('version')),
+                pl.col('track.album.release_date').list.get(pl.col('version')))\
+        .join(songs.drop('version_count'), on='song')\
+        .select('playlist_id', 'name', 'owner.display_name', 'owner.id',
+                pl.col('song_number').cast(pl.Int64),
+                pl.col('created_at').add(pl.duration(days='days_after_creation')).alias('added_at'),
+                'track.id', 'track.name', 'track.artists.name', 'track.album.release_date', 'location')\
+        .sort('playlist_id', 'song_number')
+
+    print(f'Writing {output_dir} ({len(playlists):,} playlists, {len(playlist_entries):,} source rows, '
+          f'{len(tracks):,} tracks)...')
+    playlist_entries.write_parquet(output_dir + os.path.basename(UNPROCESSED_PLAYLISTS_DATA_FILE))
+
+    # BPM & lyrics are keyed by the song name & (comma-separated) artist names
+    song_artists = songs\
+        .group_by('song', maintain_order=True)\
+        .agg(pl.col('track.name').first(), pl.col('track.artists.name').str.join(', '))
+
+    with_bpm = song_artists.filter(pl.Series(rng.random(len(song_artists)) < SONG_BPM_SHARE))
+    with_bpm\
+        .select('track.name', 'track.artists.name',
+                pl.Series('bpm', np.clip(rng.normal(96, 12, size=len(with_bpm)), 60, 160).round().astype(np.int64)))\
+        .write_parquet(output_dir + os.path.basename(UNPROCESSED_TRACK_BPM_DATA_FILE))
+
+    with_lyrics = song_artists.filter(pl.Series(rng.random(len(song_artists)) < SONG_LYRICS_SHARE))
+    with_lyrics\
+        .select(pl.col('track.name').alias('song'),
+                pl.col('track.artists.name').alias('artist'),
+                pl.Series('lyrics', [generate_lyrics(rng, line_count)
+                                     for line_count in rng.integers(8, 24, size=len(with_lyrics))]))\
+        .write_parquet(output_dir + os.path.basename(UNPROCESSED_TRACK_LYRICS_DATA_FILE))
+
+
+# Generate the data at the given scale when invoked via `python -m utils.synthetic_data [scale]`
+if __name__ == '__main__':
+    import sys
+    generate_synthetic_data(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
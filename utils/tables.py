@@ -96,6 +96,9 @@ class PlaylistOwner(Entity):
     This is currently based on a manually curated dataset.
     """
 
+    track_signature: Final = field("owner.track_signature", pl.Array)
+    """The MinHash signature of all songs in the DJ's playlists, see `utils.minhash`."""
+
 class Playlist(Entity):
     """Represents a playlist (as retrieved from Spotify or from other sources)."""
 
@@ -193,6 +196,36 @@ class Track(Entity):
     """The list of countries where a given track has been played."""
 
 
+class Artist(Entity):
+    """Represents an individual artist (unlike `track.artists.name`, which may list several artists)."""
+
+    PREFIX: Final = "artist."
+    """Common prefix for `Artist` columns."""
+
+    id: Final = field("artist.id", pl.UInt32)
+    """
+    Identifies the artist.
+
+    The source data does not contain artist IDs, so artists
+    are identified by their (case-insensitive) name instead.
+    """
+
+    name: Final = field("artist.name", pl.String)
+    """The name of the artist (using the most common spelling)."""
+
+    matching_song_count: Final = Stats.song_count.alias("matching_song_count")
+    """The number of songs by this artist that matched the search query."""
+
+    matching_song_names: Final = Track.name.list().alias("matching_song_names")
+    """The names of some (but not all) songs by this artist that matched the search query."""
+
+    type SortFields = Literal["matching_song_count", "song_count", "playlist_count", "dj_count"]
+    """Fields that artists can be sorted on."""
+
+    class Track(SubEntity[Track]):
+        id: Final = Track.id
+
+
 class PlaylistTrack(Entity):
     PREFIX: Final = "playlist_track."
     """Common prefix for `PlaylistTrack` columns."""
@@ -224,6 +257,19 @@ class TrackAdjacent(Entity):
         artists: Final = Track.artists.alias("pair2.track.artists")
 
 
+class TrackEmbedding(Entity):
+    """Represents the co-occurrence embedding of a song, see `utils.embeddings`."""
+
+    class Track(SubEntity[Track]):
+        id: Final = Track.id
+
+    cluster: Final = field("embedding.cluster", pl.UInt32)
+    """The cluster of similar songs this song belongs to."""
+
+    vector: Final = field("embedding.vector", pl.Array)
+    """The (unit length) embedding, as the bit patterns of float16 values."""
+
+
 class TrackLyrics(Entity):
     class Track(SubEntity[Track]):
         id: Final = Track.id
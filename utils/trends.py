@@ -0,0 +1,108 @@
+"""
+Detection of songs that are currently rising (or falling) in popularity.
+
+For every song, `compute_trend_scores` compares the number of times it was added
+to a playlist within the last `window` months with the number of times it was
+added within the `baseline` months before that. As the number of playlist entries
+in our dataset varies a lot over time, the expected count within the window is
+the baseline count scaled by the ratio of *all* entries in the two periods.
+
+Assuming the window count is Poisson distributed around that expectation, the
+`trend_score` is the (smoothed) z-score `(observed - expected) / sqrt(expected + 1)`,
+so that a jump from 50 to 100 entries ranks higher than a jump from 1 to 3 entries.
+"""
+from collections import OrderedDict
+from datetime import date
+from threading import Lock
+
+import polars as pl
+
+from utils.query_context import collect_stage
+from utils.tables import PlaylistTrack, Track
+
+DEFAULT_WINDOW_MONTHS: int = 3
+DEFAULT_BASELINE_MONTHS: int = 12
+
+MIN_PLAY_COUNT: int = 5
+"""Songs with fewer entries in the window and the baseline (taken together) are ignored, as their scores are too noisy."""
+
+WINDOW_PLAY_COUNT: str = 'window_play_count'
+BASELINE_PLAY_COUNT: str = 'baseline_play_count'
+EXPECTED_PLAY_COUNT: str = 'expected_play_count'
+TREND_SCORE: str = 'trend_score'
+
+TREND_CACHE_SIZE: int = 8
+"""Only a few window/baseline combinations are used at a time (mostly the defaults)."""
+
+type TrendScoreKey = tuple[int, int, int, date | None, str]
+"""The `(window, baseline, min_play_count, end_date, data version)` the trend scores were computed for."""
+
+
+class TrendScoreCache:
+    """A thread-safe LRU cache for the trend scores of all songs, see `compute_trend_scores`."""
+
+    def __init__(self, max_entries: int = TREND_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[TrendScoreKey, pl.DataFrame] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: TrendScoreKey) -> pl.DataFrame | None:
+        with self._lock:
+            trend_scores = self._entries.get(key)
+            if trend_scores is not None:
+                self._entries.move_to_end(key)
+            return trend_scores
+
+    def put(self, key: TrendScoreKey, trend_scores: pl.DataFrame):
+        with self._lock:
+            self._entries[key] = trend_scores
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def compute_trend_scores(
+    playlist_tracks: pl.LazyFrame,
+    *,
+    window: int = DEFAULT_WINDOW_MONTHS,
+    baseline: int = DEFAULT_BASELINE_MONTHS,
+    min_play_count: int = MIN_PLAY_COUNT,
+    end_date: date | None = None,
+) -> pl.DataFrame:
+    """
+    Compute the trend score of every song in the given playlist entries (see the module docstring),
+    with the window ending at the latest month in the data (ignoring entries after `end_date`).
+    Returns the `track.id`, the entry counts and the `trend_score` of the songs, sorted by descending
+    `trend_score`.
+    """
+    MONTH = 'month'
+
+    if window <= 0 or baseline <= 0:
+        raise ValueError('window and baseline must be at least one month')
+
+    entries = playlist_tracks\
+        .select(Track.id, PlaylistTrack.added_at)\
+        .filter(pl.col(PlaylistTrack.added_at).is_not_null(),
+                pl.col(PlaylistTrack.added_at).le(end_date) if end_date is not None else pl.lit(True))\
+        .select(Track.id, (pl.col(PlaylistTrack.added_at).dt.year().cast(pl.Int32) * 12
+                           + pl.col(PlaylistTrack.added_at).dt.month().cast(pl.Int32)).alias(MONTH))\
+        .with_columns((pl.col(MONTH).max() - pl.col(MONTH)).alias(MONTH))\
+        .filter(pl.col(MONTH).lt(window + baseline))
+
+    is_in_window = pl.col(MONTH).lt(window)
+
+    # How many more (or fewer) entries the whole dataset has in the window than in the baseline
+    volume_ratio = pl.col(WINDOW_PLAY_COUNT).sum().cast(pl.Float64)\
+        / pl.max_horizontal(pl.col(BASELINE_PLAY_COUNT).sum(), 1)
+
+    trend_scores = entries\
+        .group_by(Track.id)\
+        .agg(is_in_window.sum().cast(pl.UInt32).alias(WINDOW_PLAY_COUNT),
+             is_in_window.not_().sum().cast(pl.UInt32).alias(BASELINE_PLAY_COUNT))\
+        .with_columns((pl.col(BASELINE_PLAY_COUNT) * volume_ratio).alias(EXPECTED_PLAY_COUNT))\
+        .filter((pl.col(WINDOW_PLAY_COUNT) + pl.col(BASELINE_PLAY_COUNT)).ge(min_play_count))\
+        .with_columns(((pl.col(WINDOW_PLAY_COUNT) - pl.col(EXPECTED_PLAY_COUNT))
+                       / (pl.col(EXPECTED_PLAY_COUNT) + 1).sqrt()).alias(TREND_SCORE))\
+        .sort(TREND_SCORE, Track.id, descending=[True, False])
+
+    return collect_stage(trend_scores)
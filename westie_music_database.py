@@ -9,13 +9,21 @@ import polars as pl
 import polars.selectors as cs
 import psutil
 import time
+import asyncio
 
+from utils.async_search import AsyncSearchEngine, CancellationToken, QueryTooBroadError
+from utils.scheduler import QueryRejectedError, QueryScheduler
 from utils.common.columns import pull_columns_to_front
+from utils.common.filters import create_text_filter, or_filter
 from utils.common.logging import log_query
+from utils.pagination import Page, get_query_key
 from utils.keyword_data import load_keyword_colors
+from utils.lyrics_index import LYRICS_SCORE, LYRICS_SNIPPET
 from utils.playlist_classifiers import extract_date_types_from_name, extract_date_strings_from_name
 from utils.pull_data import automatically_pull_data_if_needed
-from utils.search import SearchEngine, TRACK_TAGS_DATA_FILE
+from utils.search import QuerySpec, SearchEngine, TRACK_TAGS_DATA_FILE
+from utils.set_builder import SET_POSITION, TARGET_BPM, SetBuilder, bpm_wave
+from utils.trends import BASELINE_PLAY_COUNT, EXPECTED_PLAY_COUNT, TREND_SCORE, WINDOW_PLAY_COUNT
 from utils.tables import Playlist, PlaylistOwner, PlaylistTrack, Stats, Tag, Track, TrackAdjacent, TrackLyrics, TrackTag
 
 # As mentioned in the streamlit docs pyplot doesn't work well with threads,
@@ -23,6 +31,9 @@ from utils.tables import Playlist, PlaylistOwner, PlaylistTrack, Stats, Tag, Tra
 # See: https://docs.streamlit.io/develop/api-reference/charts/st.pyplot
 _lock = RLock()
 
+# Searches taking longer than this are stopped, and the user is asked to add more filters
+QUERY_TIMEOUT_SECONDS: Final = 60
+
 # avail_threads = pl.threadpool_size()
 pl.Config.set_tbl_rows(100).set_fmt_str_lengths(100)
 pl.enable_string_cache()  # for Categoricals
@@ -51,11 +62,20 @@ def gen(iterable):
         yield _
 
 
-def sample_with_bpm_range(df, prev_bpm):
-    '''Helper function to sample song with 5–8 bpm diff for playlist generator'''
-    return df.filter(
-        (pl.col("bpm") - prev_bpm).abs().is_between(5, 8)
-    ).sample(n=1, seed=42)
+def page_navigation(page, cursor_key, shown_count):
+    '''Shows the position of the current page and buttons to go to the previous/next page'''
+    st.caption(f"Showing results {page.offset + 1:,} to {page.offset + shown_count:,} of {page.total_count:,}")
+    prev_col, next_col = st.columns(2)
+    with prev_col:
+        if st.button("⬅️ Previous page", key=f"{cursor_key}_previous", disabled=page.previous_cursor is None):
+            st.session_state[cursor_key] = page.previous_cursor
+            st.session_state["processing"] = False
+            st.rerun()
+    with next_col:
+        if st.button("Next page ➡️", key=f"{cursor_key}_next", disabled=page.next_cursor is None):
+            st.session_state[cursor_key] = page.next_cursor
+            st.session_state["processing"] = False
+            st.rerun()
 
 
 # makes it so streamlit doesn't have to reload for every sesson.
@@ -66,6 +86,97 @@ def load_search_engine():
     return engine
 
 
+@st.cache_resource
+def load_async_search_engine():
+    # Shared by all sessions, so the scheduler limits the concurrent queries of the whole process
+    return AsyncSearchEngine(load_search_engine(), timeout=QUERY_TIMEOUT_SECONDS, scheduler=QueryScheduler())
+
+
+def result_size(result):
+    '''The number of rows of a query result, for logging'''
+    if isinstance(result, pl.DataFrame):
+        return len(result)
+    if isinstance(result, Page):
+        return result.total_count
+    if isinstance(result, list) and all(isinstance(df, pl.DataFrame) for df in result):
+        return sum(len(df) for df in result)
+    return None
+
+
+def run_query(build_query, log_as=None):
+    '''
+    Runs a query without blocking, so it can be stopped when it takes too long or the user reruns/leaves.
+    If log_as=(query_type, params) is given, the query is logged together with its latency, result size and plan.
+    '''
+    token = CancellationToken()
+    st.session_state["query_token"] = token
+    status = st.empty()
+    plan = []
+    result = None
+    error = None
+
+    def build_and_record_plan():
+        query = build_query()
+        if log_as is not None and isinstance(query, pl.LazyFrame):
+            plan.append(query.explain())
+        elif log_as is not None and isinstance(query, Page):
+            plan.append(query.results.explain())
+        return query
+
+    started_at = time.perf_counter()
+    try:
+        # Updating the status also gives streamlit the chance to stop this run (by raising an exception)
+        result = asyncio.run(load_async_search_engine().run(
+            build_and_record_plan,
+            token=token,
+            on_progress=lambda elapsed: status.caption(f"Searching... ({elapsed:.0f}s)"),
+            on_queued=lambda position, eta: status.caption(
+                f"Waiting for other searches to finish... (#{position + 1} in line, about {eta:.0f}s)")))
+        del st.session_state["query_token"]
+        return result
+    except (QueryTooBroadError, QueryRejectedError) as e:
+        error = type(e).__name__
+        del st.session_state["query_token"]
+        st.session_state["processing"] = False
+        st.error(e.user_message)
+        st.stop()
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        status.empty()
+        if log_as is not None:
+            query_type, params = log_as
+            log_query(query_type, params,
+                      latency_seconds=time.perf_counter() - started_at,
+                      result_size=result_size(result),
+                      plan=plan[0] if plan else None,
+                      error=error)
+
+
+def show_query_profile(method, query):
+    '''Developer mode only: shows how a query was evaluated, and where the time was spent'''
+    if not st.session_state.get("developer_mode"):
+        return
+    with st.expander("🛠️ Query profile"):
+        # Profiling evaluates the whole query again, so only do it once per query (and not on every rerun)
+        profile_key = get_query_key(method, query)
+        if st.session_state.get("query_profile", (None,))[0] != profile_key:
+            st.session_state["query_profile"] = (profile_key,
+                                                 run_query(lambda: search_engine.profile(QuerySpec(method, query))))
+        _, profile = st.session_state["query_profile"]
+        st.write(f"Filter order: {profile.explanation.filter_order or '-'}")
+        for note in profile.explanation.notes:
+            st.write(note)
+        st.write(f"Build time: {profile.build_seconds:.3f}s, result: {profile.result_row_count:,} rows")
+        st.dataframe(pl.DataFrame({"stage": [str(stage) for stage in profile.stage_row_counts],
+                                   "rows": list(profile.stage_row_counts.values())}))
+        st.dataframe(profile.node_timings
+                     .with_columns((pl.col("end") - pl.col("start")).alias("duration_us"))
+                     .sort("duration_us", descending=True))
+        st.code(profile.explanation.plan, language=None)
+
+
 def wcs_specific(df_: pl.DataFrame):
     """Given a LazyFrame, filter to the records most likely to be West Coast Swing related"""
     return (df_.lazy()
@@ -101,6 +212,12 @@ def load_stats():
 if "processing" not in st.session_state:
     st.session_state["processing"] = False
 
+# Stop the query still running from a previous run of this session (e.g. when the user reruns),
+# the token is only left behind by runs that were stopped before their query finished
+if "query_token" in st.session_state:
+    st.session_state.pop("query_token").cancel()
+    st.session_state["processing"] = False
+
 search_engine = load_search_engine()
 df_notes = load_notes()
 countries = load_countries()
@@ -123,6 +240,10 @@ st.write(f"{playlists_count:,}   Playlists")
 st.write(f"{djs_count:,}   Westies/DJs\n\n")
 
 
+# Only offered when the app is opened with ?dev in the URL
+if "dev" in st.query_params:
+    st.toggle("🛠️ Developer mode: show query profiles", key="developer_mode")
+
 st.link_button("Help fill in country info!",
                url='https://docs.google.com/spreadsheets/d/1YQaWwtIy9bqSNTXR9GrEy86Ix51cvon9zzHVh7sBi0A/edit?usp=sharing')
 
@@ -317,6 +438,7 @@ if song_locator_toggle:
             "Playlist name ('late night', '80bpm', or 'Budafest'):")
         queer_toggle = st.checkbox("🏳️‍🌈")
         poc_toggle = st.checkbox("POC")
+        fuzzy_toggle = st.checkbox("Typo-tolerant song & artist names")
         st.markdown(
             "[Add/correct POC artists](https://docs.google.com/spreadsheets/d/1-elrLd_3tX4QTLQjj4EmPxRSzXHcxs6tZp5Y5fRFalc/edit?usp=sharing)")
 
@@ -328,9 +450,6 @@ if song_locator_toggle:
             "Track release date (yyyy-mm-dd or '198' for 1980's music):")
         anti_playlist_input = st.text_input(
             "Exclude if in playlists ('blues', or 'zouk'):")
-        num_results = st.number_input(
-            "Skip the top __ results", value=0, min_value=0, step=250)
-        # num_results = st.slider("Skip the top __ results", 0, 111000, step=500)
         bpm_slider = st.slider("Search BPM:", 0, 150, (0, 150))
 
     if not countries_selectbox:
@@ -348,25 +467,28 @@ if song_locator_toggle:
     with col3:
         bpm_high = st.number_input(
             "Playlist high: ", value=100, min_value=0, step=2)
+    with col4:
+        set_length = st.number_input(
+            "Playlist length: ", value=20, min_value=3, max_value=100, step=1)
 
     if st.button("Search songs", type="primary", disabled=st.session_state["processing"]):
-        st.session_state["processing"] = True
-        log_query("Search songs", {'song_input': song_input,
-                                   'artist_name': artist_name,
-                                   'dj_input': dj_input,
-                                   'playlist_input': playlist_input,
-                                   'queer_toggle': queer_toggle,
-                                   'poc_toggle': poc_toggle,
-                                   'countries_selectbox': countries_selectbox,
-                                   'added_2_playlist_date': added_2_playlist_date,
-                                   'track_release_date': track_release_date,
-                                   'anti_playlist_input': anti_playlist_input,
-                                   'num_results': num_results,
-                                   'bpm_slider': bpm_slider,
-                                   }
-                  )
-
-        song_search_df = search_engine.find_songs(
+        # Logged together with the first page of results
+        st.session_state["song_search_log"] = ("Search songs", {
+            'song_input': song_input,
+            'artist_name': artist_name,
+            'dj_input': dj_input,
+            'playlist_input': playlist_input,
+            'queer_toggle': queer_toggle,
+            'poc_toggle': poc_toggle,
+            'fuzzy_toggle': fuzzy_toggle,
+            'countries_selectbox': countries_selectbox,
+            'added_2_playlist_date': added_2_playlist_date,
+            'track_release_date': track_release_date,
+            'anti_playlist_input': anti_playlist_input,
+            'bpm_slider': bpm_slider,
+        })
+
+        st.session_state["song_search_query"] = dict(
             song_name=song_input,
             song_bpm_range=bpm_slider,
             artist_name=artist_name,
@@ -375,7 +497,7 @@ if song_locator_toggle:
             playlist_include=playlist_input,
             playlist_exclude=anti_playlist_input,
             added_to_playlist_date=added_2_playlist_date,
-            skip_num_top_results=num_results,
+            fuzzy=fuzzy_toggle,
             sort_by=[
                 Playlist.matched_terms_count,
                 Playlist.matching_playlist_count,
@@ -383,43 +505,67 @@ if song_locator_toggle:
                 Stats.dj_count
             ],
             descending=True,
-            limit=1000,
         )
-
-        results_df = song_search_df\
-            .with_columns(
-                pl.col(Playlist.name).list.head(30),
-            )\
-            .rename({Track.country: 'country'})\
-            .drop(Track.id, Track.release_date, Track.region,
-                  Playlist.matched_terms_count)\
-            .select((cs.all()
-                    - Playlist.matching_columns()
-                    - PlaylistTrack.matching_columns()
-                    - PlaylistOwner.matching_columns())
-                    | cs.by_name(Playlist.name)
-                    | cs.by_name(PlaylistOwner.name))\
-            .select(pull_columns_to_front(
-                Track.name,
-                Track.url,
-                Stats.playlist_count,
-                Stats.dj_count,
-                'hit_terms',
-                Track.beats_per_minute,
-                'matching_playlist_count',
-                Track.has_queer_artist,
-                Track.has_poc_artist,
-                Playlist.name,
-                Track.artists,
-                PlaylistOwner.name,
-                'country',
-            ))\
-            .with_row_index(offset=1)\
-            .collect(engine="streaming")
-
-        st.dataframe(results_df,
+        st.session_state["song_search_cursor"] = None
+        # Searching again always fetches the page again (and logs the search)
+        st.session_state.pop("song_search_results", None)
+
+    if "song_search_query" in st.session_state:
+        # Streamlit reruns this script on every interaction, so the page is only fetched again
+        # when the query or the cursor changes (e.g. not when the playlist BPMs are changed)
+        song_search_key = (get_query_key("songs", st.session_state["song_search_query"]),
+                           st.session_state["song_search_cursor"])
+        if st.session_state.get("song_search_results", (None,))[0] != song_search_key:
+            st.session_state["processing"] = True
+
+            song_search_page = run_query(lambda: search_engine.find_songs_page(
+                cursor=st.session_state["song_search_cursor"],
+                page_size=1000,
+                **st.session_state["song_search_query"],
+            ), log_as=st.session_state.pop("song_search_log", None))
+            song_search_df = song_search_page.results
+
+            results_df = run_query(lambda: song_search_df
+                .with_columns(
+                    pl.col(Playlist.name).list.head(30),
+                )
+                .rename({Track.country: 'country'})
+                .drop(Track.release_date, Track.region,
+                      Playlist.matched_terms_count)
+                .select((cs.all()
+                        - Playlist.matching_columns()
+                        - PlaylistTrack.matching_columns()
+                        - PlaylistOwner.matching_columns())
+                        | cs.by_name(Playlist.name)
+                        | cs.by_name(PlaylistOwner.name))
+                .select(pull_columns_to_front(
+                    Track.name,
+                    Track.url,
+                    Stats.playlist_count,
+                    Stats.dj_count,
+                    'hit_terms',
+                    Track.beats_per_minute,
+                    'matching_playlist_count',
+                    Track.has_queer_artist,
+                    Track.has_poc_artist,
+                    Playlist.name,
+                    Track.artists,
+                    PlaylistOwner.name,
+                    'country',
+                ))
+                .with_row_index(offset=song_search_page.offset + 1))
+
+            st.session_state["song_search_results"] = (song_search_key, song_search_page, results_df)
+            st.session_state["processing"] = False
+
+        _, song_search_page, results_df = st.session_state["song_search_results"]
+
+        st.dataframe(results_df.drop(Track.id),
                      column_config={Track.url: st.column_config.LinkColumn()})
 
+        page_navigation(song_search_page, "song_search_cursor", len(results_df))
+        show_query_profile("find_songs", st.session_state["song_search_query"])
+
         # playlists_text = ' '.join(song_search_df
         #                         .select(pl.col(Playlist.name).cast(pl.List(pl.String)))
         #                         .explode(Playlist.name)
@@ -444,114 +590,23 @@ if song_locator_toggle:
         #         ax.axis('off')
         #         st.pyplot(fig)
 
-        # creates a playlist based on the results
-        # if st.button("Generate a playlist?", type="primary", disabled=st.session_state["processing"]):
-        # st.session_state["processing"] = True
-        #         bpm_high = st.slider("BPM-high:", 85, 130, 101)
-        #         bpm_med = st.slider("BPM-med:", 80, 100, 95)
-        #         bpm_low = st.slider("BPM-low:", 85, 130, 88)
-        #         how_many_songs = st.slider("Playlist length:", 3, 60, 18)
-
         st.text("Pretend you're Koichi with a ↗️↘️ playlist:")
 
         # no Koichis were harmed in the making of this shtity playlist, offended? possibly, but not harmed.
-        pl_1 = (results_df
-                .filter(pl.col(Track.beats_per_minute).gt(bpm_med) & pl.col(Track.beats_per_minute).le(bpm_high))
-                .sort(Track.beats_per_minute, descending=True)
-                .with_row_index('order', offset=1)
-                # This gives them the order when combined with the other tracks
-                .with_columns((pl.col('order') * 4) - 3,
-                              level=pl.lit('high'))
-                .head(100)
-                # this shuffles that order so the songs aren't strictly high - low bpm
-                # .with_columns(pl.col('order').shuffle())
-                )
-
-        pl_2 = (results_df
-                .filter(pl.col(Track.beats_per_minute).gt(bpm_low) & pl.col(Track.beats_per_minute).le(bpm_med))
-                .sort(Track.beats_per_minute, descending=True)
-                .with_row_index('order', offset=1)
-                .with_columns(pl.col('order') * 2,
-                              level=pl.lit('medium'))
-                .head(200)
-                # .with_columns(pl.col('order').shuffle())
-                )
-
-        pl_3 = (results_df
-                .filter(pl.col(Track.beats_per_minute).le(bpm_low) & pl.col(Track.beats_per_minute).gt(0))
-                .sort(Track.beats_per_minute, descending=True)
-                .with_row_index('order', offset=1)
-                .with_columns((pl.col('order') * 4) - 1,
-                              level=pl.lit('low'))
-                .head(100)
-                # .with_columns(pl.col('order').shuffle())
-                )
-
-        st.dataframe((pl.concat([pl_1, pl_2, pl_3])
-                      .select('index', 'level', Track.beats_per_minute,
-                              pl.all().exclude('index', Track.beats_per_minute, 'level'))
-                      .sort('order')
-                      .drop('order')
+        koichi_set_key = (song_search_key, bpm_low, bpm_med, bpm_high, set_length)
+        if st.session_state.get("koichi_set", (None,))[0] != koichi_set_key:
+            koichi_set = SetBuilder(search_engine.data.transition_graph)\
+                .build(results_df, bpm_wave(bpm_low, bpm_med, bpm_high), length=set_length)
+            st.session_state["koichi_set"] = (koichi_set_key, koichi_set)
+        _, koichi_set = st.session_state["koichi_set"]
+
+        st.dataframe((koichi_set
+                      .select(SET_POSITION, TARGET_BPM, Track.beats_per_minute, TrackAdjacent.times_played_together,
+                              pl.all().exclude(SET_POSITION, TARGET_BPM, Track.beats_per_minute,
+                                               TrackAdjacent.times_played_together, Track.id))
                       ),
                      column_config={Track.url: st.column_config.LinkColumn()})
 
-        # # 1 2 3 2 1 2 3 2 1
-
-        # attempt at better playlist generation
-        # # Tag levels based on BPM
-        # results_df2 = (results_df
-        #                .with_columns(level = pl.when(pl.col(Track.beats_per_minute) > bpm_med)
-        #                                         .then(pl.lit("high"))
-        #                                         .when(pl.col(Track.beats_per_minute) > bpm_low)
-        #                                         .then(pl.lit("medium"))
-        #                                         .otherwise(pl.lit("low"))
-        #                                )
-        #                 )
-        # # Get pools by level
-        # high_df = results_df2.filter(pl.col("level") == "high")
-        # medium_df = results_df2.filter(pl.col("level") == "medium")
-        # low_df = results_df2.filter(pl.col("level") == "low")
-
-        # # Build playlist
-        # playlist_parts = []
-
-        # for i in range(0,50):
-        #         try:
-        #                 # Step 1: High song (start)
-        #                 h1 = high_df.sample(n=1, seed=42)
-        #                 playlist_parts.append(h1)
-        #                 prev_bpm = h1[Track.beats_per_minute][i]
-
-        #                 # Step 2: Medium song
-        #                 m1 = sample_with_bpm_range(medium_df, prev_bpm)
-        #                 playlist_parts.append(m1)
-        #                 prev_bpm = m1[Track.beats_per_minute][i]
-
-        #                 # Step 3: Low song
-        #                 l1 = sample_with_bpm_range(low_df, prev_bpm)
-        #                 playlist_parts.append(l1)
-        #                 prev_bpm = l1[Track.beats_per_minute][i]
-
-        #                 # Step 4: Medium song
-        #                 m2 = sample_with_bpm_range(medium_df, prev_bpm)
-        #                 playlist_parts.append(m2)
-        #                 prev_bpm = m2[Track.beats_per_minute][i]
-        #         except:
-        #                 pass
-
-        # # Combine and add index
-        # playlist_df = pl.concat(playlist_parts).with_row_index(name="order", offset=1)
-
-        # # Display
-        # st.dataframe((playlist_df
-        #               .select('index', 'level', Track.beats_per_minute,
-        #                       pl.all().exclude('index', Track.beats_per_minute, 'level'))
-        #               .drop('order')
-        #               ),
-        # column_config={Track.url: st.column_config.LinkColumn("Song")}
-        # )
-        st.session_state["processing"] = False
-
     st.markdown(f"#### ")
 
 
@@ -572,12 +627,41 @@ if playlist_locator_toggle:
 
     # if any(val for val in [playlist_input, song_input, dj_input]):
     if st.button("Search playlists", type="primary", disabled=st.session_state["processing"]):
-        st.session_state["processing"] = True
-        log_query("Search playlists", {'song_input': song_input,
-                                       'dj_input': dj_input,
-                                       'playlist_input': playlist_input,
-                                       'anti_playlist_input': anti_playlist_input2,
-                                       })
+        # Logged together with the first page of results
+        st.session_state["playlist_search_log"] = ("Search playlists", {
+            'song_input': song_input,
+            'dj_input': dj_input,
+            'playlist_input': playlist_input,
+            'anti_playlist_input': anti_playlist_input2,
+        })
+
+        # TODO: Expose additional query parameters in the UI
+        st.session_state["playlist_search_query"] = dict(
+            song_name=song_input,
+            artist_name=artist_input,
+            # country=...,
+            dj_name=dj_input,
+            playlist_include=playlist_input,
+            playlist_exclude=anti_playlist_input2,
+            tracks_in_result=True,
+            tracks_limit=30,
+            sort_by=[
+                Playlist.matched_terms_count,
+                Playlist.matching_song_count,
+                Stats.song_count,
+                Stats.artist_count,
+            ],
+            descending=True,
+        )
+        st.session_state["playlist_search_cursor"] = None
+        # Searching again always fetches the page again (and logs the search)
+        st.session_state.pop("playlist_search_results", None)
+        st.session_state.pop("owner_date_formats", None)
+
+    if "playlist_search_query" in st.session_state:
+        playlist_search_query = st.session_state["playlist_search_query"]
+        # As for the song search, only run the queries again when the query (or the cursor) changes
+        playlist_search_query_key = get_query_key("playlists", playlist_search_query)
 
         # 420 owners have enough playlists to uniquely identify their date style
         # 593 owners have playlists with dates
@@ -595,52 +679,56 @@ if playlist_locator_toggle:
         # statistical analysis, to see which field has the smaller distribution
         # of numbers - that is likely to be the year field.
 
-        unambiguous = search_engine.find_date_formats_by_dj(only_unique_date_formats=True).collect()
+        if st.session_state.get("owner_date_formats", (None,))[0] != playlist_search_query_key:
+            st.session_state["processing"] = True
 
-        owner_date_formats_df = search_engine.find_date_formats_by_dj(
-            # country=...,
-            dj_name=dj_input,
-            dj_exclude_by_ids=unambiguous,
-            playlist_include=playlist_input,
-            playlist_exclude=anti_playlist_input2,
-            sort_by=Stats.date_format_counts,
-            descending=True,
-            limit=None,
-        )
+            unambiguous = search_engine.find_date_formats_by_dj(only_unique_date_formats=True)
+
+            owner_date_formats_df = run_query(lambda: search_engine.find_date_formats_by_dj(
+                # country=...,
+                dj_name=playlist_search_query['dj_name'],
+                dj_exclude_by_ids=unambiguous,
+                playlist_include=playlist_search_query['playlist_include'],
+                playlist_exclude=playlist_search_query['playlist_exclude'],
+                sort_by=Stats.date_format_counts,
+                descending=True,
+                limit=None,
+            ))
+
+            st.session_state["owner_date_formats"] = (playlist_search_query_key, owner_date_formats_df)
+            st.session_state["processing"] = False
 
-        print(owner_date_formats_df)
+        _, owner_date_formats_df = st.session_state["owner_date_formats"]
 
-        st.dataframe(owner_date_formats_df.collect(engine='streaming'),
+        st.dataframe(owner_date_formats_df,
                      column_config={Playlist.url: st.column_config.LinkColumn()})
 
-        # TODO: Expose additional query parameters in the UI
-        playlist_search_df = search_engine.find_playlists(
-            song_name=song_input,
-            artist_name=artist_input,
-            # country=...,
-            dj_name=dj_input,
-            playlist_include=playlist_input,
-            playlist_exclude=anti_playlist_input2,
-            tracks_in_result=True,
-            tracks_limit=30,
-            sort_by=[
-                Playlist.matched_terms_count,
-                Playlist.matching_song_count,
-                Stats.song_count,
-                Stats.artist_count,
-            ],
-            descending=True,
-            limit=500,
-        )
+        playlist_search_key = (playlist_search_query_key, st.session_state["playlist_search_cursor"])
+        if st.session_state.get("playlist_search_results", (None,))[0] != playlist_search_key:
+            st.session_state["processing"] = True
+
+            playlist_search_page = run_query(lambda: search_engine.find_playlists_page(
+                cursor=st.session_state["playlist_search_cursor"],
+                page_size=500,
+                **playlist_search_query,
+            ), log_as=st.session_state.pop("playlist_search_log", None))
+
+            playlist_results_df = run_query(lambda: playlist_search_page.results
+                                            .select(Playlist.name, Playlist.date_types, Playlist.url,
+                                                    PlaylistOwner.name, Playlist.matching_song_count,
+                                                    Stats.song_count, Stats.artist_count, Track.name))
 
-        st.dataframe(playlist_search_df
-                     .select(Playlist.name, Playlist.date_types, Playlist.url, PlaylistOwner.name,
-                             Playlist.matching_song_count, Stats.song_count,
-                             Stats.artist_count, Track.name)
-                     .collect(engine='streaming'),
+            st.session_state["playlist_search_results"] = (playlist_search_key, playlist_search_page,
+                                                           playlist_results_df)
+            st.session_state["processing"] = False
+
+        _, playlist_search_page, playlist_results_df = st.session_state["playlist_search_results"]
+
+        st.dataframe(playlist_results_df,
                      column_config={Playlist.url: st.column_config.LinkColumn()})
 
-        st.session_state["processing"] = False
+        page_navigation(playlist_search_page, "playlist_search_cursor", len(playlist_results_df))
+        show_query_profile("find_playlists", playlist_search_query)
     st.markdown(f"#### ")
 
 
@@ -826,16 +914,15 @@ if search_dj_toggle:
     # else:
     if st.button("Search djs", type="primary", disabled=st.session_state["processing"]):
         st.session_state["processing"] = True
-        log_query("Search djs", {'dj_input': dj_input,
-                                 'dj_playlist_input': dj_playlist_input,
-                                 })
 
-        dj_search_df = search_engine.find_djs(
+        dj_search_df = run_query(lambda: search_engine.find_djs(
             dj_name=dj_input,
             playlist_name=dj_playlist_input,
             dj_limit=100,
             playlist_limit=30,
-        ).collect(engine='streaming')
+        ), log_as=("Search djs", {'dj_input': dj_input,
+                                  'dj_playlist_input': dj_playlist_input,
+                                  }))
 
         st.dataframe(dj_search_df,
                      column_config={PlaylistOwner.url: st.column_config.LinkColumn()})
@@ -901,22 +988,32 @@ if search_dj_toggle:
 
     if st.button("Compare DJs/users", type="primary", disabled=st.session_state["processing"]):
         st.session_state["processing"] = True
-        log_query("Search djs", {'dj_compare_1': dj_compare_1,
-                                 'dj_compare_2': dj_compare_2,
-                                 })
-
-        st.dataframe(search_engine.find_songs(dj_name=f'{dj_compare_1},{dj_compare_2}')
-                     .group_by(PlaylistOwner.name)
-                     # .with_columns(pl.concat_list(Track.name, Track.artist_names).alias('track.full_name'))
-                     .agg(pl.n_unique(Track.id).alias(Stats.song_count),
-                          pl.n_unique(Playlist.name).alias(Stats.playlist_count))
-                     .sort(PlaylistOwner.name)
-                     .collect(engine='streaming'))
-
-        dj_1_df = search_engine.find_songs(dj_name=dj_compare_1).select(
-            Track.name, Track.url, Stats.dj_count, Stats.playlist_count)
-        dj_2_df = search_engine.find_songs(dj_name=dj_compare_2).select(
-            Track.name, Track.url, Stats.dj_count, Stats.playlist_count)
+        def songs_of_dj(dj_name):
+            # Same matching logic as the dj_name filter of find_songs
+            match_dj_name = or_filter(
+                create_text_filter(dj_name, PlaylistOwner.name, is_list_column=True),
+                create_text_filter(dj_name, PlaylistOwner.id, is_list_column=True))
+            # Like find_songs, an empty DJ name does not filter anything
+            return lambda songs: (songs.filter(match_dj_name) if match_dj_name is not None else songs).select(
+                Track.name, Track.url, Stats.dj_count, Stats.playlist_count)
+
+        # Evaluate the songs of both DJs as a single query, and split the result afterwards
+        dj_songs_query = dict(dj_name=f'{dj_compare_1},{dj_compare_2}', playlist_limit=None)
+        dj_stats_df, dj_1_df, dj_2_df = run_query(lambda: search_engine.batch([
+            QuerySpec('find_songs', dj_songs_query,
+                      then=lambda songs: songs
+                      .group_by(PlaylistOwner.name)
+                      # .with_columns(pl.concat_list(Track.name, Track.artist_names).alias('track.full_name'))
+                      .agg(pl.n_unique(Track.id).alias(Stats.song_count),
+                           pl.n_unique(Playlist.name).alias(Stats.playlist_count))
+                      .sort(PlaylistOwner.name)),
+            QuerySpec('find_songs', dj_songs_query, then=songs_of_dj(dj_compare_1)),
+            QuerySpec('find_songs', dj_songs_query, then=songs_of_dj(dj_compare_2)),
+        ]), log_as=("Search djs", {'dj_compare_1': dj_compare_1,
+                                    'dj_compare_2': dj_compare_2,
+                                    }))
+
+        st.dataframe(dj_stats_df)
 
         st.markdown(f"Music _{dj_compare_1}_ has, but _{dj_compare_2}_ doesn't.")
         st.dataframe(dj_1_df
@@ -926,6 +1023,19 @@ if search_dj_toggle:
                      .head(500),
                      column_config={Track.url: st.column_config.LinkColumn()})
         st.session_state["processing"] = False
+
+    if st.button("Find DJs/users with similar music to DJ/user 1",
+                 disabled=st.session_state["processing"] or not dj_compare_1):
+        st.session_state["processing"] = True
+        # Only the similar DJs are shown, and returned lazily, so they are collected like any other query
+        similar_djs_df = run_query(lambda: search_engine.build_query(
+            QuerySpec('find_similar_djs', dict(dj_name=dj_compare_1), output=1)),
+            log_as=("Search similar djs", {'dj_compare_1': dj_compare_1}))
+
+        st.text("Estimated from a sample of the songs of each DJ/user, so the numbers are approximate.")
+        st.dataframe(similar_djs_df,
+                     column_config={PlaylistOwner.url: st.column_config.LinkColumn()})
+        st.session_state["processing"] = False
     st.markdown(f"#### ")
 
 
@@ -981,32 +1091,33 @@ if geo_region_toggle:
 
     if st.button("Compare countries", type="primary", disabled=st.session_state["processing"]):
         st.session_state["processing"] = True
-        log_query("Comparing Countries' music", {
-                  'countries_selectbox': countries_selectbox})
+        def compare_countries(songs):
+            countries_df = songs.filter(
+                pl.col(Stats.dj_count).gt(3),
+                pl.col(Stats.playlist_count).gt(3)
+            )
 
-        countries_df = search_engine.find_songs(country=countries_selectbox).filter(
-            pl.col(Stats.dj_count).gt(3),
-            pl.col(Stats.playlist_count).gt(3)
-        )
+            country_1_df = (countries_df
+                            .filter(pl.col(Track.country).list.contains(countries_selectbox[0]))
+                            .select(pl.col(Track.country).alias('country'), Track.id,
+                                    Track.name, Track.url, Stats.dj_count, Stats.playlist_count))
 
-        country_1_df = (countries_df
-                        .filter(pl.col(Track.country).list.contains(countries_selectbox[0]))
-                        .select(pl.col(Track.country).alias('country'), Track.id,
-                                Track.name, Track.url, Stats.dj_count, Stats.playlist_count))
+            country_2_df = (countries_df
+                            .filter(pl.col(Track.country).list.contains(countries_selectbox[1]))
+                            .select(pl.col(Track.country).alias('country'), Track.id,
+                                    Track.name, Track.url, Stats.dj_count, Stats.playlist_count))
 
-        country_2_df = (countries_df
-                        .filter(pl.col(Track.country).list.contains(countries_selectbox[1]))
-                        .select(pl.col(Track.country).alias('country'), Track.id,
-                                Track.name, Track.url, Stats.dj_count, Stats.playlist_count))
+            return (country_1_df.join(country_2_df, how='anti', on=Track.id)
+                    .unique()
+                    .drop(Track.id)
+                    .sort(Stats.dj_count, descending=True)
+                    .head(300))
 
         st.text(f"{countries_selectbox[0]} music not in {countries_selectbox[1]}")
-        compare_df = (country_1_df.join(country_2_df, how='anti', on=Track.id)
-                      .unique()
-                      .drop(Track.id)
-                      .sort(Stats.dj_count, descending=True)
-                      .head(300))
-        print(compare_df.explain(engine='streaming', format='plain'))
-        st.dataframe(compare_df.collect(engine='streaming'),
+        compare_df, = run_query(lambda: search_engine.batch([
+            QuerySpec('find_songs', dict(country=countries_selectbox), then=compare_countries),
+        ]), log_as=("Comparing Countries' music", {'countries_selectbox': countries_selectbox}))
+        st.dataframe(compare_df,
                      column_config={Track.url: st.column_config.LinkColumn()})
         st.session_state["processing"] = False
         st.markdown(f"#### ")
@@ -1041,31 +1152,36 @@ if songs_together_toggle:
     if st.button("Search songs played together", type="primary", disabled=st.session_state["processing"]):
         st.session_state["processing"] = True
 
+        related_songs_query = dict(song_name=song_input, artist_name=artist_name_input)
+        related_songs_columns = [Track.name, Track.artists, TrackAdjacent.times_played_together,
+                                 Track.url, Track.beats_per_minute, Track.release_date]
+
+        matching_songs_df, next_songs_df, prev_songs_df, any_songs_df = run_query(lambda: search_engine.batch([
+            QuerySpec('find_songs', related_songs_query | dict(limit=100),
+                      then=lambda songs: songs.select(Track.name, Track.artists, Track.url,
+                                                      Track.beats_per_minute, Track.release_date)),
+            *(QuerySpec('find_related_songs', related_songs_query | dict(direction=direction), output=1,
+                        then=lambda songs: songs.select(related_songs_columns))
+              for direction in ['next', 'prev', 'any']),
+        ]))
+
         st.markdown("#### Songs"
                     + (f" matching _{song_input}_" if song_input else "")
                     + (f" by _{artist_name_input}_" if artist_name_input else "")
                     + ":")
-        st.dataframe(search_engine.find_songs(song_name=song_input, artist_name=artist_name_input, limit=100)
-                     .select(Track.name, Track.artists, Track.url,
-                             Track.beats_per_minute, Track.release_date),
+        st.dataframe(matching_songs_df,
                      column_config={Track.url: st.column_config.LinkColumn()})
 
         st.markdown(f"#### Most common songs to play after _{song_input}_:")
-        st.dataframe(search_engine.find_related_songs('next', song_name=song_input, artist_name=artist_name_input)[1]
-                     .select(Track.name, Track.artists, TrackAdjacent.times_played_together,
-                             Track.url, Track.beats_per_minute, Track.release_date),
+        st.dataframe(next_songs_df,
                      column_config={Track.url: st.column_config.LinkColumn()})
 
         st.markdown(f"#### Most common songs to play before _{song_input}_:")
-        st.dataframe(search_engine.find_related_songs('prev', song_name=song_input, artist_name=artist_name_input)[1]
-                     .select(Track.name, Track.artists, TrackAdjacent.times_played_together,
-                             Track.url, Track.beats_per_minute, Track.release_date),
+        st.dataframe(prev_songs_df,
                      column_config={Track.url: st.column_config.LinkColumn()})
 
         st.markdown(f"#### Most common songs to play before _or_ after _{song_input}_:")
-        st.dataframe(search_engine.find_related_songs('any', song_name=song_input, artist_name=artist_name_input)[1]
-                     .select(Track.name, Track.artists, TrackAdjacent.times_played_together,
-                             Track.url, Track.beats_per_minute, Track.release_date),
+        st.dataframe(any_songs_df,
                      column_config={Track.url: st.column_config.LinkColumn()})
 
         st.session_state["processing"] = False
@@ -1165,6 +1281,36 @@ if song_popularity_toggle:
                              min_value=0, format='percent',
                              max_value=popularity_max[RELATIVE_POPULARITY].first())})
 
+    st.markdown("#### Trending songs in social sets")
+    trend_col1, trend_col2 = st.columns(2)
+    with trend_col1:
+        trend_window_input = st.number_input("Compare the last __ months:",
+                                             value=3, min_value=1, max_value=24, step=1)
+        declining_input = st.checkbox("Show declining songs instead")
+    with trend_col2:
+        trend_baseline_input = st.number_input("...to the __ months before that:",
+                                               value=12, min_value=1, max_value=60, step=1)
+
+    if st.button("Show trending songs", disabled=st.session_state["processing"]):
+        st.session_state["processing"] = True
+
+        trending_df = run_query(lambda: search_engine.find_trending_songs(
+            window=trend_window_input,
+            baseline=trend_baseline_input,
+            declining=declining_input,
+            limit=100,
+        ).select(Track.name, Track.artist_names, WINDOW_PLAY_COUNT, BASELINE_PLAY_COUNT,
+                 EXPECTED_PLAY_COUNT, TREND_SCORE, Track.url),
+            log_as=("Trending songs", {'trend_window_input': trend_window_input,
+                                       'trend_baseline_input': trend_baseline_input,
+                                       'declining_input': declining_input,
+                                       }))
+
+        st.dataframe(trending_df,
+                     column_config={Track.url: st.column_config.LinkColumn()})
+
+        st.session_state["processing"] = False
+
 lyrics_toggle = st.toggle("Search lyrics 📋")
 if lyrics_toggle:
 
@@ -1178,7 +1324,24 @@ if lyrics_toggle:
         artist_input = st.text_input("Artist:")
         anti_lyrics_input = st.text_input("Not in lyrics:")
 
-    if st.button("Search lyrics", type="primary", disabled=st.session_state["processing"]):
+    ranked_lyrics_input = st.checkbox('Rank by relevance (only uses "In lyrics", which may contain "quoted phrases")',
+                                      disabled=search_engine.data.lyrics_index is None)
+
+    search_lyrics_button = st.button("Search lyrics", type="primary", disabled=st.session_state["processing"])
+
+    if search_lyrics_button and ranked_lyrics_input:
+        st.session_state["processing"] = True
+
+        st.dataframe(
+            run_query(lambda: search_engine.find_songs_by_lyrics(lyrics_input, limit=100)
+                      .select(Track.name, Track.artist_names, LYRICS_SNIPPET, LYRICS_SCORE,
+                              Stats.playlist_count, Stats.dj_count, Track.url),
+                      log_as=("Search ranked lyrics", {'lyrics_input': lyrics_input})),
+            column_config={Track.url: st.column_config.LinkColumn()})
+
+        st.session_state["processing"] = False
+
+    elif search_lyrics_button:
         st.session_state["processing"] = True
 
         st.dataframe(